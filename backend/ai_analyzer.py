@@ -1,23 +1,61 @@
 import os
+import logging
 import json
-from openai import OpenAI
-from typing import Dict
+import importlib.util
+from openai import AsyncOpenAI
+from typing import Dict, List, Optional, Set, Tuple
+import time
 import asyncio
+import hashlib
 import httpx
 
 from models import AIAnalysis
+from analysis_cache import normalize_text
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from keyword_matcher import KeywordMatcher
+from log_config import SAMPLED
+from metrics import ANALYSIS_FALLBACKS, LOCAL_MODEL_DECISIONS, OPENAI_ERRORS, OPENAI_HEDGES, in_flight, record_openai_usage, stage
+
+logger = logging.getLogger(__name__)
 
 class AIAnalyzer:
     """Clase para analizar mensajes usando OpenAI"""
     
-    def __init__(self):
+    def __init__(self, cache=None, local_model=None, rate_limiter=None):
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
-            print("OPENAI_API_KEY no esta configurada. Usando analisis basico")
-            self.client = None
-        else:
-            # Configurar cliente OpenAI
-            self.client = OpenAI(api_key=self.api_key)
+            logger.warning("OPENAI_API_KEY no esta configurada. Usando analisis basico")
+
+        # El cliente se crea en start() (lifespan) y se reutiliza entre llamadas
+        self.client = None
+        self.http_client = None
+
+        self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+        # Caché de análisis (AnalysisCache); opcional
+        self.cache = cache
+
+        # Clasificador local (LocalClassifier); los mensajes con baja confianza
+        # se escalan a OpenAI
+        self.local_model = local_model
+
+        # Límite de OpenAI compartido entre procesos (SharedRateLimiter); opcional
+        self.rate_limiter = rate_limiter
+
+        # Matcher de palabras clave para el fallback, compilado una sola vez
+        self.keyword_matcher = KeywordMatcher.from_file(os.getenv("LEXICON_PATH") or None)
+
+        # Máximo de peticiones simultáneas a OpenAI
+        self.max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Degradación ante una OpenAI lenta o caída: el circuito abierto manda
+        # directo al clasificador local o al fallback. Cada llamada tiene un
+        # plazo total (muy por debajo del timeout HTTP) y, si se configura,
+        # se duplica cuando la primera tarda más de OPENAI_HEDGE_AFTER_SECONDS
+        self.breaker = CircuitBreaker("openai")
+        self.call_timeout = float(os.getenv("OPENAI_CALL_TIMEOUT_SECONDS", "10"))
+        self.hedge_after = float(os.getenv("OPENAI_HEDGE_AFTER_SECONDS", "0"))
         
         # Prompt
         self.system_prompt = """
@@ -48,108 +86,447 @@ Criterios para TEMA:
 Responde SOLO con el JSON, sin explicaciones adicionales.
 """
 
+        # Prompt para lotes: mismos criterios, varios mensajes por llamada
+        self.batch_system_prompt = self.system_prompt.replace(
+            "Analiza el siguiente mensaje de un cliente y devuelve ÚNICAMENTE un objeto JSON válido con esta estructura exacta:",
+            "Recibirás un arreglo JSON de mensajes de clientes, cada uno con su \"indice\". Analiza cada mensaje por separado y devuelve ÚNICAMENTE un arreglo JSON con un objeto por mensaje, incluyendo su \"indice\", con esta estructura exacta:"
+        ).replace(
+            "{\n    \"sentimiento\"",
+            "{\n    \"indice\": 0,\n    \"sentimiento\""
+        )
+
+        # Versión del análisis: cambia si cambian los prompts o el modelo,
+        # lo que invalida automáticamente las entradas de caché anteriores
+        self.version = hashlib.sha256(
+            f"{self.model}|{self.system_prompt}|{self.batch_system_prompt}".encode("utf-8")
+        ).hexdigest()[:16]
+
+    async def start(self):
+        """Crear el cliente async de OpenAI con un pool de conexiones compartido"""
+        if self.local_model is not None:
+            self.local_model.start()
+
+        if not self.api_key or self.client is not None:
+            return
+
+        # HTTP/2 solo si el paquete h2 está instalado
+        http2 = importlib.util.find_spec("h2") is not None
+        self.http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "30"))
+            ),
+            timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30")), connect=5.0)
+        )
+        # OPENAI_BASE_URL permite apuntar a un proxy o al servidor falso de benchmarks
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=self.http_client
+        )
+        logger.info(f"Cliente OpenAI iniciado (http2={http2}, max_concurrency={self.max_concurrency})")
+
+    async def close(self):
+        """Cerrar el pool de conexiones de OpenAI"""
+        if self.local_model is not None:
+            self.local_model.close()
+
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+            self.http_client = None
+            logger.info("Cliente OpenAI cerrado")
+
+    async def _run_completion(self, system_prompt: str, user_content: str, max_tokens: int) -> str:
+        """
+        Llamada a OpenAI a través del circuit breaker; cada petición tiene un
+        plazo de OPENAI_CALL_TIMEOUT_SECONDS. Lanza CircuitOpenError si el
+        circuito no deja pasar la llamada
+        """
+        # Con el circuito abierto se resuelve al instante, sin esperar cupo
+        if not self.breaker.check():
+            raise CircuitOpenError("Circuito de OpenAI abierto")
+
+        # Estimación de tokens: ~4 caracteres por token más la respuesta máxima.
+        # El cupo se reserva antes del permiso: si la espera falla o se cancela
+        # no queda ningún permiso del circuito sin devolver
+        tokens = (len(system_prompt) + len(user_content)) // 4 + max_tokens
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(tokens=tokens)
+
+        permit = self.breaker.acquire()
+        if permit is None:
+            raise CircuitOpenError("Circuito de OpenAI abierto")
+
+        outcome = None
+        try:
+            content, duration = await self._hedged_completion(system_prompt, user_content, max_tokens, tokens)
+            outcome = (True, duration)
+            return content
+        except Exception:
+            outcome = (False, 0.0)
+            raise
+        finally:
+            # Una cancelación no dice nada de OpenAI: solo se devuelve el permiso
+            if outcome is None:
+                self.breaker.release(permit)
+            else:
+                self.breaker.record(permit, *outcome)
+
+    async def _hedged_completion(self, system_prompt: str, user_content: str, max_tokens: int, tokens: int) -> Tuple[str, float]:
+        """
+        Si la primera petición no respondió tras OPENAI_HEDGE_AFTER_SECONDS se
+        lanza una segunda idéntica (si hay cupo) y gana la primera que termine
+        """
+        first = asyncio.create_task(self._completion(system_prompt, user_content, max_tokens))
+        if self.hedge_after <= 0:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and (self.rate_limiter is None or await self.rate_limiter.try_acquire(tokens)):
+                OPENAI_HEDGES.inc()
+                tasks.add(asyncio.create_task(self._completion(system_prompt, user_content, max_tokens)))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _completion(self, system_prompt: str, user_content: str, max_tokens: int) -> Tuple[str, float]:
+        """
+        Una petición a OpenAI limitada por el semáforo de concurrencia.
+        Devuelve el contenido y la duración de la petición: el plazo y la
+        latencia que ve el circuito no incluyen la espera del semáforo
+        """
+        async with self.semaphore:
+            with in_flight("openai"), stage("openai_call"):
+                started = time.monotonic()
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=self.model,
+                            messages=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": user_content}
+                            ],
+                            max_tokens=max_tokens,
+                            temperature=0.1
+                        ),
+                        timeout=self.call_timeout
+                    )
+                except asyncio.TimeoutError:
+                    OPENAI_ERRORS.labels("timeout").inc()
+                    raise TimeoutError(f"OpenAI no respondió en {self.call_timeout:g}s")
+                except Exception as e:
+                    OPENAI_ERRORS.labels(type(e).__name__).inc()
+                    raise
+                duration = time.monotonic() - started
+        record_openai_usage(response.usage)
+        return response.choices[0].message.content.strip(), duration
+
+    @staticmethod
+    def _is_valid_analysis(analysis) -> bool:
+        """Validar que el análisis tenga los campos requeridos"""
+        required_fields = ["sentimiento", "tema", "resumen"]
+        return isinstance(analysis, dict) and all(field in analysis for field in required_fields)
+
+    @staticmethod
+    def _strip_code_fences(ai_response: str) -> str:
+        """Quitar bloques ```json ... ``` que el modelo a veces agrega"""
+        text = ai_response.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+            if text.rstrip().endswith("```"):
+                text = text.rstrip()[:-3]
+        return text.strip()
+
+    async def analyze_batch(self, messages: List[str]) -> List[Dict]:
+        """
+        Analizar varios mensajes en una sola llamada a OpenAI. Los mensajes que
+        falten o vengan mal formados en la respuesta se analizan uno por uno.
+        """
+        if not messages:
+            return []
+
+        results: List[Optional[Dict]] = [None] * len(messages)
+        if self.cache is not None:
+            with stage("cache_lookup"):
+                cached = await asyncio.gather(*(self.cache.get(message, self.version) for message in messages))
+            results = [{**result, "analysis_source": "cache"} if result is not None else None for result in cached]
+
+        # Agrupar textos equivalentes para analizarlos una sola vez
+        pending: Dict[str, List[int]] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                pending.setdefault(normalize_text(messages[i]), []).append(i)
+
+        if not pending:
+            return [self._with_version(result) for result in results]
+
+        texts = [messages[indexes[0]] for indexes in pending.values()]
+        analyses: List[Optional[Dict]] = [None] * len(texts)
+
+        # Nivel local: se aceptan las predicciones con confianza suficiente
+        # (todas si OpenAI no está configurada o su circuito está abierto)
+        if self.local_model is not None and self.local_model.available:
+            try:
+                with stage("local_model"):
+                    predictions = await self.local_model.classify_many(texts)
+                accept_all = not self.client or self.breaker.state == OPEN
+                for j, prediction in enumerate(predictions):
+                    if accept_all or self.local_model.is_confident(prediction):
+                        analyses[j] = self._local_analysis(texts[j], prediction)
+                        self.local_model.accepted += 1
+                        LOCAL_MODEL_DECISIONS.labels("accepted").inc()
+                    else:
+                        self.local_model.escalated += 1
+                        LOCAL_MODEL_DECISIONS.labels("escalated").inc()
+            except Exception as e:
+                logger.warning(f"Error en el clasificador local: {e}")
+
+        remaining = [j for j, analysis in enumerate(analyses) if analysis is None]
+        if remaining:
+            remaining_texts = [texts[j] for j in remaining]
+            if not self.client:
+                resolved = self._basic_analysis_many(remaining_texts)
+            elif len(remaining_texts) == 1:
+                resolved = [await self._analyze_uncached(remaining_texts[0])]
+            else:
+                resolved = await self._analyze_batch_uncached(remaining_texts)
+            for j, analysis in zip(remaining, resolved):
+                analyses[j] = analysis
+
+        for indexes, analysis in zip(pending.values(), analyses):
+            for i in indexes:
+                results[i] = dict(analysis)
+
+        return [self._with_version(result) for result in results]
+
+    def _with_version(self, analysis: Dict) -> Dict:
+        """
+        Marcar los análisis de OpenAI (o de su caché) con la versión actual del
+        prompt/modelo; los locales y los básicos quedan sin versión para que
+        una reanálisis por versión los incluya
+        """
+        if analysis.get("analysis_source") in ("local", "fallback"):
+            return analysis
+        return {**analysis, "version_analisis": self.version}
+
+    async def _analyze_batch_uncached(self, messages: List[str]) -> List[Dict]:
+        """Una llamada a OpenAI para todo el lote, con fallback por mensaje"""
+        results: List[Optional[Dict]] = [None] * len(messages)
+
+        try:
+            logger.debug(f"Analizando lote de {len(messages)} mensajes con OpenAI", extra=SAMPLED)
+            payload = json.dumps(
+                [{"indice": i, "mensaje": message} for i, message in enumerate(messages)],
+                ensure_ascii=False
+            )
+            ai_response = await self._run_completion(
+                self.batch_system_prompt, payload, max_tokens=120 * len(messages) + 50
+            )
+
+            with stage("json_parse"):
+                parsed = json.loads(self._strip_code_fences(ai_response))
+            if isinstance(parsed, dict):
+                parsed = parsed.get("resultados", [])
+
+            for item in parsed if isinstance(parsed, list) else []:
+                if not self._is_valid_analysis(item):
+                    continue
+                index = item.get("indice")
+                if isinstance(index, int) and 0 <= index < len(messages) and results[index] is None:
+                    analysis = {field: item[field] for field in ["sentimiento", "tema", "resumen"]}
+                    await self._cache_result(messages[index], analysis)
+                    results[index] = {**analysis, "analysis_source": "openai"}
+
+        except CircuitOpenError as e:
+            # Sin reintentos individuales: todo el lote va al fallback
+            logger.debug(f"Circuito de OpenAI abierto: fallback para {len(messages)} mensajes", extra=SAMPLED)
+            return [self._failed_analysis(message, e) for message in messages]
+        except json.JSONDecodeError as e:
+            OPENAI_ERRORS.labels("invalid_json").inc()
+            logger.warning(f"Error parseando JSON del lote: {e}")
+        except Exception as e:
+            logger.warning(f"Error en el análisis de IA por lote: {e}")
+
+        # Fallback por mensaje solo para los que faltan
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            logger.warning(f"Lote incompleto: reanalizando {len(missing)} de {len(messages)} mensajes individualmente")
+            retried = await asyncio.gather(*(self._analyze_uncached(messages[i]) for i in missing))
+            for i, analysis in zip(missing, retried):
+                results[i] = analysis
+
+        return results
+
+    async def _cache_result(self, message_text: str, analysis: Dict):
+        if self.cache is not None:
+            await self.cache.set(message_text, self.version, analysis)
+
     async def analyze_message(self, message_text: str) -> Dict:
         """
         Analizar un mensaje usando OpenAI y devolver el análisis estructurado
         """
+        return (await self.analyze_batch([message_text]))[0]
+
+    @staticmethod
+    def _local_analysis(message_text: str, prediction: Dict) -> Dict:
+        """Análisis a partir de una predicción del clasificador local"""
+        summary = message_text[:97] + "..." if len(message_text) > 100 else message_text
+        return {
+            "sentimiento": prediction["sentimiento"],
+            "tema": prediction["tema"],
+            "resumen": summary,
+            "confianza": round(prediction["confianza"], 4),
+            "analysis_source": "local"
+        }
+
+    async def _analyze_uncached(self, message_text: str) -> Dict:
+        """Análisis con OpenAI sin consultar la caché; solo se cachean respuestas de IA"""
         try:
             if not self.client:
                 # Fallback: análisis básico sin IA
-                print("Usando analisis basico (OpenAI no configurada)")
+                logger.debug("Usando analisis basico (OpenAI no configurada)", extra=SAMPLED)
                 return self._basic_analysis(message_text)
             
             # Usar API de OpenAI
-            print(f"Analizando con OpenAI: {message_text[:50]}...")
+            logger.debug(f"Analizando con OpenAI: {message_text[:50]}...", extra=SAMPLED)
 
-            # Ejecutar en un hilo separado para evitar bloquear el loop async
-            import concurrent.futures
-            
-            def sync_openai_call():
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": message_text}
-                    ],
-                    max_tokens=200,
-                    temperature=0.1 
-                )
-                return response.choices[0].message.content.strip()
-            
-            # Ejecutar la llamada síncrona en un executor
-            loop = asyncio.get_event_loop()
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                ai_response = await loop.run_in_executor(executor, sync_openai_call)
+            ai_response = await self._run_completion(self.system_prompt, message_text, max_tokens=200)
             
-            print(f"🤖 OpenAI Input: {message_text}")
-            print(f"🤖 OpenAI Response: {ai_response}")
+            logger.debug(f"OpenAI Input: {message_text}", extra=SAMPLED)
+            logger.debug(f"OpenAI Response: {ai_response}", extra=SAMPLED)
             
             # Parsear la respuesta JSON
             try:
-                analysis = json.loads(ai_response)
+                with stage("json_parse"):
+                    analysis = json.loads(self._strip_code_fences(ai_response))
                 
                 # Validar que tenga los campos requeridos
-                required_fields = ["sentimiento", "tema", "resumen"]
-                if all(field in analysis for field in required_fields):
-                    print(f"✅ Analisis de IA exitoso: {analysis['sentimiento']} - {analysis['tema']}")
-                    return analysis
+                if self._is_valid_analysis(analysis):
+                    logger.debug(f"Analisis de IA exitoso: {analysis['sentimiento']} - {analysis['tema']}", extra=SAMPLED)
+                    await self._cache_result(message_text, analysis)
+                    return {**analysis, "analysis_source": "openai"}
                 else:
-                    print(f"Formato de respuesta de IA no válido: {analysis}")
-                    return self._basic_analysis(message_text)
+                    OPENAI_ERRORS.labels("invalid_format").inc()
+                    logger.warning(f"Formato de respuesta de IA no válido: {analysis}")
+                    return self._failed_analysis(message_text, "formato de respuesta no válido")
                     
             except json.JSONDecodeError as e:
-                print(f"Error parseando JSON: {e}")
-                print(f"IA respuesta: {ai_response}")
-                return self._basic_analysis(message_text)
+                OPENAI_ERRORS.labels("invalid_json").inc()
+                logger.warning(f"Error parseando JSON: {e}")
+                logger.warning(f"IA respuesta: {ai_response}")
+                return self._failed_analysis(message_text, e)
                     
+        except CircuitOpenError as e:
+            logger.debug("Circuito de OpenAI abierto: usando analisis basico", extra=SAMPLED)
+            return self._failed_analysis(message_text, e)
         except Exception as e:
-            print(f"Error en el análisis de IA: {e}")
-            return self._basic_analysis(message_text)
+            logger.warning(f"Error en el análisis de IA: {e}")
+            return self._failed_analysis(message_text, e)
     
     def _basic_analysis(self, message_text: str) -> Dict:
         """
         Análisis básico basado en palabras clave cuando la IA no está disponible
         """
-        message_lower = message_text.lower()
-        
-        # Análisis de sentimiento básico
-        positive_words = ["bueno", "excelente", "genial", "perfecto", "delicioso", "rápido", "amable", "recomiendo", "gracias", "feliz", "contento"]
-        negative_words = ["malo", "terrible", "lento", "sucio", "caro", "frío", "queja", "problema", "disgusto", "molesto", "horrible"]
-        
-        positive_count = sum(1 for word in positive_words if word in message_lower)
-        negative_count = sum(1 for word in negative_words if word in message_lower)
-        
-        if positive_count > negative_count:
-            sentiment = "positivo"
-        elif negative_count > positive_count:
-            sentiment = "negativo"
-        else:
-            sentiment = "neutro"
-        
-        # Análisis de tema básico
-        theme_keywords = {
-            "Servicio al Cliente": ["servicio", "atención", "personal", "mesero", "espera", "rápido", "lento", "amable"],
-            "Calidad del Producto": ["comida", "café", "sabor", "delicioso", "rico", "frío", "caliente", "fresco"],
-            "Precio": ["precio", "caro", "barato", "descuento", "promoción", "cuesta", "valor"],
-            "Limpieza": ["limpio", "sucio", "baño", "mesa", "higiene", "limpieza"]
-        }
-        
-        theme_scores = {}
-        for theme, keywords in theme_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in message_lower)
-            theme_scores[theme] = score
-        
-        # Seleccionar el tema con mayor puntuación
-        if theme_scores and max(theme_scores.values()) > 0:
-            theme = max(theme_scores, key=theme_scores.get)
-        else:
-            theme = "Otro"
-        
-        # Crear resumen básico
-        summary = message_text[:97] + "..." if len(message_text) > 100 else message_text
-        
-        return {
-            "sentimiento": sentiment,
-            "tema": theme,
-            "resumen": summary
-        }
+        return self._basic_analysis_many([message_text])[0]
+
+    def _failed_analysis(self, message_text: str, error) -> Dict:
+        """
+        Análisis básico por un fallo de OpenAI. Lleva el error para que los
+        workers de la cola reintenten el trabajo en lugar de guardarlo; con
+        el circuito abierto, también cuándo volverá a admitir llamadas
+        """
+        analysis = {**self._basic_analysis(message_text), "error": str(error)}
+        if isinstance(error, CircuitOpenError):
+            analysis["circuit_open"] = True
+            analysis["retry_after"] = self.breaker.retry_in()
+        return analysis
+
+    def _basic_analysis_many(self, messages: List[str]) -> List[Dict]:
+        """Análisis básico de varios mensajes con una sola pasada del matcher"""
+        ANALYSIS_FALLBACKS.inc(len(messages))
+        results = []
+        for message_text, analysis in zip(messages, self.keyword_matcher.classify_many(messages)):
+            # Crear resumen básico
+            summary = message_text[:97] + "..." if len(message_text) > 100 else message_text
+            results.append({**analysis, "resumen": summary, "analysis_source": "fallback"})
+        return results
+
+
+class MicroBatcher:
+    """
+    Agrupa los mensajes que llegan durante una ventana corta (hasta N ms o K
+    mensajes) y los analiza con una sola llamada a AIAnalyzer.analyze_batch
+    """
+
+    def __init__(self, ai_analyzer: AIAnalyzer, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self.ai_analyzer = ai_analyzer
+        self.max_batch_size = max_batch_size or int(os.getenv("OPENAI_BATCH_SIZE", "10"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("OPENAI_BATCH_WAIT_MS", "200"))) / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        # Referencias a los lotes en curso: evita que el GC los recoja y
+        # permite esperarlos al cerrar
+        self._batches: Set[asyncio.Task] = set()
+
+    async def submit(self, message_text: str) -> Dict:
+        """Encolar un mensaje en el lote actual y esperar su análisis"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message_text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def close(self):
+        """Enviar el lote pendiente y esperar los que están en curso"""
+        self._flush()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            results = await self.ai_analyzer.analyze_batch([text for text, _ in batch])
+            for (_, future), analysis in zip(batch, results):
+                if not future.done():
+                    future.set_result(analysis)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
@@ -0,0 +1,109 @@
+import os
+import logging
+import re
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(message_text: str) -> str:
+    """Normalizar un mensaje para que textos casi idénticos compartan entrada"""
+    text = unicodedata.normalize("NFKC", message_text).lower()
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+class AnalysisCache:
+    """
+    Caché de análisis direccionada por contenido: LRU en memoria con TTL,
+    respaldada por una colección de MongoDB compartida entre réplicas
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.max_entries = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits_memory = 0
+        self.hits_mongo = 0
+        self.misses = 0
+
+    async def create_indexes(self):
+        """Crear el índice TTL de la colección de caché"""
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def make_key(message_text: str, version: str) -> str:
+        """Clave = hash del texto normalizado + versión del prompt/modelo"""
+        raw = f"{version}|{normalize_text(message_text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, message_text: str, version: str) -> Optional[Dict]:
+        """Buscar un análisis en memoria y luego en MongoDB"""
+        key = self.make_key(message_text, version)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, analysis = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return dict(analysis)
+            del self._entries[key]
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one(
+                    {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}
+                )
+                if doc:
+                    self._remember(key, doc["analysis"])
+                    self.hits_mongo += 1
+                    return dict(doc["analysis"])
+            except Exception as e:
+                logger.warning(f"Error al leer la caché de análisis: {e}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, message_text: str, version: str, analysis: Dict):
+        """Guardar un análisis en memoria y en MongoDB"""
+        key = self.make_key(message_text, version)
+        self._remember(key, analysis)
+
+        if self.collection is not None:
+            try:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {"$set": {
+                        "analysis": analysis,
+                        "version": version,
+                        "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Error al guardar en la caché de análisis: {e}")
+
+    def _remember(self, key: str, analysis: Dict):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(analysis))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos y fallos"""
+        hits = self.hits_memory + self.hits_mongo
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "hits_memory": self.hits_memory,
+            "hits_mongo": self.hits_mongo,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "entries_memory": len(self._entries)
+        }
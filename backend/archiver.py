@@ -0,0 +1,494 @@
+import io
+import os
+import gzip
+import socket
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+from metrics import ARCHIVE_MESSAGES
+
+try:
+    import zstandard
+except ImportError:  # opcional: sin zstandard se comprime con gzip
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Estados de un archivo en el manifiesto: "escrito" (archivo en disco, los
+# mensajes quizá siguen en la colección) -> "archivado" (ya borrados)
+WRITTEN = "escrito"
+ARCHIVED = "archivado"
+
+# Extended JSON: conserva ObjectId y datetime al restaurar (fechas naive, como en la colección)
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=False)
+_READ_BATCH = 1000
+
+
+def _month_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, 1)
+
+
+def archived_keys(doc: Dict) -> List[str]:
+    """
+    Claves de deduplicación de un mensaje (message_sid y content_hash). Al
+    archivarlo salen de los índices únicos de la colección, así que se
+    guardan aparte para que un reintento o una reimportación no lo dupliquen
+    """
+    keys = []
+    if doc.get("message_sid"):
+        keys.append(f"sid:{doc['message_sid']}")
+    if doc.get("content_hash"):
+        keys.append(f"hash:{doc['content_hash']}")
+    return keys
+
+
+def _pairs(counts: Counter) -> List[List]:
+    # Pares [valor, cantidad]: los valores no siempre son claves válidas de MongoDB
+    return [[value, count] for value, count in counts.items()]
+
+
+class _PartWriter:
+    """Archivo NDJSON comprimido que se escribe en un .tmp y se publica con rename"""
+
+    def __init__(self, path: str, compression: str):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.raw = open(self.tmp_path, "wb")
+        if compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6)
+
+    def write(self, docs: List[Dict]):
+        self.stream.write("".join(json_util.dumps(doc, json_options=_JSON_OPTIONS) + "\n" for doc in docs).encode("utf-8"))
+
+    def commit(self) -> int:
+        """Cerrar, sincronizar a disco y publicar el archivo; devuelve su tamaño"""
+        self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        os.replace(self.tmp_path, self.path)
+        return os.path.getsize(self.path)
+
+    def discard(self):
+        try:
+            self.stream.close()
+            self.raw.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+def _iter_part(path: str) -> Iterator[Dict]:
+    """Documentos de un archivo del archivo frío, en streaming"""
+    with open(path, "rb") as raw:
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"{path} está comprimido con zstd: instalar zstandard para leerlo")
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+        else:
+            stream = gzip.GzipFile(fileobj=raw, mode="rb")
+        with io.TextIOWrapper(stream, encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    yield json_util.loads(line, json_options=_JSON_OPTIONS)
+
+
+class MessageArchive:
+    """
+    Ciclo de vida de los mensajes: los que superan `after_days` se mueven a
+    archivos NDJSON comprimidos (zstd si está instalado, si no gzip) en
+    `directory`, un archivo por mes y bloque de `part_size` mensajes. El
+    manifiesto (`collection`) guarda por archivo sus conteos de sentimiento y
+    tema, así rebuild_stats los sigue sumando; las estadísticas, tendencias y
+    resúmenes materializados no se tocan al archivar. `directory` debe ser
+    compartido entre réplicas: el manifiesto registra qué host escribió cada
+    archivo y los que no están en disco se omiten con un aviso.
+    `keys` guarda las claves de deduplicación de los mensajes archivados.
+    `on_change` se llama tras cada lote borrado o restaurado (versión de datos)
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        messages=None,
+        after_days: Optional[float] = None,
+        directory: Optional[str] = None,
+        on_change: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        self.collection = collection
+        self.messages = messages
+        self.keys = None
+        self.on_change = on_change
+        self.host = socket.gethostname()
+        self.after_days = after_days if after_days is not None else float(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+        self.directory = directory or os.getenv("ARCHIVE_DIR", "archive")
+        self.part_size = int(os.getenv("ARCHIVE_PART_SIZE", "50000"))
+        self.interval = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+        self.restore_days = float(os.getenv("ARCHIVE_RESTORE_DAYS", "7"))
+        compression = os.getenv("ARCHIVE_COMPRESSION", "auto")
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("ARCHIVE_COMPRESSION=zstd requiere el paquete zstandard")
+        self.compression = compression
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[datetime] = None
+        self.last_archived = 0
+        self.errors = 0
+        self.missing_files: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    async def create_indexes(self):
+        await self.collection.create_index([("desde", 1), ("hasta", 1)])
+        await self.collection.create_index("estado")
+
+    def start(self, leader):
+        """Archivar periódicamente en segundo plano, solo en la réplica líder"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(leader))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, leader):
+        while True:
+            try:
+                if leader.is_leader:
+                    await self.archive_old()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error al archivar mensajes antiguos: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _available(self, manifest: Dict) -> bool:
+        """Si el archivo de un manifiesto está en este ARCHIVE_DIR"""
+        if os.path.exists(self._path(manifest["archivo"])):
+            self.missing_files.discard(manifest["archivo"])
+            return True
+        if manifest["archivo"] not in self.missing_files:
+            self.missing_files.add(manifest["archivo"])
+            logger.error(
+                f"El archivo {manifest['archivo']} (escrito en {manifest.get('host', '?')}) no está en "
+                f"{self.directory}: ARCHIVE_DIR debe ser un almacenamiento compartido entre réplicas"
+            )
+        return False
+
+    async def _changed(self):
+        if self.on_change is not None:
+            await self.on_change()
+
+    def _file_name(self, part_id: str) -> str:
+        return f"{part_id}.ndjson.{'zst' if self.compression == 'zstd' else 'gz'}"
+
+    def _candidates_query(self, cutoff: datetime, now: datetime) -> Dict:
+        # Los pendientes esperan a su análisis; los restaurados, a que venza su plazo
+        return {
+            "timestamp": {"$lt": cutoff},
+            "estado_analisis": {"$ne": "pendiente"},
+            "restaurado_hasta": {"$not": {"$gt": now}}
+        }
+
+    async def archive_old(self, now: Optional[datetime] = None) -> int:
+        """Mover a archivos fríos los mensajes más antiguos que `after_days`"""
+        if not self.enabled:
+            return 0
+        async with self._lock:
+            now = now or datetime.utcnow()
+            cutoff = now - timedelta(days=self.after_days)
+            await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+            await self._finish_pending()
+
+            query = self._candidates_query(cutoff, now)
+            archived = 0
+            while True:
+                first = await self.messages.find_one(query, {"timestamp": 1}, sort=[("timestamp", 1), ("_id", 1)])
+                if first is None:
+                    break
+                month = _month_start(first["timestamp"])
+                next_month = (month + timedelta(days=32)).replace(day=1)
+                month_query = {**query, "timestamp": {"$gte": month, "$lt": min(next_month, cutoff)}}
+                archived += await self._archive_part(month, month_query)
+
+            self.last_run = now
+            self.last_archived = archived
+            if archived:
+                logger.info(f"Archivados {archived} mensajes anteriores a {cutoff:%Y-%m-%d}")
+            return archived
+
+    async def _archive_part(self, month: datetime, query: Dict) -> int:
+        """Escribir un archivo con hasta `part_size` mensajes del mes y borrarlos"""
+        part_id = f"{month:%Y-%m}-{ObjectId()}"
+        name = self._file_name(part_id)
+        writer = await asyncio.to_thread(_PartWriter, self._path(name), self.compression)
+
+        ids: List[ObjectId] = []
+        keys: List[str] = []
+        sentiments, themes = Counter(), Counter()
+        first = last = None
+        cursor = self.messages.find(query).sort([("timestamp", 1), ("_id", 1)]).limit(self.part_size).batch_size(_READ_BATCH)
+        try:
+            batch = []
+            async for doc in cursor:
+                doc.pop("restaurado_hasta", None)
+                ids.append(doc["_id"])
+                keys.extend(archived_keys(doc))
+                sentiments[doc.get("sentimiento")] += 1
+                themes[doc.get("tema")] += 1
+                first = first or doc["timestamp"]
+                last = doc["timestamp"]
+                batch.append(doc)
+                if len(batch) >= _READ_BATCH:
+                    await asyncio.to_thread(writer.write, batch)
+                    batch = []
+            if batch:
+                await asyncio.to_thread(writer.write, batch)
+            size = await asyncio.to_thread(writer.commit)
+        except BaseException:
+            await asyncio.to_thread(writer.discard)
+            raise
+
+        # El manifiesto se registra antes de borrar: si el proceso se cae,
+        # _finish_pending completa el borrado con los ids del propio archivo
+        await self.collection.insert_one({
+            "_id": part_id,
+            "mes": f"{month:%Y-%m}",
+            "archivo": name,
+            "mensajes": len(ids),
+            "desde": first,
+            "hasta": last,
+            "sentimientos": _pairs(sentiments),
+            "temas": _pairs(themes),
+            "bytes": size,
+            "host": self.host,
+            "estado": WRITTEN,
+            "creado": datetime.utcnow()
+        })
+        await self._delete_archived(part_id, ids, keys)
+        return len(ids)
+
+    async def _delete_archived(self, part_id: str, ids: List[ObjectId], keys: List[str]):
+        # Las claves se registran antes de borrar: nunca hay un momento en
+        # que el mensaje no esté ni en la colección ni en las claves
+        await self._add_keys(part_id, keys)
+        for start in range(0, len(ids), _READ_BATCH):
+            await self.messages.delete_many({"_id": {"$in": ids[start:start + _READ_BATCH]}})
+            await self._changed()
+        await self.collection.update_one({"_id": part_id}, {"$set": {"estado": ARCHIVED, "claves": True}})
+        ARCHIVE_MESSAGES.labels(operation="archived").inc(len(ids))
+        logger.info(f"Archivo {part_id}: {len(ids)} mensajes archivados")
+
+    async def _finish_pending(self):
+        """
+        Completar los borrados que quedaron a medias (manifiestos en estado
+        escrito). Mientras el archivo no esté accesible los mensajes siguen en
+        la colección y el manifiesto no cuenta en los totales
+        """
+        async for manifest in self.collection.find({"estado": WRITTEN}):
+            if not self._available(manifest):
+                continue
+            ids: List[ObjectId] = []
+            keys: List[str] = []
+            async for doc in self._read(manifest["archivo"]):
+                ids.append(doc["_id"])
+                keys.extend(archived_keys(doc))
+            await self._delete_archived(manifest["_id"], ids, keys)
+
+    async def _add_keys(self, part_id: str, keys: List[str]):
+        for start in range(0, len(keys), _READ_BATCH):
+            try:
+                await self.keys.insert_many(
+                    [{"_id": key, "parte": part_id} for key in keys[start:start + _READ_BATCH]], ordered=False
+                )
+            except BulkWriteError as e:
+                # Claves ya registradas (borrado reanudado)
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+    async def backfill_keys(self):
+        """Registrar las claves de los archivos escritos antes de que existieran"""
+        async for manifest in self.collection.find({"estado": ARCHIVED, "claves": {"$ne": True}}):
+            if not self._available(manifest):
+                continue
+            keys = [key async for doc in self._read(manifest["archivo"]) for key in archived_keys(doc)]
+            await self._add_keys(manifest["_id"], keys)
+            await self.collection.update_one({"_id": manifest["_id"]}, {"$set": {"claves": True}})
+            logger.info(f"Archivo {manifest['_id']}: {len(keys)} claves de deduplicación registradas")
+
+    async def find_archived(self, docs: List[Dict]) -> Set[int]:
+        """Posiciones de los mensajes cuyo message_sid o content_hash ya está archivado"""
+        keys = {key: i for i, doc in enumerate(docs) for key in archived_keys(doc)}
+        if self.keys is None or not keys:
+            return set()
+        return {keys[doc["_id"]] async for doc in self.keys.find({"_id": {"$in": list(keys)}}, {"_id": 1})}
+
+    async def _read(self, name: str) -> AsyncIterator[Dict]:
+        """Leer un archivo en bloques desde un hilo (la descompresión no bloquea el loop)"""
+        iterator = _iter_part(self._path(name))
+        while True:
+            batch = await asyncio.to_thread(lambda: list(islice(iterator, _READ_BATCH)))
+            if not batch:
+                break
+            for doc in batch:
+                yield doc
+
+    async def iter_documents(self) -> AsyncIterator[Dict]:
+        """
+        Todos los mensajes archivados, para las reconstrucciones de agregados.
+        Los archivos que no están en este ARCHIVE_DIR se omiten (con error en
+        el log) para no impedir el arranque ni la reconstrucción del resto
+        """
+        await self._finish_pending()
+        async for manifest in self.collection.find({"estado": ARCHIVED}).sort("desde", 1):
+            if not self._available(manifest):
+                continue
+            async for doc in self._read(manifest["archivo"]):
+                yield doc
+
+    async def totals(self) -> Dict[str, Counter]:
+        """Conteos de sentimiento y tema de los mensajes archivados"""
+        await self._finish_pending()
+        sentiments, themes = Counter(), Counter()
+        async for manifest in self.collection.find({"estado": ARCHIVED}, {"sentimientos": 1, "temas": 1}):
+            for value, count in manifest.get("sentimientos", []):
+                sentiments[value] += count
+            for value, count in manifest.get("temas", []):
+                themes[value] += count
+        return {"sentimientos": sentiments, "temas": themes}
+
+    async def restore(self, start: datetime, end: datetime) -> int:
+        """
+        Devolver a la colección los mensajes archivados con timestamp en
+        [start, end). Los archivos afectados se reescriben sin ellos, así cada
+        mensaje está en un solo sitio; quedan fuera del archivado automático
+        durante `restore_days`
+        """
+        if start >= end:
+            raise ValueError("El rango a restaurar está vacío")
+        async with self._lock:
+            await self._finish_pending()
+            restore_until = datetime.utcnow() + timedelta(days=self.restore_days)
+            restored = 0
+            cursor = self.collection.find({"estado": ARCHIVED, "desde": {"$lt": end}, "hasta": {"$gte": start}}).sort("desde", 1)
+            manifests = [manifest async for manifest in cursor]
+            missing = [manifest["archivo"] for manifest in manifests if not self._available(manifest)]
+            if missing:
+                raise RuntimeError(f"Archivos no disponibles en {self.directory}: {', '.join(missing)}")
+            for manifest in manifests:
+                restored += await self._restore_part(manifest, start, end, restore_until)
+            logger.info(f"Restaurados {restored} mensajes entre {start} y {end}")
+            return restored
+
+    async def _restore_part(self, manifest: Dict, start: datetime, end: datetime, restore_until: datetime) -> int:
+        # Lo que queda fuera del rango va a un archivo nuevo; el manifiesto
+        # apunta a él solo después de reinsertar los mensajes restaurados
+        name = self._file_name(f"{manifest['_id']}-{ObjectId()}")
+        writer = await asyncio.to_thread(_PartWriter, self._path(name), self.compression)
+        kept = 0
+        sentiments, themes = Counter(), Counter()
+        first = last = None
+        restored: List[Dict] = []
+        restored_count = 0
+        try:
+            keep: List[Dict] = []
+            async for doc in self._read(manifest["archivo"]):
+                if start <= doc["timestamp"] < end:
+                    doc["restaurado_hasta"] = restore_until
+                    restored.append(doc)
+                    if len(restored) >= _READ_BATCH:
+                        restored_count += await self._insert(restored)
+                        restored = []
+                    continue
+                keep.append(doc)
+                kept += 1
+                sentiments[doc.get("sentimiento")] += 1
+                themes[doc.get("tema")] += 1
+                first = first or doc["timestamp"]
+                last = doc["timestamp"]
+                if len(keep) >= _READ_BATCH:
+                    await asyncio.to_thread(writer.write, keep)
+                    keep = []
+            if keep:
+                await asyncio.to_thread(writer.write, keep)
+            if restored:
+                restored_count += await self._insert(restored)
+            size = await asyncio.to_thread(writer.commit) if kept else None
+        except BaseException:
+            await asyncio.to_thread(writer.discard)
+            raise
+        if not kept:
+            await asyncio.to_thread(writer.discard)
+
+        if kept:
+            await self.collection.update_one({"_id": manifest["_id"]}, {"$set": {
+                "archivo": name,
+                "mensajes": kept,
+                "desde": first,
+                "hasta": last,
+                "sentimientos": _pairs(sentiments),
+                "temas": _pairs(themes),
+                "bytes": size,
+                "host": self.host
+            }})
+        else:
+            await self.collection.delete_one({"_id": manifest["_id"]})
+        await asyncio.to_thread(os.remove, self._path(manifest["archivo"]))
+        ARCHIVE_MESSAGES.labels(operation="restored").inc(restored_count)
+        return restored_count
+
+    async def _insert(self, docs: List[Dict]) -> int:
+        """Reinsertar mensajes; los que ya están (restauración repetida) se ignoran"""
+        try:
+            await self.messages.insert_many(docs, ordered=False)
+            inserted = len(docs)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            inserted = e.details.get("nInserted", 0)
+        # De vuelta en la colección, sus índices únicos vuelven a cubrirlos
+        keys = [key for doc in docs for key in archived_keys(doc)]
+        if keys:
+            await self.keys.delete_many({"_id": {"$in": keys}})
+        await self._changed()
+        return inserted
+
+    async def list_parts(self) -> List[Dict]:
+        cursor = self.collection.find({}, {"sentimientos": 0, "temas": 0}).sort("desde", 1)
+        return [doc async for doc in cursor]
+
+    def stats(self) -> Dict:
+        """Configuración y última ejecución para /config/check"""
+        return {
+            "enabled": self.enabled,
+            "after_days": self.after_days,
+            "directory": self.directory,
+            "compression": self.compression,
+            "interval_seconds": self.interval,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_archived": self.last_archived,
+            "errors": self.errors,
+            "missing_files": len(self.missing_files)
+        }
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark del fallback por palabras clave: implementación anterior
+(búsqueda de subcadenas por palabra) contra KeywordMatcher compilado.
+
+    cd backend
+    python -m benchmarks.bench_keywords --messages 20000
+
+Las tres variantes se ejecutan intercaladas en cada ronda y el speedup es la
+mediana de las rondas (con su rango), para que el ruido de la máquina afecte a
+todas por igual. Con las frases de lexicon.json ("muy cara"...) en una máquina
+ruidosa se midió una mediana de 1.4x uno a uno (rondas de 1.1 a 1.8x) y de
+1.6x en lote (1.2 a 1.8x); conviene repetirlo en la máquina de producción antes
+de citar una cifra.
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from keyword_matcher import KeywordMatcher
+
+SAMPLES = [
+    "La comida estaba fría y el servicio muy lento",
+    "Excelente atención, el mesero fue muy amable. ¡Gracias!",
+    "¿A qué hora abren el domingo?",
+    "El baño estaba sucio y las mesas también",
+    "Muy caro para lo que sirven, no vuelvo",
+    "El café delicioso y a buen precio, recomiendo",
+    "Carolina nos atendió, todo perfecto",
+    "No quiero malograr la reserva, ¿puedo cambiar la hora?",
+    "Pésimo, horrible experiencia, tuve un problema con la cuenta",
+    "Hola, quería saber si tienen promociones esta semana",
+]
+
+
+def legacy_basic_analysis(message_text: str) -> Dict:
+    """Copia de AIAnalyzer._basic_analysis antes del matcher compilado"""
+    message_lower = message_text.lower()
+
+    positive_words = ["bueno", "excelente", "genial", "perfecto", "delicioso", "rápido", "amable", "recomiendo", "gracias", "feliz", "contento"]
+    negative_words = ["malo", "terrible", "lento", "sucio", "caro", "frío", "queja", "problema", "disgusto", "molesto", "horrible"]
+
+    positive_count = sum(1 for word in positive_words if word in message_lower)
+    negative_count = sum(1 for word in negative_words if word in message_lower)
+
+    if positive_count > negative_count:
+        sentiment = "positivo"
+    elif negative_count > positive_count:
+        sentiment = "negativo"
+    else:
+        sentiment = "neutro"
+
+    theme_keywords = {
+        "Servicio al Cliente": ["servicio", "atención", "personal", "mesero", "espera", "rápido", "lento", "amable"],
+        "Calidad del Producto": ["comida", "café", "sabor", "delicioso", "rico", "frío", "caliente", "fresco"],
+        "Precio": ["precio", "caro", "barato", "descuento", "promoción", "cuesta", "valor"],
+        "Limpieza": ["limpio", "sucio", "baño", "mesa", "higiene", "limpieza"]
+    }
+
+    theme_scores = {}
+    for theme, keywords in theme_keywords.items():
+        theme_scores[theme] = sum(1 for keyword in keywords if keyword in message_lower)
+
+    if theme_scores and max(theme_scores.values()) > 0:
+        theme = max(theme_scores, key=theme_scores.get)
+    else:
+        theme = "Otro"
+
+    return {"sentimiento": sentiment, "tema": theme}
+
+
+def timed_rounds(funcs: List[Callable], rounds: int) -> List[List[float]]:
+    """Tiempos de cada función por ronda, ejecutándolas intercaladas"""
+    elapsed: List[List[float]] = [[] for _ in funcs]
+    for _ in range(rounds):
+        for times, func in zip(elapsed, funcs):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return elapsed
+
+
+def speedup(label: str, baseline: List[float], candidate: List[float]) -> str:
+    ratios = sorted(base / elapsed for base, elapsed in zip(baseline, candidate))
+    return f"{label}: {statistics.median(ratios):.1f}x (rango {ratios[0]:.1f}-{ratios[-1]:.1f}x)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rounds", type=int, default=9)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    messages = [random.choice(SAMPLES) for _ in range(args.messages)]
+    matcher = KeywordMatcher.from_file()
+
+    print(f"{args.messages} mensajes, {args.rounds} rondas\n")
+    labels = ["legacy (subcadenas por palabra)", "KeywordMatcher.classify (uno a uno)", "KeywordMatcher.classify_many (lote)"]
+    legacy, single, batch = timed_rounds([
+        lambda: [legacy_basic_analysis(m) for m in messages],
+        lambda: [matcher.classify(m) for m in messages],
+        lambda: matcher.classify_many(messages)
+    ], args.rounds)
+    for label, times in zip(labels, (legacy, single, batch)):
+        elapsed = statistics.median(times)
+        print(f"{label:<38} {elapsed * 1000:9.1f} ms  {len(messages) / elapsed:12,.0f} msg/s")
+    print(f"\n{speedup('speedup uno a uno', legacy, single)}   {speedup('lote', legacy, batch)}\n")
+
+    print("Diferencias de clasificación:")
+    for sample in SAMPLES:
+        old, new = legacy_basic_analysis(sample), matcher.classify(sample)
+        if old != new:
+            print(f"  {sample!r}\n    legacy: {old}\n    nuevo:  {new}")
+
+
+if __name__ == "__main__":
+    main()
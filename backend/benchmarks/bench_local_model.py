@@ -0,0 +1,74 @@
+"""
+Rendimiento del clasificador local: mensajes por segundo con 1 proceso y
+con N procesos. Si no se indica un modelo entrenado, entrena uno con datos
+sintéticos (requiere requirements-ml.txt).
+
+    cd backend
+    python -m benchmarks.bench_local_model --messages 20000 --workers 4
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+import joblib
+
+from local_model import LocalClassifier, train_bundle
+from keyword_matcher import KeywordMatcher
+from benchmarks.bench_keywords import SAMPLES
+
+
+def synthetic_corpus(count: int, seed: int = 7):
+    """Variaciones de los mensajes de ejemplo etiquetadas con el matcher de palabras clave"""
+    rng = random.Random(seed)
+    fillers = ["", " hoy", " otra vez", " en la mañana", " la verdad", " 🙂", " !!"]
+    texts = [rng.choice(SAMPLES) + rng.choice(fillers) for _ in range(count)]
+    labels = KeywordMatcher.from_file().classify_many(texts)
+    return texts, [label["sentimiento"] for label in labels], [label["tema"] for label in labels]
+
+
+async def measure(model_path: str, texts, workers: int, batch_size: int) -> float:
+    classifier = LocalClassifier(model_path=model_path, workers=workers, min_confidence=0.8)
+    classifier.start()
+    try:
+        await classifier.classify_many(texts[:workers * 10])  # calentar los procesos
+        started = time.perf_counter()
+        confident = 0
+        for i in range(0, len(texts), batch_size):
+            for result in await classifier.classify_many(texts[i:i + batch_size]):
+                confident += classifier.is_confident(result)
+        elapsed = time.perf_counter() - started
+    finally:
+        classifier.close()
+
+    rate = len(texts) / elapsed
+    print(f"{workers} proceso(s): {rate:,.0f} msg/s ({rate / workers:,.0f} msg/s por núcleo), "
+          f"{100.0 * confident / len(texts):.1f}% sobre el umbral")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--model", default=None, help="Modelo entrenado (por defecto uno sintético)")
+    args = parser.parse_args()
+
+    texts, sentiments, themes = synthetic_corpus(args.messages)
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = args.model
+        if not model_path:
+            model_path = os.path.join(workdir, "model.joblib")
+            joblib.dump(train_bundle(texts[:2000], sentiments[:2000], themes[:2000]), model_path)
+
+        single = await measure(model_path, texts, 1, args.batch_size)
+        if args.workers > 1:
+            multi = await measure(model_path, texts, args.workers, args.batch_size)
+            print(f"Escalado: {multi / single:.2f}x con {args.workers} procesos")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
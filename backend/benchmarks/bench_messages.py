@@ -0,0 +1,121 @@
+"""
+Lectura de /api/messages: camino anterior (documentos completos ->
+MessageResponse -> jsonable_encoder -> json) contra el camino rápido
+(proyección -> dicts planos -> orjson), para limit=50/500/5000. Se mide
+por separado la lectura de MongoDB y la construcción del cuerpo JSON. Con
+mongomock la lectura la domina el propio mongomock (ordenación y proyección
+en Python): para comparar lecturas usar un mongod local.
+
+    cd backend
+    python -m benchmarks.bench_messages --mongo mongomock
+    python -m benchmarks.bench_messages --mongo mongodb://localhost:27017
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from benchmarks.bench_keywords import SAMPLES
+from benchmarks.load import LoadResult
+
+
+async def populate(database, count: int):
+    existing = await database.collection.estimated_document_count()
+    if existing >= count:
+        return
+    rng = random.Random(existing)
+    now = datetime.utcnow()
+    docs = []
+    for i in range(existing, count):
+        text = rng.choice(SAMPLES)
+        docs.append({
+            "texto_mensaje": text,
+            "numero_remitente": f"whatsapp:+5491100{rng.randrange(500):05d}",
+            "message_sid": f"SMbench{i}",
+            "timestamp": now - timedelta(seconds=i),
+            "sentimiento": rng.choice(["positivo", "negativo", "neutro"]),
+            "tema": "Otro",
+            "resumen": text[:60],
+            "estado_analisis": "completado",
+            # Campos que la respuesta no usa y el camino rápido no lee
+            "analysis_source": "openai",
+            "version_analisis": "bench",
+            "content_hash": f"{i:064x}"
+        })
+    await database.collection.insert_many(docs, ordered=False)
+
+
+async def old_path(database, limit: int):
+    started = time.perf_counter()
+    messages = await database.get_messages(limit=limit)
+    fetched = time.perf_counter()
+    body = JSONResponse(content=jsonable_encoder(messages)).body
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+async def new_path(database, limit: int):
+    started = time.perf_counter()
+    rows = await database.get_message_rows(limit=limit)
+    fetched = time.perf_counter()
+    body = ORJSONResponse(content=rows).body
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+async def measure(path, database, limit: int, repeat: int):
+    fetch, encode = LoadResult("fetch", 0, 0), LoadResult("encode", 0, 0)
+    await path(database, limit)
+    for _ in range(repeat):
+        fetch_seconds, encode_seconds, _ = await path(database, limit)
+        fetch.latencies.append(fetch_seconds)
+        encode.latencies.append(encode_seconds)
+    return fetch.summary()["p50_ms"], encode.summary()["p50_ms"]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' o una URL mongodb:// local")
+    parser.add_argument("--database", default="bench_messages")
+    parser.add_argument("--limits", default="50,500,5000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    limits = [int(limit) for limit in args.limits.split(",")]
+    os.environ["DATABASE_NAME"] = args.database
+    if args.mongo == "mongomock":
+        from benchmarks.serve import use_mongomock
+        os.environ["MONGODB_URL"] = "mongodb://mongomock"
+        use_mongomock()
+    else:
+        os.environ["MONGODB_URL"] = args.mongo
+
+    from database import Database
+
+    database = Database()
+    await database.connect()
+    try:
+        await populate(database, max(limits))
+
+        # Mismo JSON byte a byte: el cambio es solo de rendimiento
+        _, _, old_body = await old_path(database, 50)
+        _, _, new_body = await new_path(database, 50)
+        print(f"Respuestas idénticas: {old_body == new_body}")
+
+        print(f"\np50 de {args.repeat} lecturas (ms)      lectura  JSON    total")
+        for limit in limits:
+            old_fetch, old_encode = await measure(old_path, database, limit, args.repeat)
+            new_fetch, new_encode = await measure(new_path, database, limit, args.repeat)
+            old_total, new_total = old_fetch + old_encode, new_fetch + new_encode
+            print(f"limit={limit:<5} anterior            {old_fetch:7.1f} {old_encode:6.1f} {old_total:8.1f}")
+            print(f"{'':11} rápido              {new_fetch:7.1f} {new_encode:6.1f} {new_total:8.1f}"
+                  f"   ({old_total / new_total:.1f}x)")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
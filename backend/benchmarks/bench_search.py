@@ -0,0 +1,136 @@
+"""
+Latencia de /api/search (índice de texto + $facet) sobre un dataset
+sintético, comparada con un escaneo $regex del texto. Requiere un MongoDB
+real (mongomock no soporta $text); los datos se generan una vez en una
+base de datos aparte y se reutilizan en las siguientes ejecuciones.
+
+    cd backend
+    MONGODB_URL=mongodb://localhost:27017 python -m benchmarks.bench_search --messages 1000000
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+
+from benchmarks.bench_keywords import SAMPLES
+from benchmarks.load import LoadResult
+
+THEMES = ["Servicio al Cliente", "Calidad del Producto", "Precio", "Limpieza", "Otro"]
+SENTIMENTS = ["positivo", "negativo", "neutro"]
+EXTRA_WORDS = [
+    "mesero", "meseros", "reserva", "cuenta", "propina", "postre", "almuerzo", "cena", "terraza",
+    "estacionamiento", "delivery", "pedido", "demora", "sabor", "porción", "bebida", "música", "ruido"
+]
+# Término poco frecuente (~0.1% de los mensajes) para medir búsquedas selectivas
+RARE_WORD = "reembolso"
+
+QUERIES = [
+    ("término frecuente", {"q": "servicio"}),
+    ("término poco frecuente", {"q": RARE_WORD}),
+    ("varias palabras", {"q": "mesero lento cuenta"}),
+    ("frase", {"q": "\"muy caro\""}),
+    ("exclusión", {"q": "café -caro"}),
+    ("con filtros", {"q": "servicio", "sentimiento": "negativo", "tema": "Servicio al Cliente"}),
+    ("últimos 30 días", {"q": "sucio", "days": 30}),
+    ("página 10", {"q": "comida", "skip": 180}),
+]
+
+
+def synthetic_message(rng: random.Random, now: datetime, senders: int) -> dict:
+    words = rng.sample(EXTRA_WORDS, rng.randint(0, 3))
+    if rng.random() < 0.001:
+        words.append(RARE_WORD)
+    text = " ".join([rng.choice(SAMPLES), *words])
+    return {
+        "texto_mensaje": text,
+        "numero_remitente": f"whatsapp:+5491100{rng.randrange(senders):05d}",
+        "timestamp": now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+        "sentimiento": rng.choice(SENTIMENTS),
+        "tema": rng.choice(THEMES),
+        "resumen": text[:60],
+        "estado_analisis": "completado"
+    }
+
+
+async def populate(database, count: int, batch_size: int = 10000):
+    """Completar la colección hasta `count` mensajes"""
+    existing = await database.collection.estimated_document_count()
+    if existing >= count:
+        print(f"Reutilizando {existing:,} mensajes existentes")
+        return
+    rng = random.Random(existing)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    for offset in range(existing, count, batch_size):
+        batch = [synthetic_message(rng, now, senders=max(count // 200, 1)) for _ in range(min(batch_size, count - offset))]
+        await database.collection.insert_many(batch, ordered=False)
+        if (offset // batch_size) % 10 == 0:
+            print(f"  {offset + len(batch):,} / {count:,}")
+    print(f"Insertados {count - existing:,} mensajes en {time.perf_counter() - started:.0f}s")
+
+
+async def measure(name: str, run, repeat: int) -> LoadResult:
+    result = LoadResult(name=name, target_rate=0, duration=0)
+    await run()  # calentar caché de WiredTiger
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await run()
+        result.latencies.append(time.perf_counter() - t0)
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def report(result: LoadResult, detail: str = ""):
+    summary = result.summary()
+    print(f"{result.name:<24} p50 {summary['p50_ms']:8.1f} ms  p95 {summary['p95_ms']:8.1f} ms  "
+          f"p99 {summary['p99_ms']:8.1f} ms  {detail}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50, help="Consultas por escenario")
+    parser.add_argument("--database", default="bench_search", help="Base de datos de prueba (no usar la de producción)")
+    parser.add_argument("--regex-repeat", type=int, default=5, help="Repeticiones del escaneo $regex de referencia")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_NAME"] = args.database
+    os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+    from database import Database
+
+    database = Database()
+    await database.connect()
+    try:
+        await populate(database, args.messages)
+        # Asegurar el índice de texto aunque otro proceso tenga el liderazgo
+        await database._create_indexes()
+
+        print(f"\n{args.repeat} consultas por escenario sobre {args.messages:,} mensajes:")
+        for name, params in QUERIES:
+            params = dict(params)
+            days = params.pop("days", None)
+            start = datetime.utcnow() - timedelta(days=days) if days else None
+            totals = []
+
+            async def run(params=params, start=start):
+                result = await database.search_messages(start=start, **params)
+                totals.append(result.total)
+
+            report(await measure(name, run, args.repeat), f"{totals[-1]:,} resultados")
+
+        # Referencia: lo que costaría sin índice (escaneo de la colección)
+        async def regex_scan():
+            query = {"texto_mensaje": {"$regex": "servicio", "$options": "i"}}
+            await database.collection.find(query).limit(20).to_list(20)
+            await database.collection.count_documents(query)
+
+        report(await measure("$regex (sin índice)", regex_scan, args.regex_repeat), "misma búsqueda que 'término frecuente'")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
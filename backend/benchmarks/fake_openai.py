@@ -0,0 +1,103 @@
+"""
+Servidor falso de OpenAI (solo /v1/chat/completions) para pruebas de carga
+sin red. Responde con el formato del prompt individual o del de lotes,
+etiquetando con el matcher de palabras clave, con latencia y tasa de errores
+configurables.
+
+    cd backend
+    python -m benchmarks.fake_openai --port 9100 --latency-ms 300 --error-rate 0.02
+
+y en el backend: OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=fake
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from keyword_matcher import KeywordMatcher
+
+
+def create_app(latency_ms: float = 300, jitter_ms: float = 100, error_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    matcher = KeywordMatcher.from_file()
+    rng = random.Random(seed)
+    counters = {"requests": 0, "errors": 0}
+
+    def analysis(text: str) -> dict:
+        label = matcher.classify(text)
+        return {**label, "resumen": text[:100]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        counters["requests"] += 1
+
+        delay = max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        if rng.random() < error_rate:
+            counters["errors"] += 1
+            status = rng.choice([429, 500, 503])
+            return JSONResponse(status_code=status, content={"error": {"message": "fake error", "type": "server_error"}})
+
+        user_content = payload["messages"][-1]["content"]
+        try:
+            batch = json.loads(user_content)
+        except ValueError:
+            batch = None
+
+        if isinstance(batch, list):
+            content = json.dumps(
+                [{"indice": item["indice"], **analysis(item["mensaje"])} for item in batch],
+                ensure_ascii=False
+            )
+        else:
+            content = json.dumps(analysis(user_content), ensure_ascii=False)
+
+        prompt_tokens = sum(len(message["content"]) for message in payload["messages"]) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-fake-{counters['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Generadores de carga de lazo abierto: las peticiones se lanzan a una tasa
+fija sin esperar a las anteriores y la latencia se mide desde el instante
+programado, así una respuesta lenta no oculta la cola que genera
+(coordinated omission).
+"""
+import math
+import time
+import uuid
+import random
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.bench_keywords import SAMPLES
+
+
+@dataclass
+class LoadResult:
+    name: str
+    target_rate: float
+    duration: float
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+    @staticmethod
+    def percentile(values: List[float], p: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict:
+        completed = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "target_rate": self.target_rate,
+            "throughput": round(completed / self.duration, 1) if self.duration else 0.0,
+            "requests": completed + self.errors,
+            "errors": self.errors,
+            "p50_ms": round(self.percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(self.percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(self.percentile(self.latencies, 99) * 1000, 2),
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())}
+        }
+
+
+async def run_open_loop(
+    name: str,
+    send: Callable[[int], Awaitable[httpx.Response]],
+    rate: float,
+    duration: float,
+    max_in_flight: int = 2000
+) -> LoadResult:
+    """Lanzar `rate` peticiones/s durante `duration` segundos"""
+    result = LoadResult(name=name, target_rate=rate, duration=duration)
+    total = int(rate * duration)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    started = time.perf_counter()
+
+    async def one(i: int, scheduled: float):
+        async with semaphore:
+            try:
+                response = await send(i)
+                result.statuses[response.status_code] = result.statuses.get(response.status_code, 0) + 1
+                if response.status_code >= 400:
+                    result.errors += 1
+                    return
+                result.latencies.append(time.perf_counter() - scheduled)
+            except httpx.HTTPError:
+                result.errors += 1
+
+    tasks = []
+    for i in range(total):
+        scheduled = started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, scheduled)))
+    await asyncio.gather(*tasks)
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def webhook_sender(client: httpx.AsyncClient, retry_fraction: float = 0.0, seed: int = 0):
+    """
+    Posts estilo Twilio (application/x-www-form-urlencoded) a /webhook/whatsapp.
+    Una fracción reenvía un MessageSid anterior, como los reintentos de Twilio.
+    """
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    senders = [f"whatsapp:+5037000{n:04d}" for n in range(200)]
+
+    async def send(i: int) -> httpx.Response:
+        sid_index = rng.randrange(i) if i and rng.random() < retry_fraction else i
+        return await client.post("/webhook/whatsapp", data={
+            "MessageSid": f"SMbench{run_id}{sid_index:08d}",
+            "AccountSid": "ACbench",
+            "From": rng.choice(senders),
+            "To": "whatsapp:+14155238886",
+            "Body": f"{rng.choice(SAMPLES)} #{i}",
+            "NumMedia": "0"
+        })
+
+    return send
+
+
+def dashboard_sender(client: httpx.AsyncClient, revalidate: bool = True):
+    """
+    Lecturas del dashboard (/api/messages, /api/sentiments, /api/themes).
+    Con revalidate se reenvía el último ETag, como haría el navegador.
+    """
+    paths = ["/api/messages?limit=50", "/api/sentiments", "/api/themes"]
+    etags: Dict[str, Optional[str]] = {}
+
+    async def send(i: int) -> httpx.Response:
+        path = paths[i % len(paths)]
+        headers = {"If-None-Match": etags[path]} if revalidate and etags.get(path) else {}
+        response = await client.get(path, headers=headers)
+        if response.headers.get("etag"):
+            etags[path] = response.headers["etag"]
+        return response
+
+    return send
@@ -0,0 +1,215 @@
+"""
+Pruebas de carga del backend completo sin red: levanta el servidor falso de
+OpenAI y el backend (mongomock o un mongod local), lanza los escenarios y
+compara contra benchmarks/baseline.json. Termina con código 1 si hay una
+regresión mayor que la tolerancia.
+
+    cd backend
+    python -m benchmarks.run --mongo mongomock
+    python -m benchmarks.run --mongo mongodb://localhost:27017/bench --update-baseline
+
+Escenarios:
+  webhook@N        posts de Twilio a N msg/s (lazo abierto) con 5% de reintentos;
+                   la rampa se detiene en la primera tasa no sostenida
+  dashboard_etag   lecturas del dashboard revalidando con If-None-Match
+  dashboard_full   lecturas del dashboard sin ETag
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.load import dashboard_sender, run_open_loop, webhook_sender
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn(module: str, args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout}s")
+
+
+async def wait_drained(client: httpx.AsyncClient, timeout: float) -> float:
+    """Segundos hasta que no quedan mensajes "Sin clasificar" (cola de análisis vacía)"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        themes = (await client.get("/api/themes")).json()
+        if not any(theme["tema"] == "Sin clasificar" for theme in themes):
+            return round(time.monotonic() - started, 2)
+        await asyncio.sleep(0.25)
+    return -1.0
+
+
+async def run_scenarios(args, base_url: str) -> Dict:
+    """
+    Rampa de webhook de menor a mayor tasa, esperando entre pasos a que se
+    vacíe la cola de análisis; se detiene en la primera tasa no sostenida
+    (pasada la saturación los escenarios siguientes solo miden la cola).
+    Las lecturas del dashboard se miden tras el primer paso, con datos ya
+    analizados y sin backlog.
+    """
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    results: Dict = {"scenarios": {}, "max_sustained_webhook_rate": 0}
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        for step, rate in enumerate(args.webhook_rates):
+            result = await run_open_loop(
+                f"webhook@{rate:g}", webhook_sender(client, retry_fraction=0.05, seed=step), rate, args.duration
+            )
+            summary = result.summary()
+            summary["analysis_drain_s"] = await wait_drained(client, args.drain_timeout)
+            results["scenarios"][summary["scenario"]] = summary
+            print_summary(summary)
+
+            sustained = (
+                summary["errors"] == 0
+                and summary["p99_ms"] <= args.slo_p99_ms
+                and summary["throughput"] >= 0.95 * rate
+                and summary["analysis_drain_s"] >= 0
+            )
+            if not sustained:
+                break
+            results["max_sustained_webhook_rate"] = rate
+
+            if step == 0:
+                for name, revalidate in (("dashboard_etag", True), ("dashboard_full", False)):
+                    dashboard = await run_open_loop(
+                        name, dashboard_sender(client, revalidate), args.dashboard_rate, args.duration
+                    )
+                    results["scenarios"][name] = dashboard.summary()
+                    print_summary(results["scenarios"][name])
+
+    print(f"Tasa máxima de webhook sostenida (p99 <= {args.slo_p99_ms:g} ms): {results['max_sustained_webhook_rate']:g} msg/s")
+    return results
+
+
+def print_summary(summary: Dict):
+    drain = f" drenado={summary['analysis_drain_s']}s" if "analysis_drain_s" in summary else ""
+    print(
+        f"{summary['scenario']:<16} {summary['throughput']:>8.1f} req/s  "
+        f"p50={summary['p50_ms']:>8.2f}ms p95={summary['p95_ms']:>8.2f}ms p99={summary['p99_ms']:>8.2f}ms  "
+        f"errores={summary['errors']} {summary['statuses']}{drain}"
+    )
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regresiones: throughput menor o p95/p99 mayor que la línea base más la tolerancia"""
+    regressions = []
+    if results["max_sustained_webhook_rate"] < baseline.get("max_sustained_webhook_rate", 0):
+        regressions.append(
+            f"tasa sostenida {results['max_sustained_webhook_rate']:g} < {baseline['max_sustained_webhook_rate']:g} msg/s"
+        )
+    for name, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']} < {base['throughput']}")
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > base[metric] * (1 + tolerance) and current[metric] - base[metric] > min_delta_ms:
+                regressions.append(f"{name}: {metric} {current[metric]} > {base[metric]}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errores {current['errors']} > {base['errors']}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' o una URL mongodb:// local")
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos por escenario")
+    parser.add_argument("--webhook-rates", type=lambda v: [float(x) for x in v.split(",")], default=[10.0, 25.0, 50.0, 100.0])
+    parser.add_argument("--dashboard-rate", type=float, default=100.0)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--slo-p99-ms", type=float, default=250.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=300.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.01)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Regresión relativa permitida")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignorar subidas de latencia menores")
+    parser.add_argument("--output", default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    openai_port, backend_port = free_port(), free_port()
+    processes = [spawn("benchmarks.fake_openai", [
+        "--port", str(openai_port),
+        "--latency-ms", str(args.openai_latency_ms),
+        "--error-rate", str(args.openai_error_rate)
+    ], {})]
+    processes.append(spawn("benchmarks.serve", ["--port", str(backend_port), "--mongo", args.mongo], {
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "ANALYSIS_BACKOFF_SECONDS": "0.2",
+        "LOCAL_MODEL_ENABLED": "false",
+        "LOG_LEVEL": "WARNING"
+    }))
+
+    base_url = f"http://127.0.0.1:{backend_port}"
+    try:
+        await wait_ready(f"http://127.0.0.1:{openai_port}/stats")
+        await wait_ready(base_url + "/")
+        results = await run_scenarios(args, base_url)
+    finally:
+        # Primero el backend (sus workers aún pueden estar llamando a OpenAI)
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Línea base actualizada en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Sin línea base: ejecutar con --update-baseline para crearla")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("REGRESIONES:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("Sin regresiones respecto a la línea base")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
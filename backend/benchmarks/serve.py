@@ -0,0 +1,48 @@
+"""
+Levantar el backend para pruebas de carga. Con --mongo mongomock usa una
+base de datos en memoria (requiere mongomock-motor) en lugar de mongod.
+
+    cd backend
+    python -m benchmarks.serve --port 8100 --mongo mongomock
+"""
+import os
+import argparse
+
+import uvicorn
+
+
+def use_mongomock():
+    """Sustituir el cliente de motor por mongomock_motor (solo este proceso)"""
+    import mongomock_motor
+    import database
+
+    class MongoMockClient(mongomock_motor.AsyncMongoMockClient):
+        def __init__(self, *args, **kwargs):
+            # mongomock no admite estas opciones de conexión
+            kwargs.pop("serverSelectionTimeoutMS", None)
+            kwargs.pop("event_listeners", None)
+            super().__init__()
+            self.admin = self["admin"]
+
+    database.AsyncIOMotorClient = MongoMockClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' o una URL mongodb:// local")
+    args = parser.parse_args()
+
+    if args.mongo == "mongomock":
+        os.environ["MONGODB_URL"] = "mongodb://mongomock"
+        use_mongomock()
+    else:
+        os.environ["MONGODB_URL"] = args.mongo
+
+    import main as app_module
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
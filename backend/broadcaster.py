@@ -0,0 +1,123 @@
+import os
+import logging
+import json
+import asyncio
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """Cliente conectado al stream con su propia cola acotada"""
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def push(self, event: Dict) -> bool:
+        """
+        Encolar un evento sin bloquear. Si el cliente va atrasado se descartan
+        sus eventos pendientes y se le pide resincronizar con la API REST.
+        """
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"event": "resync", "data": {"reason": "slow_client"}})
+            return False
+
+
+class Broadcaster:
+    """Difusor en proceso de eventos de mensajes y estadísticas hacia /api/stream"""
+
+    def __init__(self, max_queue: Optional[int] = None):
+        self.max_queue = max_queue or int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+        self.subscribers: Set[Subscriber] = set()
+        self.published = 0
+        self._watch_tasks = []
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, event: str, data: Dict):
+        """Enviar un evento a todos los clientes conectados"""
+        self.published += 1
+        message = {"event": event, "data": data}
+        for subscriber in list(self.subscribers):
+            subscriber.push(message)
+
+    @staticmethod
+    def format_sse(message: Dict) -> str:
+        """Serializar un evento en formato Server-Sent Events"""
+        data = json.dumps(message["data"], ensure_ascii=False, default=str)
+        return f"event: {message['event']}\ndata: {data}\n\n"
+
+    def start_change_streams(self, messages_collection, stats_collection):
+        """
+        Alimentar el difusor con change streams de MongoDB (requiere replica set).
+        Útil cuando los workers corren en otro proceso.
+        """
+        self._watch_tasks = [
+            asyncio.create_task(self._watch_messages(messages_collection)),
+            asyncio.create_task(self._watch_stats(stats_collection))
+        ]
+
+    async def stop(self):
+        for task in self._watch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._watch_tasks, return_exceptions=True)
+        self._watch_tasks = []
+
+    async def _watch_messages(self, collection):
+        from database import Database
+
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document="updateLookup") as stream:
+                    async for change in stream:
+                        doc = change.get("fullDocument")
+                        if not doc:
+                            continue
+                        payload = Database.to_message_response(doc).model_dump(mode="json")
+                        if change["operationType"] == "insert":
+                            self.publish("message_created", payload)
+                        elif "sentimiento" in change.get("updateDescription", {}).get("updatedFields", {}):
+                            self.publish("message_analyzed", payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en change stream de mensajes: {e}")
+                await asyncio.sleep(5)
+
+    async def _watch_stats(self, collection):
+        while True:
+            try:
+                async with collection.watch([{"$match": {"operationType": {"$in": ["update", "replace"]}}}]) as stream:
+                    async for change in stream:
+                        if change["operationType"] == "replace":
+                            self.publish("resync", {"reason": "stats_rebuilt"})
+                            continue
+                        updated = change.get("updateDescription", {}).get("updatedFields", {})
+                        if updated:
+                            self.publish("stats", updated)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en change stream de estadísticas: {e}")
+                await asyncio.sleep(5)
+
+    def stats(self) -> Dict:
+        return {
+            "clients": len(self.subscribers),
+            "published": self.published,
+            "dropped": sum(subscriber.dropped for subscriber in self.subscribers)
+        }
@@ -0,0 +1,283 @@
+import os
+import asyncio
+import logging
+import re
+import time
+import hashlib
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Android: "12/03/2024, 14:35 - Nombre: mensaje" (también "2:35 p. m.")
+# iOS:     "[12/03/24, 14:35:12] Nombre: mensaje"
+_LINE = re.compile(
+    r"^\u200e?\[?(?P<date>\d{1,2}/\d{1,2}/\d{2,4}),?\s+"
+    r"(?P<time>\d{1,2}:\d{2}(?::\d{2})?)(?:\s*(?P<ampm>[aApP])\.?\s*[mM]\.?)?\]?"
+    r"\s*(?:-\s*)?(?P<rest>.*)$"
+)
+_AUTHOR = re.compile(r"^(?P<author>[^:]{1,80}):\s?(?P<text>.*)$")
+_OMITTED = ("<multimedia omitido>", "<media omitted>", "imagen omitida", "audio omitido", "sticker omitido")
+
+
+def _parse_timestamp(date: str, clock: str, ampm: Optional[str], dayfirst: bool) -> datetime:
+    first, second, year = (int(part) for part in date.split("/"))
+    day, month = (first, second) if dayfirst else (second, first)
+    if year < 100:
+        year += 2000
+
+    parts = [int(part) for part in clock.split(":")]
+    hour, minute = parts[0], parts[1]
+    seconds = parts[2] if len(parts) > 2 else 0
+    if ampm:
+        hour = hour % 12 + (12 if ampm.lower() == "p" else 0)
+    return datetime(year, month, day, hour, minute, seconds)
+
+
+def parse_export(lines: Iterator[str], dayfirst: bool = True) -> Iterator[Dict]:
+    """
+    Generador de mensajes a partir de las líneas de un export de WhatsApp.
+    Las líneas sin fecha continúan el mensaje anterior; los mensajes del
+    sistema y los adjuntos omitidos se descartan.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = _LINE.match(line)
+        timestamp = None
+        if match:
+            try:
+                timestamp = _parse_timestamp(match["date"], match["time"], match["ampm"], dayfirst)
+            except ValueError:
+                timestamp = None
+
+        if timestamp is None:
+            if current is not None:
+                current["texto_mensaje"] += "\n" + line
+            continue
+
+        if current is not None:
+            yield current
+            current = None
+
+        author = _AUTHOR.match(match["rest"].lstrip("\u200e"))
+        if not author:
+            continue  # mensaje del sistema (cifrado, cambios de grupo, etc.)
+
+        text = author["text"].strip()
+        if not text or text.lower().lstrip("\u200e") in _OMITTED:
+            continue
+
+        current = {
+            "timestamp": timestamp,
+            "numero_remitente": author["author"].strip(),
+            "texto_mensaje": text
+        }
+
+    if current is not None:
+        yield current
+
+
+class ProgressReader:
+    """Itera las líneas de un archivo binario decodificándolas y contando bytes"""
+
+    def __init__(self, binary_file, total_bytes: int):
+        self.binary_file = binary_file
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+
+    def __iter__(self) -> Iterator[str]:
+        first = True
+        for raw in self.binary_file:
+            self.bytes_read += len(raw)
+            line = raw.decode("utf-8", errors="replace")
+            if first:
+                line = line.lstrip("\ufeff")
+                first = False
+            yield line
+
+
+@contextmanager
+def open_export(path: str):
+    """Abrir un export .txt o .zip (primer .txt del zip) como ProgressReader"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [info for info in archive.infolist() if info.filename.lower().endswith(".txt")]
+            if not members:
+                raise ValueError(f"El zip {path} no contiene un export .txt")
+            with archive.open(members[0]) as binary_file:
+                yield ProgressReader(binary_file, members[0].file_size)
+    else:
+        with open(path, "rb") as binary_file:
+            yield ProgressReader(binary_file, os.path.getsize(path))
+
+
+def file_fingerprint(path: str) -> str:
+    """Identificador estable del archivo (tamaño + primer MB) para reanudar"""
+    digest = hashlib.sha256(str(os.path.getsize(path)).encode("ascii"))
+    with open(path, "rb") as source:
+        digest.update(source.read(1024 * 1024))
+    return digest.hexdigest()[:24]
+
+
+def content_hash(message: Dict, occurrence: int = 1) -> str:
+    """
+    Hash de deduplicación: remitente + minuto + texto y, desde la segunda
+    vez, el número de repetición dentro de ese minuto ("ok", "👍" enviados
+    varias veces). Así un mismo export reimportado o solapado se deduplica
+    sin descartar repeticiones reales
+    """
+    raw = f"{message['numero_remitente']}|{message['timestamp'].isoformat()}|{message['texto_mensaje']}"
+    if occurrence > 1:
+        raw += f"|{occurrence}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def with_content_hashes(messages: Iterator[Dict], remitente: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Añadir content_hash a cada mensaje contando las repeticiones por
+    (remitente, minuto, texto). Los exports van en orden cronológico: basta
+    con recordar las claves del minuto actual
+    """
+    current_timestamp = None
+    occurrences: Dict[tuple, int] = {}
+    for message in messages:
+        if remitente:
+            message["numero_remitente"] = remitente
+        if message["timestamp"] != current_timestamp:
+            current_timestamp = message["timestamp"]
+            occurrences = {}
+        key = (message["numero_remitente"], message["texto_mensaje"])
+        occurrences[key] = occurrences.get(key, 0) + 1
+        message["content_hash"] = content_hash(message, occurrences[key])
+        yield message
+
+
+class ChatImporter:
+    """
+    Importación masiva de exports de WhatsApp: lectura en streaming, inserción
+    por bloques, deduplicación por hash de contenido, análisis encolado por
+    bloques y checkpoints para reanudar tras una caída
+    """
+
+    def __init__(self, database, chunk_size: Optional[int] = None, enqueue_analysis: bool = True, dayfirst: bool = True):
+        self.database = database
+        self.chunk_size = chunk_size or int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+        self.enqueue_analysis = enqueue_analysis
+        self.dayfirst = dayfirst
+
+    async def run(
+        self,
+        path: str,
+        import_id: Optional[str] = None,
+        remitente: Optional[str] = None,
+        source_name: Optional[str] = None,
+        on_progress=None
+    ) -> Dict:
+        """Importar un archivo; si ya hay checkpoint para este import_id se reanuda"""
+        import_id = import_id or await asyncio.to_thread(file_fingerprint, path)
+        imports = self.database.imports
+
+        state = await imports.find_one({"_id": import_id})
+        if state and state.get("status") == "completed":
+            logger.info(f"Importación {import_id} ya completada")
+            return state
+
+        skip = state.get("messages_done", 0) if state else 0
+        await imports.update_one(
+            {"_id": import_id},
+            {
+                "$set": {"status": "running", "source": source_name or os.path.basename(path), "updated_at": datetime.utcnow()},
+                "$setOnInsert": {"messages_done": 0, "inserted": 0, "duplicates": 0, "queued": 0, "created_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+        if skip:
+            logger.info(f"Reanudando importación {import_id} desde el mensaje {skip}")
+
+        started = time.monotonic()
+        try:
+            with open_export(path) as reader:
+                # Los hashes se calculan también para los mensajes ya
+                # importados: las repeticiones se cuentan desde el principio
+                messages = with_content_hashes(parse_export(iter(reader), dayfirst=self.dayfirst), remitente)
+
+                # Lectura, descompresión, parseo y hashes en un hilo, bloque a
+                # bloque: un export grande no bloquea el loop (webhook, SSE, workers)
+                position = await asyncio.to_thread(lambda: sum(1 for _ in islice(messages, skip)))
+                while True:
+                    chunk = await asyncio.to_thread(lambda: list(islice(messages, self.chunk_size)))
+                    if not chunk:
+                        break
+                    position += len(chunk)
+                    await self._flush(import_id, chunk, position)
+                    self._report(import_id, reader, position, started, on_progress)
+
+            state = await imports.find_one_and_update(
+                {"_id": import_id},
+                {"$set": {"status": "completed", "updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info(f"Importación {import_id} completada: {state['inserted']} nuevos, {state['duplicates']} duplicados")
+            return state
+
+        except Exception as e:
+            await imports.update_one(
+                {"_id": import_id},
+                {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.utcnow()}}
+            )
+            logger.error(f"Error en la importación {import_id}: {e}")
+            raise
+
+    async def _flush(self, import_id: str, chunk: List[Dict], position: int):
+        documents = [
+            {**message, "message_sid": f"import_{message['content_hash'][:32]}", "origen": "import"}
+            for message in chunk
+        ]
+
+        inserted = await self.database.save_messages_bulk(documents)
+        duplicates = len(documents) - len(inserted)
+
+        queued = 0
+        if self.enqueue_analysis:
+            to_queue = inserted
+            if duplicates:
+                # Tras una caída el bloque pudo quedar insertado sin encolar
+                inserted_hashes = {doc["content_hash"] for doc in inserted}
+                duplicate_hashes = [doc["content_hash"] for doc in documents if doc["content_hash"] not in inserted_hashes]
+                cursor = self.database.collection.find(
+                    {"content_hash": {"$in": duplicate_hashes}, "estado_analisis": "pendiente"},
+                    {"texto_mensaje": 1, "numero_remitente": 1, "timestamp": 1}
+                )
+                to_queue = inserted + [doc async for doc in cursor]
+            queued = await self.database.jobs.enqueue_many(to_queue)
+
+        # El checkpoint solo avanza cuando el bloque quedó guardado y encolado
+        await self.database.imports.update_one(
+            {"_id": import_id},
+            {
+                "$set": {"messages_done": position, "updated_at": datetime.utcnow()},
+                "$inc": {"inserted": len(inserted), "duplicates": duplicates, "queued": queued}
+            }
+        )
+
+    @staticmethod
+    def _report(import_id: str, reader: ProgressReader, position: int, started: float, on_progress):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        percent = 100.0 * reader.bytes_read / reader.total_bytes if reader.total_bytes else 100.0
+        progress = {
+            "import_id": import_id,
+            "messages": position,
+            "bytes_read": reader.bytes_read,
+            "total_bytes": reader.total_bytes,
+            "percent": round(percent, 1),
+            "messages_per_second": round(position / elapsed, 1)
+        }
+        logger.info(f"Importación {import_id}: {position} mensajes, {percent:.1f}% ({progress['messages_per_second']} msg/s)")
+        if on_progress:
+            on_progress(progress)
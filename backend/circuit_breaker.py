@@ -0,0 +1,175 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """La llamada se rechazó sin intentarla porque el circuito está abierto"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por proceso para una dependencia externa. Con el circuito
+    cerrado registra resultado y latencia de las llamadas en una ventana
+    deslizante; si la tasa de errores o de llamadas lentas supera el umbral
+    (con un mínimo de llamadas) se abre y las llamadas se rechazan al
+    instante. Pasado `open_seconds` pasa a semiabierto y deja pasar unas
+    pocas llamadas de prueba: si salen bien se cierra, si no vuelve a abrirse.
+    """
+
+    def __init__(
+        self,
+        name: str = "openai",
+        window_seconds: Optional[float] = None,
+        min_calls: Optional[int] = None,
+        error_rate: Optional[float] = None,
+        slow_call_seconds: Optional[float] = None,
+        slow_rate: Optional[float] = None,
+        open_seconds: Optional[float] = None,
+        half_open_probes: Optional[int] = None
+    ):
+        self.name = name
+        self.window_seconds = window_seconds or float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+        self.min_calls = min_calls or int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+        self.error_rate = error_rate or float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+        self.slow_call_seconds = slow_call_seconds or float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "5"))
+        self.slow_rate = slow_rate or float(os.getenv("CIRCUIT_SLOW_RATE", "0.8"))
+        self.open_seconds = open_seconds or float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+        self.half_open_probes = half_open_probes or int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "3"))
+
+        self.state = CLOSED
+        # (instante, ok, lenta) de las llamadas recientes con el circuito cerrado
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+        CIRCUIT_STATE.labels(name).set(0)
+
+    def check(self) -> bool:
+        """
+        Comprobación previa, sin reservar permiso: False si acquire() ahora
+        rechazaría la llamada (y se cuenta como rechazada)
+        """
+        if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+            return self._reject() is not None
+        if self.state == HALF_OPEN and self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+            return self._reject() is not None
+        return True
+
+    def acquire(self) -> Optional[str]:
+        """
+        Pedir permiso para una llamada. Devuelve el estado con el que se
+        admitió (para pasarlo a record) o None si hay que usar el fallback
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return self._reject()
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+                return self._reject()
+            self._probes_in_flight += 1
+            return HALF_OPEN
+
+        return CLOSED
+
+    def record(self, permit: str, ok: bool, duration: float):
+        """Registrar el resultado de una llamada admitida con `permit`"""
+        slow = duration >= self.slow_call_seconds
+
+        if permit == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if self.state != HALF_OPEN:
+                return
+            if not ok or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            return
+
+        if self.state != CLOSED:
+            return
+        now = time.monotonic()
+        self._calls.append((now, ok, slow))
+        self._prune(now)
+        if len(self._calls) < self.min_calls:
+            return
+        errors, slow_calls = self._counts()
+        if errors / len(self._calls) >= self.error_rate or slow_calls / len(self._calls) >= self.slow_rate:
+            self._open()
+
+    def release(self, permit: str):
+        """Devolver un permiso sin resultado (llamada cancelada antes de terminar)"""
+        if permit == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        CIRCUIT_REJECTED.labels(self.name).inc()
+        return None
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        errors, slow_calls = self._counts()
+        logger.warning(
+            f"Circuito {self.name}: {self.state} -> {state} "
+            f"({len(self._calls)} llamadas recientes, {errors} errores, {slow_calls} lentas)"
+        )
+        self.state = state
+        self._calls.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def _prune(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _counts(self) -> Tuple[int, int]:
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        slow_calls = sum(1 for _, _, slow in self._calls if slow)
+        return errors, slow_calls
+
+    def retry_in(self) -> float:
+        """Segundos hasta que el circuito abierto admita una llamada de prueba"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.open_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def stats(self) -> Dict:
+        """Estado del circuito para /config/check"""
+        self._prune(time.monotonic())
+        errors, slow_calls = self._counts()
+        calls = len(self._calls)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "error_rate": round(errors / calls, 4) if calls else 0.0,
+            "slow_rate": round(slow_calls / calls, 4) if calls else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_in_seconds": round(self.retry_in(), 1)
+        }
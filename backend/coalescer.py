@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Window:
+    __slots__ = ("jobs", "opened_at", "timer", "first_timestamp", "last_timestamp")
+
+    def __init__(self):
+        self.jobs: List[Dict] = []
+        self.opened_at = time.monotonic()
+        self.timer: Optional[asyncio.Task] = None
+        self.first_timestamp: Optional[datetime] = None
+        self.last_timestamp: Optional[datetime] = None
+
+    def accepts(self, timestamp: Optional[datetime], quiet_seconds: float) -> bool:
+        """Si un mensaje con esta hora está a menos de `quiet_seconds` de la ventana"""
+        if timestamp is None or self.first_timestamp is None:
+            return True
+        gap = timedelta(seconds=quiet_seconds)
+        return self.first_timestamp - gap <= timestamp <= self.last_timestamp + gap
+
+    def include(self, timestamp: Optional[datetime]):
+        if timestamp is None:
+            return
+        self.first_timestamp = min(self.first_timestamp or timestamp, timestamp)
+        self.last_timestamp = max(self.last_timestamp or timestamp, timestamp)
+
+
+class ConversationCoalescer:
+    """
+    Agrupa los trabajos de un mismo remitente mientras sigan llegando
+    mensajes: la ventana se cierra tras `quiet_seconds` sin mensajes nuevos,
+    al llegar a `max_messages` o al cumplir `max_window_seconds`, y entonces
+    `on_flush` recibe todos sus trabajos juntos. Solo se agrupan mensajes
+    cuyos `timestamp` estén a menos de `quiet_seconds` entre sí: con un
+    backlog (importación, caída) se reclaman juntos mensajes de horas o días
+    distintos. Como mucho hay `max_senders` ventanas abiertas: al superar el
+    límite se cierra la más antigua.
+    """
+
+    def __init__(
+        self,
+        on_flush: Callable[[List[Dict]], Awaitable[None]],
+        quiet_seconds: Optional[float] = None,
+        max_messages: Optional[int] = None,
+        max_window_seconds: Optional[float] = None,
+        max_senders: Optional[int] = None
+    ):
+        self.on_flush = on_flush
+        self.quiet_seconds = quiet_seconds if quiet_seconds is not None else float(os.getenv("ANALYSIS_COALESCE_SECONDS", "0"))
+        self.max_messages = max_messages or int(os.getenv("ANALYSIS_COALESCE_MAX_MESSAGES", "10"))
+        self.max_window_seconds = max_window_seconds or float(os.getenv("ANALYSIS_COALESCE_MAX_SECONDS", "60"))
+        self.max_senders = max_senders or int(os.getenv("ANALYSIS_COALESCE_MAX_SENDERS", "1000"))
+        self._windows: "OrderedDict[str, _Window]" = OrderedDict()
+        self._flushing: Set[asyncio.Task] = set()
+        self.windows_flushed = 0
+        self.messages_flushed = 0
+        self.forced_flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.quiet_seconds > 0
+
+    async def add(self, job: Dict):
+        """
+        Añadir un trabajo a la ventana de su remitente. Si hay que cerrar una
+        ventana (llena, demasiado antigua o por el límite de remitentes) se
+        espera a que termine: así los workers no acumulan más de lo acotado
+        """
+        sender = job.get("numero_remitente") or ""
+        if not sender:
+            await self._run(None, [job])
+            return
+
+        # Un mensaje alejado en el tiempo cierra la ventana y empieza otra
+        timestamp = job.get("timestamp") or job.get("created_at")
+        while sender in self._windows and not self._windows[sender].accepts(timestamp, self.quiet_seconds):
+            await self._close(sender)
+
+        # Mientras se cierra la más antigua otros workers pueden abrir
+        # ventanas: se vuelve a comprobar hasta que haya sitio
+        while sender not in self._windows and len(self._windows) >= self.max_senders:
+            self.forced_flushes += 1
+            await self._close(next(iter(self._windows)))
+
+        window = self._windows.get(sender)
+        if window is None:
+            window = self._windows[sender] = _Window()
+
+        window.jobs.append(job)
+        window.include(timestamp)
+        if len(window.jobs) >= self.max_messages or time.monotonic() - window.opened_at >= self.max_window_seconds:
+            await self._close(sender)
+            return
+
+        if window.timer is not None:
+            window.timer.cancel()
+        window.timer = asyncio.create_task(self._close_when_quiet(sender, window))
+
+    async def flush_all(self):
+        """Cerrar todas las ventanas abiertas y esperar las que se están procesando"""
+        senders = list(self._windows)
+        if senders:
+            logger.info(f"Procesando {len(senders)} ventanas de conversación pendientes")
+        await asyncio.gather(*(self._close(sender) for sender in senders), return_exceptions=True)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    async def _close_when_quiet(self, sender: str, window: _Window):
+        await asyncio.sleep(self.quiet_seconds)
+        if self._windows.get(sender) is not window:
+            return
+        del self._windows[sender]
+        window.timer = None
+        # A partir de aquí la ventana ya no se puede cancelar desde add()
+        task = asyncio.create_task(self._run(sender, window.jobs))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _close(self, sender: str):
+        window = self._windows.pop(sender, None)
+        if window is None:
+            return
+        if window.timer is not None:
+            window.timer.cancel()
+        await self._run(sender, window.jobs)
+
+    async def _run(self, sender: Optional[str], jobs: List[Dict]):
+        self.windows_flushed += 1
+        self.messages_flushed += len(jobs)
+        try:
+            await self.on_flush(jobs)
+        except Exception as e:
+            logger.error(f"Error al procesar la ventana de {sender}: {e}")
+
+    def stats(self) -> Dict:
+        """Estado de las ventanas para /config/check"""
+        return {
+            "enabled": self.enabled,
+            "quiet_seconds": self.quiet_seconds,
+            "max_messages": self.max_messages,
+            "open_windows": len(self._windows),
+            "buffered_messages": sum(len(window.jobs) for window in self._windows.values()),
+            "windows_flushed": self.windows_flushed,
+            "messages_per_window": round(self.messages_flushed / self.windows_flushed, 2) if self.windows_flushed else 0.0,
+            "forced_flushes": self.forced_flushes
+        }
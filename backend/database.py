@@ -1,12 +1,59 @@
 import os
+import logging
+import json
+import base64
+from collections import Counter
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure
-from datetime import datetime
-from typing import List, Dict, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
+from datetime import datetime, timedelta
+from typing import Callable, List, Dict, Optional, Tuple
 from bson import ObjectId
+import time
 import asyncio
 
-from models import MessageResponse, SentimentStats, ThemeStats
+from models import MessageResponse, SentimentStats, ThemeStats, TrendPoint, SenderSummary, SearchResult
+from job_queue import JobQueue
+from analysis_cache import AnalysisCache
+from trends import TrendRollups
+from senders import SenderSummaries
+from archiver import MessageArchive
+from leader import LeaderElection
+from rate_limiter import SharedRateLimiter
+from log_config import SAMPLED
+from metrics import MongoCommandTimer
+
+logger = logging.getLogger(__name__)
+
+STATS_DOC_ID = "global"
+UNCLASSIFIED_THEME = "Sin clasificar"
+
+# Campos de MessageResponse: proyección de las lecturas del dashboard
+MESSAGE_PROJECTION = {
+    "texto_mensaje": 1, "numero_remitente": 1, "timestamp": 1, "sentimiento": 1,
+    "tema": 1, "resumen": 1, "message_sid": 1, "estado_analisis": 1
+}
+
+
+def _counter_key(value: str) -> str:
+    """Los nombres de campo de MongoDB no admiten '.' ni '$' inicial"""
+    return str(value).replace(".", "_").lstrip("$") or UNCLASSIFIED_THEME
+
+
+def encode_cursor(timestamp: datetime, message_id: str) -> str:
+    """Cursor opaco de paginación a partir de (timestamp, _id)"""
+    raw = json.dumps({"t": timestamp.isoformat(), "id": str(message_id)})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str):
+    """Decodificar un cursor; lanza ValueError si no es válido"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except Exception as e:
+        raise ValueError(f"Cursor de paginación inválido: {token}") from e
 
 class Database:
     """Clase para manejar operaciones de MongoDB - Solo producción"""
@@ -15,7 +62,29 @@ class Database:
         self.client = None
         self.db = None
         self.collection = None
+        self.jobs = JobQueue()
+        self.analysis_cache = AnalysisCache()
+        self.trends = TrendRollups()
+        self.senders = SenderSummaries()
+        self.archive = MessageArchive(on_change=self.bump_data_version)
+        self.leader = LeaderElection()
+        self.rate_limiter = SharedRateLimiter()
+        self.stats = None
+        self.imports = None
+        self.reanalysis = None
         self.connected = False
+        self.listeners: List[Callable[[str, Dict], None]] = []
+
+        # Versión de datos (campo "version" del documento de estadísticas):
+        # cada escritura la incrementa y las cachés de respuestas la comparan.
+        # Se relee de MongoDB como mucho cada DATA_VERSION_TTL_MS para ver
+        # también las escrituras de otros procesos
+        self.data_version_ttl = float(os.getenv("DATA_VERSION_TTL_MS", "250")) / 1000
+        self._data_version: Optional[int] = None
+        self._data_version_read_at = 0.0
+
+        # Al ganar el liderazgo después del arranque (el líder anterior cayó)
+        self.leader.on_elected(self.run_maintenance)
         
     async def connect(self):
         """Conectar a MongoDB"""
@@ -26,128 +95,778 @@ class Database:
                 
             database_name = os.getenv("DATABASE_NAME", "whatsapp_sentiment")
             collection_name = os.getenv("COLLECTION_NAME", "messages")
+            jobs_collection_name = os.getenv("JOBS_COLLECTION_NAME", "analysis_jobs")
+            cache_collection_name = os.getenv("CACHE_COLLECTION_NAME", "analysis_cache")
+            stats_collection_name = os.getenv("STATS_COLLECTION_NAME", "stats")
+            trends_collection_name = os.getenv("TRENDS_COLLECTION_NAME", "trend_rollups")
+            senders_collection_name = os.getenv("SENDERS_COLLECTION_NAME", "sender_summaries")
+            imports_collection_name = os.getenv("IMPORTS_COLLECTION_NAME", "imports")
+            reanalysis_collection_name = os.getenv("REANALYSIS_COLLECTION_NAME", "reanalysis_jobs")
+            archives_collection_name = os.getenv("ARCHIVES_COLLECTION_NAME", "archives")
+            archived_keys_collection_name = os.getenv("ARCHIVED_KEYS_COLLECTION_NAME", "archived_keys")
+            locks_collection_name = os.getenv("LOCKS_COLLECTION_NAME", "locks")
+            rate_limits_collection_name = os.getenv("RATE_LIMITS_COLLECTION_NAME", "rate_limits")
             
-            self.client = AsyncIOMotorClient(mongodb_url, serverSelectionTimeoutMS=10000)
+            self.client = AsyncIOMotorClient(
+                mongodb_url, serverSelectionTimeoutMS=10000, event_listeners=[MongoCommandTimer()]
+            )
             
             # Verificar conexión
             await self.client.admin.command('ping')
-            print("Conectado a MongoDB exitosamente")
+            logger.info("Conectado a MongoDB exitosamente")
             
             self.db = self.client[database_name]
             self.collection = self.db[collection_name]
+            self.jobs.collection = self.db[jobs_collection_name]
+            self.analysis_cache.collection = self.db[cache_collection_name]
+            self.stats = self.db[stats_collection_name]
+            self.trends.collection = self.db[trends_collection_name]
+            self.senders.collection = self.db[senders_collection_name]
+            self.imports = self.db[imports_collection_name]
+            self.reanalysis = self.db[reanalysis_collection_name]
+            self.archive.collection = self.db[archives_collection_name]
+            self.archive.messages = self.collection
+            self.archive.keys = self.db[archived_keys_collection_name]
+            self.leader.collection = self.db[locks_collection_name]
+            self.rate_limiter.collection = self.db[rate_limits_collection_name]
             self.connected = True
             
-            # Crear índices
-            await self._create_indexes()
+            # Solo una réplica (el líder) crea índices y hace el mantenimiento.
+            # El lease se renueva en segundo plano mientras tanto
+            if await self.leader.try_acquire():
+                self.leader.start()
+                await self.leader.run_elected()
             
         except Exception as e:
-            print(f"Error al conectar a MongoDB: {e}")
+            logger.error(f"Error al conectar a MongoDB: {e}")
+            await self.leader.stop()
             self.connected = False
             raise ConnectionError(f"MongoDB conexion fallida: {e}")
     
     async def disconnect(self):
         """Desconectar de MongoDB"""
         if self.client:
+            await self.archive.stop()
+            await self.leader.stop()
             self.client.close()
-            print("Conexión a MongoDB cerrada")
+            logger.info("Conexión a MongoDB cerrada")
+
+    async def run_maintenance(self):
+        """Tareas del líder: índices y estadísticas materializadas si faltan"""
+        await self._create_indexes()
+
+        # Primer arranque sobre datos existentes: materializar estadísticas
+        if await self.stats.find_one({"_id": STATS_DOC_ID}) is None:
+            await self.rebuild_stats()
+        elif await self.senders.collection.find_one({}) is None and await self.collection.find_one({}, {"_id": 1}):
+            await self.senders.rebuild(self.collection, archived=self.archive.iter_documents())
+
+        # Archivos anteriores al registro de claves de deduplicación
+        await self.archive.backfill_keys()
+        await self.trends.prune_sender_hourly()
+
+    def add_listener(self, listener: Callable[[str, Dict], None]):
+        """Registrar un callback (evento, datos) para los cambios del write path"""
+        self.listeners.append(listener)
+
+    def _notify(self, event: str, data: Dict):
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                logger.warning(f"Error notificando el evento {event}: {e}")
+
+    @staticmethod
+    def to_message_response(doc: Dict) -> MessageResponse:
+        """Convertir un documento de MongoDB en MessageResponse"""
+        return MessageResponse(**Database.to_message_dict(doc))
+
+    @staticmethod
+    def to_message_dict(doc: Dict) -> Dict:
+        """
+        Igual que to_message_response pero como dict plano, sin validación:
+        para el camino de lectura rápido, que serializa directo con orjson
+        """
+        return {
+            "id": str(doc["_id"]),
+            "texto_mensaje": doc["texto_mensaje"],
+            "numero_remitente": doc["numero_remitente"],
+            "timestamp": doc["timestamp"],
+            "sentimiento": doc.get("sentimiento", "pendiente"),
+            "tema": doc.get("tema", "Sin clasificar"),
+            "resumen": doc.get("resumen", ""),
+            "message_sid": doc.get("message_sid", ""),
+            "estado_analisis": doc.get("estado_analisis", "completado" if doc.get("sentimiento") else "pendiente")
+        }
 
     async def _create_indexes(self):
-        """Crear índices para optimizar consultas"""
-        try:
-            await self.collection.create_index("timestamp")
-            await self.collection.create_index("sentimiento")
-            await self.collection.create_index("tema")
-            await self.collection.create_index("numero_remitente")
-            print("Índices de la base de datos creados exitosamente")
-        except Exception as e:
-            print(f"Error al crear índices: {e}")
+        """
+        Crear índices para optimizar consultas. Cada grupo va por separado: si
+        uno falla (p. ej. un índice único sobre datos duplicados) los demás,
+        como los de la cola o el TTL de la caché, se crean igual
+        """
+        groups = [
+            ("mensajes", self._create_message_indexes),
+            ("búsqueda de texto", self._create_text_index),
+            ("idempotencia del webhook", self._create_message_sid_index),
+            ("cola de análisis", self.jobs.create_indexes),
+            ("caché de análisis", self.analysis_cache.create_indexes),
+            ("tendencias", self.trends.create_indexes),
+            ("remitentes", self.senders.create_indexes),
+            ("archivo", self.archive.create_indexes)
+        ]
+        failed = []
+        for name, create in groups:
+            try:
+                await create()
+            except Exception as e:
+                failed.append(name)
+                logger.error(f"Error al crear los índices de {name}: {e}")
+        if failed:
+            logger.error(f"Índices sin crear: {', '.join(failed)}")
+        else:
+            logger.info("Índices de la base de datos creados exitosamente")
+        return failed
+
+    async def _create_message_indexes(self):
+        await self.collection.create_index("timestamp")
+        await self.collection.create_index([("timestamp", -1), ("_id", -1)])
+        await self.collection.create_index("sentimiento")
+        await self.collection.create_index("tema")
+        await self.collection.create_index("numero_remitente")
+        await self.collection.create_index("estado_analisis")
+        await self.collection.create_index(
+            "content_hash", unique=True, partialFilterExpression={"content_hash": {"$exists": True}}
+        )
+
+    async def _create_text_index(self):
+        # Búsqueda de texto completo (/api/search) con stemming en español.
+        # language_override apunta a un campo que los mensajes no usan
+        await self.collection.create_index(
+            [("texto_mensaje", "text"), ("resumen", "text")],
+            name="busqueda_texto",
+            default_language="spanish",
+            language_override="idioma_busqueda",
+            weights={"texto_mensaje": 3, "resumen": 1}
+        )
 
-    async def save_message(self, message_data: Dict) -> ObjectId:
-        """Guardar un nuevo mensaje en la base de datos"""
+    async def _create_message_sid_index(self):
+        # Idempotencia del webhook: Twilio reintenta con el mismo MessageSid.
+        # Los duplicados guardados antes de existir el índice impedirían crearlo
+        await self._remove_duplicate_sids()
+        await self.collection.create_index(
+            "message_sid", unique=True, partialFilterExpression={"message_sid": {"$type": "string", "$gt": ""}}
+        )
+
+    async def _remove_duplicate_sids(self) -> int:
+        """
+        Migración: dejar un solo mensaje por message_sid (el primero guardado)
+        y borrar los reintentos duplicados con sus trabajos. Si borra alguno,
+        reconstruye las estadísticas para descontarlos
+        """
+        pipeline = [
+            {"$match": {"message_sid": {"$type": "string", "$gt": ""}}},
+            {"$group": {"_id": "$message_sid", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        duplicates: List[ObjectId] = []
+        async for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            duplicates.extend(sorted(group["ids"])[1:])
+        if not duplicates:
+            return 0
+
+        logger.warning(f"Eliminando {len(duplicates)} mensajes con message_sid duplicado")
+        for start in range(0, len(duplicates), 1000):
+            chunk = duplicates[start:start + 1000]
+            await self.collection.delete_many({"_id": {"$in": chunk}})
+            await self.jobs.collection.delete_many({"message_id": {"$in": chunk}})
+        if await self.stats.find_one({"_id": STATS_DOC_ID}, {"_id": 1}) is not None:
+            await self.rebuild_stats()
+        return len(duplicates)
+
+    async def save_message(self, message_data: Dict) -> Optional[ObjectId]:
+        """
+        Guardar un nuevo mensaje en la base de datos. Con message_sid se hace
+        un upsert ($setOnInsert) y se devuelve None si el mensaje ya existía.
+        """
         if not self.connected:
             raise ConnectionError("Base de datos no conectada. No se puede guardar el mensaje.")
         
         try:
-            result = await self.collection.insert_one(message_data)
-            print(f"Mensaje guardado con ID: {result.inserted_id}")
-            return result.inserted_id
+            message_data.setdefault("estado_analisis", "pendiente")
+            message_sid = message_data.get("message_sid")
+            if message_sid:
+                # Un SID archivado ya no está en el índice único de la colección
+                if self.archive.enabled and await self.archive.find_archived([message_data]):
+                    logger.debug(f"Mensaje archivado ignorado: {message_sid}", extra=SAMPLED)
+                    return None
+                message_data.setdefault("_id", ObjectId())
+                try:
+                    result = await self.collection.update_one(
+                        {"message_sid": message_sid},
+                        {"$setOnInsert": message_data},
+                        upsert=True
+                    )
+                except DuplicateKeyError:
+                    # Dos upserts concurrentes del mismo SID: ganó el otro
+                    result = None
+                if result is None or result.upserted_id is None:
+                    logger.debug(f"Mensaje duplicado ignorado: {message_sid}", extra=SAMPLED)
+                    return None
+            else:
+                await self.collection.insert_one(message_data)
+
+            await self._apply_stats_delta({}, {UNCLASSIFIED_THEME: 1})
+            await self.senders.record_messages([message_data])
+            if self.listeners:
+                self._notify("message_created", self.to_message_response(message_data).model_dump(mode="json"))
+                self._notify("stats_delta", {"sentimientos": {}, "temas": {UNCLASSIFIED_THEME: 1}})
+            logger.debug(f"Mensaje guardado con ID: {message_data['_id']}", extra=SAMPLED)
+            return message_data["_id"]
         except Exception as e:
-            print(f"Error al guardar el mensaje: {e}")
+            logger.error(f"Error al guardar el mensaje: {e}")
             raise
     
+    async def save_messages_bulk(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Insertar un bloque de mensajes con insert_many desordenado. Los
+        duplicados (índice único de content_hash o ya archivados) se omiten;
+        devuelve los documentos realmente insertados.
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden guardar los mensajes.")
+
+        if not messages:
+            return []
+
+        for message in messages:
+            message.setdefault("_id", ObjectId())
+            message.setdefault("estado_analisis", "pendiente")
+
+        # Los ya archivados (reimportación de un export) cuentan como duplicados
+        archived = await self.archive.find_archived(messages)
+        if archived:
+            messages = [message for i, message in enumerate(messages) if i not in archived]
+            if not messages:
+                return []
+
+        failed = set()
+        try:
+            await self.collection.insert_many(messages, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                logger.error(f"Error al guardar el bloque de mensajes: {errors[:3]}")
+                raise
+            failed = {error["index"] for error in errors}
+
+        inserted = [message for i, message in enumerate(messages) if i not in failed]
+        if inserted:
+            await self._apply_stats_delta({}, {UNCLASSIFIED_THEME: len(inserted)})
+            await self.senders.record_messages(inserted)
+            self._notify("stats_delta", {"sentimientos": {}, "temas": {UNCLASSIFIED_THEME: len(inserted)}})
+        return inserted
+
     async def update_message_analysis(self, message_id: ObjectId, analysis: Dict):
         """Actualizar un mensaje con el análisis de IA"""
         if not self.connected:
             raise ConnectionError("Base de datos no conectada. No se puede actualizar el mensaje.")
         
         try:
-            update_data = {
-                "sentimiento": analysis.get("sentimiento"),
-                "tema": analysis.get("tema"),
-                "resumen": analysis.get("resumen")
-            }
+            update_data = self._analysis_fields(analysis)
             
-            result = await self.collection.update_one(
+            previous = await self.collection.find_one_and_update(
                 {"_id": message_id},
-                {"$set": update_data}
+                {"$set": update_data},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count > 0:
-                print(f"Mensaje {message_id} actualizado con análisis de IA")
+            if previous is not None:
+                sentiment_delta, theme_delta = self._analysis_delta(previous, update_data)
+                await self._apply_stats_delta(sentiment_delta, theme_delta)
+                await self.trends.apply_delta(self.trends.analysis_delta(previous, update_data))
+                await self.senders.apply_delta(self.senders.analysis_delta(previous, update_data))
+                if self.listeners:
+                    self._notify("message_analyzed", self.to_message_response({**previous, **update_data}).model_dump(mode="json"))
+                    self._notify("stats_delta", {"sentimientos": sentiment_delta, "temas": theme_delta})
+                logger.debug(f"Mensaje {message_id} actualizado con análisis de IA", extra=SAMPLED)
             else:
-                print(f"Mensaje {message_id} no encontrado para actualizar")
+                logger.warning(f"Mensaje {message_id} no encontrado para actualizar")
 
         except Exception as e:
-            print(f"Error al actualizar el análisis del mensaje: {e}")
+            logger.error(f"Error al actualizar el análisis del mensaje: {e}")
             raise
     
-    async def get_messages(self, limit: int = 50, skip: int = 0) -> List[MessageResponse]:
-        """Obtener mensajes ordenados por timestamp (más recientes primero)"""
+    async def update_messages_analysis(self, message_ids: List[ObjectId], analysis: Dict):
+        """
+        Aplicar un mismo análisis a varios mensajes (una conversación agrupada);
+        los contadores se ajustan con el estado previo que devuelve la
+        escritura de cada mensaje. Todos quedan con conversacion_id = primer mensaje.
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden actualizar los mensajes.")
+
+        if not message_ids:
+            return
+
+        try:
+            update_data = {**self._analysis_fields(analysis), "conversacion_id": message_ids[0]}
+            pairs = await self._update_each([({"_id": message_id}, update_data) for message_id in message_ids])
+
+            sentiment_total, theme_total = await self._apply_analysis_deltas(pairs)
+            if self.listeners:
+                for previous, _ in pairs:
+                    self._notify("message_analyzed", self.to_message_response({**previous, **update_data}).model_dump(mode="json"))
+                self._notify("stats_delta", {"sentimientos": sentiment_total, "temas": theme_total})
+            logger.debug(f"Conversación de {len(message_ids)} mensajes actualizada con un análisis", extra=SAMPLED)
+        except Exception as e:
+            logger.error(f"Error al actualizar el análisis de la conversación: {e}")
+            raise
+
+    async def apply_analysis_bulk(self, updates: List[Tuple[Dict, Dict]]) -> int:
+        """
+        Guardar muchos análisis. `updates` son pares (documento leído antes,
+        análisis): cada mensaje solo se actualiza si su sentimiento y tema
+        siguen siendo los leídos (un worker pudo analizarlo mientras tanto).
+        Los contadores y rollups se ajustan con un solo $inc por bloque a
+        partir de los mensajes realmente actualizados. Devuelve cuántos son.
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden actualizar los mensajes.")
+
+        if not updates:
+            return 0
+
+        operations = [
+            (
+                {"_id": previous["_id"], "sentimiento": previous.get("sentimiento"), "tema": previous.get("tema")},
+                self._analysis_fields(analysis)
+            )
+            for previous, analysis in updates
+        ]
+
+        try:
+            pairs = await self._update_each(operations)
+            sentiment_total, theme_total = await self._apply_analysis_deltas(pairs)
+            self._notify("stats_delta", {"sentimientos": sentiment_total, "temas": theme_total})
+            return len(pairs)
+        except Exception as e:
+            logger.error(f"Error al guardar el bloque de análisis: {e}")
+            raise
+
+    async def _update_each(self, operations: List[Tuple[Dict, Dict]]) -> List[Tuple[Dict, Dict]]:
+        """
+        Un find_one_and_update por mensaje (en paralelo) que devuelve el
+        documento justo antes de escribir: los deltas salen solo de los
+        mensajes que coincidieron y de su estado real, sin carreras entre
+        una lectura previa y la escritura
+        """
+        previous_docs = await asyncio.gather(*(
+            self.collection.find_one_and_update(query, {"$set": update_data}, return_document=ReturnDocument.BEFORE)
+            for query, update_data in operations
+        ))
+        return [
+            (previous, update_data)
+            for previous, (_, update_data) in zip(previous_docs, operations)
+            if previous is not None
+        ]
+
+    @staticmethod
+    def _analysis_fields(analysis: Dict) -> Dict:
+        """Campos que se guardan en el mensaje a partir de un análisis"""
+        return {
+            "sentimiento": analysis.get("sentimiento"),
+            "tema": analysis.get("tema"),
+            "resumen": analysis.get("resumen"),
+            "analysis_source": analysis.get("analysis_source"),
+            "version_analisis": analysis.get("version_analisis"),
+            "estado_analisis": "completado"
+        }
+
+    async def _apply_analysis_deltas(self, pairs: List[Tuple[Dict, Dict]]):
+        """
+        Ajustar estadísticas, rollups y resúmenes por remitente para varios
+        pares (previo, nuevo) con una sola escritura de cada tipo
+        """
+        sentiment_total: Dict[str, int] = {}
+        theme_total: Dict[str, int] = {}
+        trends_total: Counter = Counter()
+        senders_total: Counter = Counter()
+        for previous, update_data in pairs:
+            sentiment_delta, theme_delta = self._analysis_delta(previous, update_data)
+            for key, count in sentiment_delta.items():
+                sentiment_total[key] = sentiment_total.get(key, 0) + count
+            for key, count in theme_delta.items():
+                theme_total[key] = theme_total.get(key, 0) + count
+            trends_total.update(self.trends.analysis_delta(previous, update_data))
+            senders_total.update(self.senders.analysis_delta(previous, update_data))
+
+        await self._apply_stats_delta(sentiment_total, theme_total)
+        await self.trends.apply_delta(trends_total)
+        await self.senders.apply_delta(senders_total)
+        return sentiment_total, theme_total
+
+    @staticmethod
+    def _analysis_delta(previous: Dict, current: Dict):
+        """Cambios en los contadores al reemplazar el análisis de un mensaje"""
+        sentiment_delta: Dict[str, int] = {}
+        theme_delta: Dict[str, int] = {}
+
+        old_sentiment, new_sentiment = previous.get("sentimiento"), current.get("sentimiento")
+        if old_sentiment != new_sentiment:
+            if old_sentiment:
+                sentiment_delta[old_sentiment] = sentiment_delta.get(old_sentiment, 0) - 1
+            if new_sentiment:
+                sentiment_delta[new_sentiment] = sentiment_delta.get(new_sentiment, 0) + 1
+
+        old_theme = previous.get("tema") or UNCLASSIFIED_THEME
+        new_theme = current.get("tema") or UNCLASSIFIED_THEME
+        if old_theme != new_theme:
+            theme_delta[old_theme] = theme_delta.get(old_theme, 0) - 1
+            theme_delta[new_theme] = theme_delta.get(new_theme, 0) + 1
+
+        return sentiment_delta, theme_delta
+
+    async def _apply_stats_delta(self, sentiment_delta: Dict[str, int], theme_delta: Dict[str, int]):
+        """
+        Aplicar los cambios al documento de estadísticas con un único $inc
+        atómico, que también incrementa la versión de datos
+        """
+        inc = {}
+        for sentiment, count in sentiment_delta.items():
+            if count:
+                inc[f"sentimientos.{_counter_key(sentiment)}"] = count
+        for theme, count in theme_delta.items():
+            if count:
+                inc[f"temas.{_counter_key(theme)}"] = count
+
+        inc["version"] = 1
+        await self.stats.update_one({"_id": STATS_DOC_ID}, {"$inc": inc}, upsert=True)
+        self._data_version = None
+
+    async def bump_data_version(self):
+        """
+        Nueva versión de datos sin cambiar contadores: para escrituras que no
+        pasan por el write path (archivado y restauración de mensajes)
+        """
+        await self._apply_stats_delta({}, {})
+
+    async def get_data_version(self) -> int:
+        """Versión actual de los datos (cambia con cualquier escritura)"""
+        now = time.monotonic()
+        if self._data_version is None or now - self._data_version_read_at > self.data_version_ttl:
+            doc = await self.stats.find_one({"_id": STATS_DOC_ID}, {"version": 1}) or {}
+            self._data_version = doc.get("version", 0)
+            self._data_version_read_at = now
+        return self._data_version
+
+    async def rebuild_stats(self):
+        """
+        Recalcular las estadísticas materializadas desde la colección de mensajes
+        y los conteos del archivo frío. Recorre toda la colección (y los archivos
+        para los resúmenes por remitente): usar solo para backfills o reconciliación.
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden reconstruir estadísticas.")
+
+        try:
+            # Solo mensajes con sentimiento: el write path tampoco cuenta los
+            # pendientes (un contador "pendiente" aquí solo crecería)
+            sentimientos = {}
+            pipeline = [
+                {"$match": {"sentimiento": {"$type": "string", "$gt": ""}}},
+                {"$group": {"_id": "$sentimiento", "count": {"$sum": 1}}}
+            ]
+            async for doc in self.collection.aggregate(pipeline):
+                sentimientos[_counter_key(doc["_id"])] = doc["count"]
+
+            temas = {}
+            async for doc in self.collection.aggregate([{"$group": {"_id": "$tema", "count": {"$sum": 1}}}]):
+                key = _counter_key(doc["_id"] or UNCLASSIFIED_THEME)
+                temas[key] = temas.get(key, 0) + doc["count"]
+
+            # Los mensajes archivados siguen contando en los agregados
+            archived = await self.archive.totals()
+            for sentiment, count in archived["sentimientos"].items():
+                if sentiment:
+                    key = _counter_key(sentiment)
+                    sentimientos[key] = sentimientos.get(key, 0) + count
+            for theme, count in archived["temas"].items():
+                key = _counter_key(theme or UNCLASSIFIED_THEME)
+                temas[key] = temas.get(key, 0) + count
+
+            previous = await self.stats.find_one({"_id": STATS_DOC_ID}, {"version": 1}) or {}
+            await self.stats.replace_one(
+                {"_id": STATS_DOC_ID},
+                {
+                    "sentimientos": sentimientos,
+                    "temas": temas,
+                    "version": previous.get("version", 0) + 1,
+                    "rebuilt_at": datetime.utcnow()
+                },
+                upsert=True
+            )
+            await self.senders.rebuild(self.collection, archived=self.archive.iter_documents())
+            self._data_version = None
+            self._notify("resync", {"reason": "stats_rebuilt"})
+            logger.info(f"Estadísticas reconstruidas: {sum(sentimientos.values())} mensajes analizados")
+
+        except Exception as e:
+            logger.error(f"Error al reconstruir estadísticas: {e}")
+            raise
+
+    async def get_trends(
+        self,
+        start: datetime,
+        end: datetime,
+        granularity: str = "day",
+        tema: Optional[str] = None,
+        numero_remitente: Optional[str] = None
+    ) -> List[TrendPoint]:
+        """Obtener la tendencia de sentimientos por bucket desde los rollups"""
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden obtener tendencias.")
+
+        try:
+            buckets = await self.trends.query(start, end, granularity, tema, numero_remitente)
+            logger.debug(f"Tendencias: {len(buckets)} buckets de {granularity}", extra=SAMPLED)
+            return [TrendPoint(**bucket) for bucket in buckets]
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error al obtener tendencias: {e}")
+            raise
+
+    async def search_messages(
+        self,
+        q: str,
+        sentimiento: Optional[str] = None,
+        tema: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 20,
+        skip: int = 0
+    ) -> SearchResult:
+        """
+        Búsqueda de texto completo con facetas en una sola agregación.
+        Resultados por relevancia (y recencia); cada faceta ignora su propio
+        filtro para que el dashboard pueda mostrar las demás opciones.
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden buscar mensajes.")
+
+        if not q or not q.strip():
+            raise ValueError("La búsqueda no puede estar vacía")
+
+        match: Dict = {"$text": {"$search": q}}
+        if start or end:
+            match["timestamp"] = {}
+            if start:
+                match["timestamp"]["$gte"] = start
+            if end:
+                match["timestamp"]["$lt"] = end
+
+        by_sentiment = {"sentimiento": sentimiento} if sentimiento else {}
+        by_theme = {"tema": tema} if tema else {}
+
+        pipeline = [
+            {"$match": match},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+            {"$facet": {
+                "items": [
+                    {"$match": {**by_sentiment, **by_theme}},
+                    {"$sort": {"score": -1, "timestamp": -1}},
+                    {"$skip": skip},
+                    {"$limit": limit}
+                ],
+                "total": [{"$match": {**by_sentiment, **by_theme}}, {"$count": "count"}],
+                "sentimientos": [{"$match": by_theme}, {"$group": {"_id": {"$ifNull": ["$sentimiento", "pendiente"]}, "count": {"$sum": 1}}}],
+                "temas": [{"$match": by_sentiment}, {"$group": {"_id": {"$ifNull": ["$tema", UNCLASSIFIED_THEME]}, "count": {"$sum": 1}}}]
+            }}
+        ]
+
+        try:
+            result = (await self.collection.aggregate(pipeline).to_list(1))[0]
+            total = result["total"][0]["count"] if result["total"] else 0
+            facets = {
+                "sentimientos": {doc["_id"]: doc["count"] for doc in result["sentimientos"]},
+                "temas": {doc["_id"]: doc["count"] for doc in result["temas"]}
+            }
+            logger.debug(f"Búsqueda '{q}': {total} resultados", extra=SAMPLED)
+            return SearchResult(
+                items=[self.to_message_response(doc) for doc in result["items"]],
+                total=total,
+                facets=facets
+            )
+        except Exception as e:
+            logger.error(f"Error al buscar mensajes: {e}")
+            raise
+
+    async def get_senders(
+        self,
+        sort: str = "total",
+        limit: int = 50,
+        min_negativos: Optional[int] = None,
+        dias: int = 7
+    ) -> List[SenderSummary]:
+        """
+        Top de remitentes desde los resúmenes. Con `min_negativos` devuelve
+        los que tienen al menos esa cantidad de mensajes negativos en los
+        últimos `dias` (rollups diarios), para hacerles seguimiento
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden obtener remitentes.")
+
+        try:
+            if min_negativos is None:
+                docs = await self.senders.top(sort, limit)
+                return [SenderSummary(**self.senders.to_summary(doc)) for doc in docs]
+
+            since = datetime.utcnow() - timedelta(days=dias)
+            recent = await self.trends.sentiment_by_sender("negativo", since, min_negativos, limit)
+            summaries = await self.senders.get([sender for sender, _ in recent])
+            return [
+                SenderSummary(**self.senders.to_summary(summaries.get(sender, {"_id": sender}), count))
+                for sender, count in recent
+            ]
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error al obtener remitentes: {e}")
+            raise
+
+    async def get_sender(self, numero_remitente: str, dias: int = 7) -> Optional[SenderSummary]:
+        """Resumen de un remitente con sus mensajes negativos de los últimos `dias`"""
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden obtener remitentes.")
+
+        try:
+            doc = (await self.senders.get([numero_remitente])).get(numero_remitente)
+            if doc is None:
+                return None
+            since = datetime.utcnow() - timedelta(days=dias)
+            recent = await self.trends.sentiment_by_sender("negativo", since, senders=[numero_remitente])
+            return SenderSummary(**self.senders.to_summary(doc, recent[0][1] if recent else 0))
+        except Exception as e:
+            logger.error(f"Error al obtener el remitente {numero_remitente}: {e}")
+            raise
+
+    async def find_pending_message(self, message_sid: str) -> Optional[Dict]:
+        """Mensaje con ese SID que sigue pendiente de análisis (o None)"""
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se puede consultar el mensaje.")
+
+        return await self.collection.find_one(
+            {"message_sid": message_sid, "estado_analisis": "pendiente"},
+            {"texto_mensaje": 1, "numero_remitente": 1, "timestamp": 1}
+        )
+
+    async def mark_analysis_failed(self, message_id: ObjectId):
+        """Marcar un mensaje cuyo análisis agotó los reintentos"""
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se puede actualizar el mensaje.")
+
+        await self.collection.update_one(
+            {"_id": message_id},
+            {"$set": {"estado_analisis": "fallido"}}
+        )
+        await self._apply_stats_delta({}, {})
+        logger.warning(f"Mensaje {message_id} marcado con análisis fallido")
+
+    def _messages_cursor(self, limit: int, skip: int, before: Optional[str], projection: Optional[Dict] = None):
+        """
+        Cursor de mensajes ordenados por timestamp (más recientes primero).
+        Con `before` (cursor de una página anterior) se usa paginación por
+        clave sobre el índice (timestamp, _id) en lugar de skip.
+        """
+        query = {}
+        if before:
+            timestamp, message_id = decode_cursor(before)
+            query = {"$or": [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": message_id}}
+            ]}
+            skip = 0
+
+        return self.collection.find(query, projection).sort([("timestamp", -1), ("_id", -1)]).skip(skip).limit(limit)
+
+    async def get_messages(self, limit: int = 50, skip: int = 0, before: Optional[str] = None) -> List[MessageResponse]:
+        """Obtener mensajes recientes como modelos MessageResponse"""
         if not self.connected:
             raise ConnectionError("Base de datos no conectada. No se pueden recuperar mensajes.")
 
+        cursor = self._messages_cursor(limit, skip, before)
         try:
-            cursor = self.collection.find().sort("timestamp", -1).skip(skip).limit(limit)
             messages = []
             
             async for doc in cursor:
-                message = MessageResponse(
-                    id=str(doc["_id"]),
-                    texto_mensaje=doc["texto_mensaje"],
-                    numero_remitente=doc["numero_remitente"],
-                    timestamp=doc["timestamp"],
-                    sentimiento=doc.get("sentimiento", "pendiente"),
-                    tema=doc.get("tema", "Sin clasificar"),
-                    resumen=doc.get("resumen", ""),
-                    message_sid=doc.get("message_sid", "")
-                )
-                messages.append(message)
-
-            print(f"Se recuperaron {len(messages)} mensajes de la base de datos")
+                messages.append(self.to_message_response(doc))
+
+            logger.debug(f"Se recuperaron {len(messages)} mensajes de la base de datos", extra=SAMPLED)
             return messages
             
         except Exception as e:
-            print(f"Error al recuperar mensajes: {e}")
+            logger.error(f"Error al recuperar mensajes: {e}")
+            raise
+
+    async def get_message_rows(self, limit: int = 50, skip: int = 0, before: Optional[str] = None) -> List[Dict]:
+        """
+        Camino rápido de get_messages para /api/messages: proyección a los
+        campos de la respuesta, lotes del tamaño de la página y dicts planos
+        listos para orjson (sin construir ni validar modelos por fila)
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden recuperar mensajes.")
+
+        cursor = self._messages_cursor(limit, skip, before, MESSAGE_PROJECTION)
+        if limit:
+            cursor = cursor.batch_size(limit)
+        try:
+            rows = [self.to_message_dict(doc) async for doc in cursor]
+            logger.debug(f"Se recuperaron {len(rows)} mensajes de la base de datos", extra=SAMPLED)
+            return rows
+        except Exception as e:
+            logger.error(f"Error al recuperar mensajes: {e}")
             raise
     
+    def iter_messages(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        sentimiento: Optional[str] = None,
+        tema: Optional[str] = None,
+        projection: Optional[Dict] = None
+    ):
+        """
+        Cursor de mensajes en orden cronológico para exportaciones: documentos
+        crudos (sin modelos Pydantic) con proyección y lotes grandes
+        """
+        if not self.connected:
+            raise ConnectionError("Base de datos no conectada. No se pueden exportar mensajes.")
+
+        query: Dict = {}
+        if start or end:
+            query["timestamp"] = {}
+            if start:
+                query["timestamp"]["$gte"] = start
+            if end:
+                query["timestamp"]["$lt"] = end
+        if sentimiento:
+            query["sentimiento"] = sentimiento
+        if tema:
+            query["tema"] = tema
+
+        batch_size = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+        return self.collection.find(query, projection).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+
     async def get_sentiment_stats(self) -> SentimentStats:
         """Obtener estadísticas de sentimientos"""
         if not self.connected:
             raise ConnectionError("Base de datos no conectada. No se pueden obtener estadísticas.")
 
         try:
-            pipeline = [
-                {"$group": {
-                    "_id": "$sentimiento",
-                    "count": {"$sum": 1}
-                }}
-            ]
-            
-            result = {}
-            async for doc in self.collection.aggregate(pipeline):
-                sentiment = doc["_id"]
-                count = doc["count"]
-                result[sentiment] = count
+            doc = await self.stats.find_one({"_id": STATS_DOC_ID}, {"sentimientos": 1}) or {}
+            result = doc.get("sentimientos", {})
             
             positivo = result.get("positivo", 0)
             negativo = result.get("negativo", 0)
@@ -160,11 +879,11 @@ class Database:
                 total=positivo + negativo + neutro
             )
 
-            print(f"Estadísticas de sentimientos: +{stats.positivo} -{stats.negativo} ={stats.neutro}")
+            logger.debug(f"Estadísticas de sentimientos: +{stats.positivo} -{stats.negativo} ={stats.neutro}", extra=SAMPLED)
             return stats
             
         except Exception as e:
-            print(f"Error al obtener estadísticas de sentimientos: {e}")
+            logger.error(f"Error al obtener estadísticas de sentimientos: {e}")
             raise
     
     async def get_theme_stats(self) -> List[ThemeStats]:
@@ -173,27 +892,19 @@ class Database:
             raise ConnectionError("Base de datos no conectada. No se pueden obtener estadísticas de temas.")
 
         try:
-            pipeline = [
-                {"$group": {
-                    "_id": "$tema",
-                    "count": {"$sum": 1}
-                }},
-                {"$sort": {"count": -1}}
-            ]
+            doc = await self.stats.find_one({"_id": STATS_DOC_ID}, {"temas": 1}) or {}
             
-            themes = []
-            async for doc in self.collection.aggregate(pipeline):
-                theme = ThemeStats(
-                    tema=doc["_id"] or "Sin clasificar",
-                    count=doc["count"]
-                )
-                themes.append(theme)
+            themes = [
+                ThemeStats(tema=tema, count=count)
+                for tema, count in sorted(doc.get("temas", {}).items(), key=lambda item: item[1], reverse=True)
+                if count > 0
+            ]
 
-            print(f"Estadísticas de temas: {len(themes)} temas diferentes encontrados")
+            logger.debug(f"Estadísticas de temas: {len(themes)} temas diferentes encontrados", extra=SAMPLED)
             return themes
             
         except Exception as e:
-            print(f"Error al obtener estadísticas de temas: {e}")
+            logger.error(f"Error al obtener estadísticas de temas: {e}")
             raise
 
     async def get_total_messages(self) -> int:
@@ -205,5 +916,5 @@ class Database:
             count = await self.collection.count_documents({})
             return count
         except Exception as e:
-            print(f"Error al contar los mensajes: {e}")
+            logger.error(f"Error al contar los mensajes: {e}")
             raise
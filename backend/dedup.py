@@ -0,0 +1,42 @@
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class RecentSids:
+    """
+    LRU en memoria de los MessageSid recientes del webhook. Los reintentos de
+    Twilio llegan segundos después del original, así que se cortan aquí sin
+    tocar MongoDB; el índice único de message_sid sigue siendo la garantía
+    entre procesos y tras un reinicio.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("WEBHOOK_DEDUP_MAX_ENTRIES", "10000"))
+        self._sids: "OrderedDict[str, None]" = OrderedDict()
+        self.fast_path_duplicates = 0
+        self.database_duplicates = 0
+
+    def seen(self, message_sid: str) -> bool:
+        """True si el SID ya se procesó recientemente (cuenta el duplicado)"""
+        if not message_sid or message_sid not in self._sids:
+            return False
+        self._sids.move_to_end(message_sid)
+        self.fast_path_duplicates += 1
+        return True
+
+    def remember(self, message_sid: str):
+        if not message_sid:
+            return
+        self._sids[message_sid] = None
+        self._sids.move_to_end(message_sid)
+        while len(self._sids) > self.max_entries:
+            self._sids.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._sids),
+            "max_entries": self.max_entries,
+            "fast_path_duplicates": self.fast_path_duplicates,
+            "database_duplicates": self.database_duplicates
+        }
@@ -0,0 +1,107 @@
+import io
+import csv
+import json
+import zlib
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS: List[str] = [
+    "id",
+    "timestamp",
+    "numero_remitente",
+    "texto_mensaje",
+    "sentimiento",
+    "tema",
+    "resumen",
+    "estado_analisis",
+    "analysis_source"
+]
+
+# Proyección de MongoDB equivalente (sin _id se exportaría vacío)
+EXPORT_PROJECTION: Dict[str, int] = {field: 1 for field in EXPORT_FIELDS if field != "id"}
+
+# Tamaño aproximado de cada bloque antes de comprimirlo y enviarlo
+_CHUNK_BYTES = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return str(value)
+
+
+def _row(doc: Dict) -> Dict:
+    row = {field: doc.get(field) for field in EXPORT_FIELDS}
+    row["id"] = str(doc["_id"])
+    return row
+
+
+async def _encode_csv(docs: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for doc in docs:
+        row = _row(doc)
+        writer.writerow([
+            row[field].isoformat() if isinstance(row[field], datetime) else ("" if row[field] is None else row[field])
+            for field in EXPORT_FIELDS
+        ])
+        if buffer.tell() >= _CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _encode_ndjson(docs: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    lines: List[str] = []
+    size = 0
+    async for doc in docs:
+        line = json.dumps(_row(doc), ensure_ascii=False, default=_json_default)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= _CHUNK_BYTES:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def stream_export(docs: AsyncIterator[Dict], export_format: str, compress: bool = True) -> AsyncIterator[bytes]:
+    """
+    Serializar documentos de MongoDB a CSV o NDJSON por bloques de ~64 KB,
+    comprimidos con gzip de forma incremental. La memoria usada no depende
+    del número de filas.
+    """
+    encode = _encode_csv if export_format == "csv" else _encode_ndjson
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: formato gzip
+    rows = 0
+
+    async def counted():
+        nonlocal rows
+        async for doc in docs:
+            rows += 1
+            yield doc
+
+    try:
+        async for text in encode(counted()):
+            data = text.encode("utf-8")
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    except Exception as e:
+        # Las cabeceras ya se enviaron: solo se puede cortar la descarga
+        logger.error(f"Error durante la exportación tras {rows} filas: {e}")
+        raise
+
+    if compressor is not None:
+        yield compressor.flush()
+    logger.info(f"Exportación {export_format} completada: {rows} filas")
@@ -0,0 +1,40 @@
+"""
+Modo producción con varios workers:
+
+    cd backend
+    gunicorn -c gunicorn.conf.py main:app
+
+Cada worker es un proceso uvicorn con su propia conexión a MongoDB. El
+límite de OpenAI se comparte en MongoDB (OPENAI_RATE_LIMIT_RPM/TPM), el
+mantenimiento lo hace solo el líder y el live feed lee de change streams
+(STREAM_SOURCE=auto lo elige con más de un worker; write_path no arranca)
+para ver lo que escriben los demás.
+"""
+import os
+import shutil
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# main.py lo usa para elegir la fuente del live feed (STREAM_SOURCE=auto)
+os.environ["GUNICORN_WORKERS"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+# Las conexiones SSE de /api/stream son largas: no reciclar por timeout
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "0"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = None
+
+# Métricas de Prometheus agregadas entre workers
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
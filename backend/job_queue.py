@@ -0,0 +1,133 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+class JobQueue:
+    """Cola de trabajos de análisis respaldada por una colección de MongoDB"""
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.max_attempts = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+        self.backoff_base = float(os.getenv("ANALYSIS_BACKOFF_SECONDS", "2"))
+        self.backoff_max = float(os.getenv("ANALYSIS_BACKOFF_MAX_SECONDS", "300"))
+        self.lock_seconds = float(os.getenv("ANALYSIS_LOCK_SECONDS", "120"))
+
+    async def create_indexes(self):
+        """Crear índices de la cola de trabajos"""
+        await self.collection.create_index("message_id", unique=True)
+        await self.collection.create_index([("status", 1), ("next_run_at", 1)])
+        await self.collection.create_index([("status", 1), ("locked_until", 1)])
+
+    @staticmethod
+    def _new_job(
+        message_id: ObjectId, texto_mensaje: str, numero_remitente: str, now: datetime, timestamp: Optional[datetime] = None
+    ) -> Dict:
+        return {
+            "message_id": message_id,
+            "texto_mensaje": texto_mensaje,
+            "numero_remitente": numero_remitente,
+            # Hora del mensaje (no del encolado): la usa el agrupado por conversación
+            "timestamp": timestamp or now,
+            "status": "pending",
+            "attempts": 0,
+            "next_run_at": now,
+            "locked_until": None,
+            "created_at": now,
+            "last_error": None
+        }
+
+    async def enqueue(
+        self, message_id: ObjectId, texto_mensaje: str, numero_remitente: str = "", timestamp: Optional[datetime] = None
+    ) -> bool:
+        """Encolar el análisis de un mensaje. Devuelve False si ya estaba encolado"""
+        try:
+            await self.collection.insert_one(
+                self._new_job(message_id, texto_mensaje, numero_remitente, datetime.utcnow(), timestamp)
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def enqueue_many(self, messages: List[Dict]) -> int:
+        """
+        Encolar varios mensajes ({_id, texto_mensaje, numero_remitente, timestamp}) con un
+        solo insert_many desordenado. Devuelve cuántos trabajos se crearon.
+        """
+        if not messages:
+            return 0
+
+        now = datetime.utcnow()
+        jobs = [
+            self._new_job(message["_id"], message["texto_mensaje"], message.get("numero_remitente", ""), now, message.get("timestamp"))
+            for message in messages
+        ]
+        try:
+            result = await self.collection.insert_many(jobs, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            return e.details.get("nInserted", 0)
+
+    async def claim(self) -> Optional[Dict]:
+        """
+        Tomar el siguiente trabajo disponible. Los trabajos en proceso cuyo
+        bloqueo expiró (worker caído) vuelven a estar disponibles.
+        """
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_run_at": {"$lte": now}},
+                {"status": "processing", "locked_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "processing",
+                    "locked_until": now + timedelta(seconds=self.lock_seconds)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def complete(self, job: Dict):
+        """Marcar un trabajo como terminado"""
+        await self.collection.delete_one({"_id": job["_id"]})
+
+    async def complete_many(self, jobs: List[Dict]):
+        """Marcar varios trabajos como terminados con un solo delete_many"""
+        await self.collection.delete_many({"_id": {"$in": [job["_id"] for job in jobs]}})
+
+    async def fail(self, job: Dict, error: Exception, delay: Optional[float] = None) -> bool:
+        """
+        Registrar un fallo. Reprograma el trabajo con backoff exponencial (o
+        `delay` si es mayor) o lo marca como fallido si agotó los intentos.
+        Devuelve True si se reintentará.
+        """
+        attempts = job.get("attempts", 1)
+        if attempts >= self.max_attempts:
+            await self.collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "failed", "locked_until": None, "last_error": str(error)}}
+            )
+            return False
+
+        delay = max(min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max), delay or 0)
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {
+                "status": "pending",
+                "locked_until": None,
+                "next_run_at": datetime.utcnow() + timedelta(seconds=delay),
+                "last_error": str(error)
+            }}
+        )
+        return True
+
+    async def pending_count(self) -> int:
+        """Número de trabajos pendientes o en proceso"""
+        return await self.collection.count_documents({"status": {"$in": ["pending", "processing"]}})
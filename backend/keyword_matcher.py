@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicon.json")
+
+
+def _build_fold_table() -> Dict[int, Optional[str]]:
+    """
+    Tabla de traducción que quita los acentos de los caracteres latinos y
+    elimina las marcas combinantes sueltas (texto ya descompuesto)
+    """
+    table: Dict[int, Optional[str]] = {code: None for code in range(0x0300, 0x0370)}
+    for code in range(0x00C0, 0x0250):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if base != char:
+            table[code] = base
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def _build_accent_classes() -> Dict[str, str]:
+    """
+    Letra base -> clase de regex con sus variantes acentuadas de Latin-1
+    ("i" -> "[iìíîï]"). Cubre los acentos del español sin plegar el texto;
+    el resto de caracteres se pliegan antes de buscar
+    """
+    variants: Dict[str, Set[str]] = {}
+    for code, base in _FOLD_TABLE.items():
+        char = chr(code)
+        if base and len(base) == 1 and code <= 0xFF and char == char.lower():
+            variants.setdefault(base, set()).add(char)
+    return {base: "[" + base + "".join(sorted(chars)) + "]" for base, chars in variants.items()}
+
+
+_ACCENT_CLASSES = _build_accent_classes()
+_OUTSIDE_LATIN1 = re.compile(r"[^\x00-\xff]")
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas sin acentos: "Frío" -> "frio" """
+    return text.lower().translate(_FOLD_TABLE)
+
+
+class KeywordMatcher:
+    """
+    Clasificador por palabras clave compilado una sola vez. Compara palabras
+    completas sin tener en cuenta los acentos ("malo" no coincide con
+    "malograr" ni "caro" con "carolina"). Todo el léxico, frases incluidas,
+    se busca con una única regex con forma de trie y límites de palabra, que
+    recorre el texto en minúsculas sin tokenizarlo en Python
+    """
+
+    def __init__(self, lexicon: Dict):
+        self.themes: List[str] = list(lexicon["temas"].keys())
+
+        # término -> categorías a las que suma (("sentimiento", s) o ("tema", t))
+        self.terms: Dict[str, List[Tuple[str, str]]] = {}
+        for sentiment, words in lexicon["sentimiento"].items():
+            for word in words:
+                self._add_term(word, ("sentimiento", sentiment))
+        for theme, words in lexicon["temas"].items():
+            for word in words:
+                self._add_term(word, ("tema", theme))
+
+        # Aporte precalculado de cada término: (positivo, negativo, índices de tema)
+        self.weights: Dict[str, Tuple[int, int, Tuple[int, ...]]] = {}
+        for term, categories in self.terms.items():
+            self.weights[term] = (
+                int(("sentimiento", "positivo") in categories),
+                int(("sentimiento", "negativo") in categories),
+                tuple(self.themes.index(label) for kind, label in categories if kind == "tema")
+            )
+
+        self.regex = re.compile(rf"\b{self._trie_pattern(list(self.terms))}\b") if self.terms else None
+
+        # Memo de coincidencias ya plegadas a su término ("Fría" -> "fria")
+        self._matched_terms: Dict[str, str] = {}
+
+    def _add_term(self, word: str, category: Tuple[str, str]):
+        term = " ".join(fold_text(word).split())
+        categories = self.terms.setdefault(term, [])
+        if category not in categories:
+            categories.append(category)
+
+    @staticmethod
+    def _trie_pattern(terms: List[str]) -> str:
+        """
+        Alternancia de los términos agrupada por prefijos comunes
+        ("mal(?:a|o)s?"...): el motor de regex descarta cada posición del
+        texto con pocas comparaciones en lugar de probar término por término
+        """
+        trie: Dict = {}
+        for term in terms:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node: Dict) -> str:
+            branches = []
+            for char, child in sorted(node.items()):
+                if not char:
+                    continue
+                if char == " ":
+                    atom = r"\s+"
+                else:
+                    atom = _ACCENT_CLASSES.get(char) or re.escape(char)
+                branches.append(atom + build(child))
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            return f"(?:{body})?" if "" in node else body
+
+        return build(trie)
+
+    def _term(self, match: str) -> str:
+        term = self._matched_terms.get(match)
+        if term is None:
+            term = " ".join(fold_text(match).split())
+            if len(self._matched_terms) < 100000:
+                self._matched_terms[match] = term
+        return term
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "KeywordMatcher":
+        """Cargar el léxico desde un archivo JSON"""
+        with open(path or DEFAULT_LEXICON_PATH, encoding="utf-8") as lexicon_file:
+            return cls(json.load(lexicon_file))
+
+    def classify(self, message_text: str) -> Dict:
+        """Sentimiento y tema de un mensaje"""
+        return self.classify_many([message_text])[0]
+
+    def classify_many(self, messages: List[str]) -> List[Dict]:
+        """
+        Clasificar muchos mensajes: la regex se aplica al texto en minúsculas
+        y solo se pliega el texto completo si trae caracteres fuera de Latin-1
+        (otros acentos, marcas combinantes sueltas, emojis)
+        """
+        if self.regex is None:
+            return [self._score(set()) for _ in messages]
+
+        findall = self.regex.findall
+        outside_latin1 = _OUTSIDE_LATIN1.search
+        memo = self._matched_terms
+        term = self._term
+        score = self._score
+        results = []
+        for message in messages:
+            text = message.lower()
+            if not text.isascii() and outside_latin1(text):
+                text = text.translate(_FOLD_TABLE)
+            matches = findall(text)
+            results.append(score({memo.get(match) or term(match) for match in matches} if matches else ()))
+        return results
+
+    def _score(self, terms) -> Dict:
+        if not terms:
+            return {"sentimiento": "neutro", "tema": "Otro"}
+
+        positive_count = negative_count = 0
+        theme_scores = [0] * len(self.themes)
+        for term in terms:
+            positive, negative, theme_indexes = self.weights[term]
+            positive_count += positive
+            negative_count += negative
+            for index in theme_indexes:
+                theme_scores[index] += 1
+
+        if positive_count > negative_count:
+            sentiment = "positivo"
+        elif negative_count > positive_count:
+            sentiment = "negativo"
+        else:
+            sentiment = "neutro"
+
+        # Seleccionar el tema con mayor puntuación (el primero en caso de empate)
+        best = max(theme_scores) if theme_scores else 0
+        theme = self.themes[theme_scores.index(best)] if best > 0 else "Otro"
+
+        return {"sentimiento": sentiment, "tema": theme}
@@ -0,0 +1,140 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    """
+    Elección de líder por lease en MongoDB: un documento por nombre con el
+    dueño y la expiración. Solo el líder ejecuta el mantenimiento (índices,
+    reconstrucciones, compactaciones); si muere, otra réplica toma el lease
+    cuando expira.
+    """
+
+    def __init__(self, collection=None, name: str = "maintenance", lease_seconds: Optional[float] = None):
+        self.collection = collection
+        self.name = name
+        self.lease_seconds = lease_seconds or float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.elections = 0
+        self._on_elected: List[Callable[[], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+        # Callbacks de líder en curso: corren aparte para que el lease se siga
+        # renovando aunque el mantenimiento tarde más que LEADER_LEASE_SECONDS
+        self._elected_task: Optional[asyncio.Task] = None
+
+    def on_elected(self, callback: Callable[[], Awaitable[None]]):
+        """Registrar una corrutina que se ejecuta cada vez que esta réplica pasa a ser líder"""
+        self._on_elected.append(callback)
+
+    async def try_acquire(self) -> bool:
+        """Tomar o renovar el lease. Devuelve True si esta réplica es el líder"""
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease_seconds), "renewed_at": now}},
+                upsert=True
+            )
+            acquired = True
+        except DuplicateKeyError:
+            # El documento existe con otro dueño y un lease vigente
+            acquired = False
+
+        if acquired and not self.is_leader:
+            self.elections += 1
+            logger.info(f"Réplica {self.owner} elegida líder de '{self.name}'")
+        elif not acquired and self.is_leader:
+            logger.warning(f"Réplica {self.owner} perdió el liderazgo de '{self.name}'")
+        self.is_leader = acquired
+        return acquired
+
+    async def release(self):
+        """Liberar el lease (apagado ordenado) para que otra réplica lo tome ya"""
+        if self.is_leader:
+            await self.collection.delete_one({"_id": self.name, "owner": self.owner})
+            self.is_leader = False
+
+    async def run_elected(self):
+        """
+        Ejecutar los callbacks de líder en una tarea aparte y esperar a que
+        terminen. Si una ejecución anterior sigue en curso se espera a esa en
+        lugar de lanzar otra
+        """
+        self._start_elected()
+        await asyncio.shield(self._elected_task)
+
+    def _start_elected(self):
+        if self._elected_task is not None and not self._elected_task.done():
+            logger.warning(f"El mantenimiento de '{self.name}' sigue en curso: no se relanza")
+            return
+        self._elected_task = asyncio.create_task(self._run_callbacks())
+        self._elected_task.add_done_callback(self._log_elected_result)
+
+    async def _run_callbacks(self):
+        for callback in self._on_elected:
+            await callback()
+
+    def _log_elected_result(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error en el mantenimiento del líder de '{self.name}': {task.exception()}")
+
+    async def _cancel_elected(self):
+        if self._elected_task is not None and not self._elected_task.done():
+            self._elected_task.cancel()
+            try:
+                await self._elected_task
+            except BaseException:
+                pass
+
+    def start(self):
+        """Renovar el lease en segundo plano (cada tercio de su duración)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._cancel_elected()
+        try:
+            await self.release()
+        except Exception as e:
+            logger.warning(f"Error al liberar el liderazgo: {e}")
+
+    async def _run(self):
+        while True:
+            was_leader = self.is_leader
+            try:
+                is_leader = await self.try_acquire()
+                if is_leader and not was_leader:
+                    self._start_elected()
+                elif was_leader and not is_leader:
+                    # Sin lease otra réplica puede empezar el mismo mantenimiento
+                    await self._cancel_elected()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en la elección de líder: {e}")
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "elections": self.elections
+        }
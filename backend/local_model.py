@@ -0,0 +1,192 @@
+import os
+import logging
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# scikit-learn/joblib son opcionales (requirements-ml.txt)
+try:
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "local_classifier.joblib")
+
+# Modelo cargado en cada proceso del pool
+_bundle = None
+
+
+def _load_bundle(path: str):
+    global _bundle
+    _bundle = joblib.load(path)
+
+
+def _predict(texts: List[str]) -> List[Dict]:
+    """Predicción en el proceso del pool: etiqueta y probabilidad de cada cabeza"""
+    results = [{} for _ in texts]
+    for field in ("sentimiento", "tema"):
+        pipeline = _bundle[field]
+        probabilities = pipeline.predict_proba(texts)
+        classes = pipeline.classes_
+        for result, row in zip(results, probabilities):
+            best = row.argmax()
+            result[field] = str(classes[best])
+            result[f"confianza_{field}"] = float(row[best])
+    return results
+
+
+def build_pipeline():
+    """TF-IDF de n-gramas de caracteres + regresión logística (CPU, liviano)"""
+    return make_pipeline(
+        TfidfVectorizer(
+            analyzer="char_wb",
+            ngram_range=(2, 5),
+            min_df=2,
+            sublinear_tf=True,
+            strip_accents="unicode",
+            lowercase=True
+        ),
+        LogisticRegression(max_iter=1000, class_weight="balanced")
+    )
+
+
+def train_bundle(texts: List[str], sentiments: List[str], themes: List[str]) -> Dict:
+    """Entrenar las dos cabezas (sentimiento y tema) sobre los mismos textos"""
+    sentiment_model = build_pipeline().fit(texts, sentiments)
+    theme_model = build_pipeline().fit(texts, themes)
+    return {
+        "sentimiento": sentiment_model,
+        "tema": theme_model,
+        "n_samples": len(texts),
+        "trained_at": datetime.utcnow().isoformat()
+    }
+
+
+class LocalClassifier:
+    """
+    Clasificador local (sin red) que corre en un pool de procesos. Devuelve
+    sentimiento/tema con su confianza; los mensajes por debajo del umbral se
+    escalan a OpenAI.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, workers: Optional[int] = None, min_confidence: Optional[float] = None):
+        self.model_path = model_path or os.getenv("LOCAL_MODEL_PATH") or DEFAULT_MODEL_PATH
+        self.workers = workers or int(os.getenv("LOCAL_MODEL_WORKERS", "2"))
+        self.min_confidence = min_confidence if min_confidence is not None else float(os.getenv("LOCAL_MODEL_MIN_CONFIDENCE", "0.8"))
+        self.enabled = os.getenv("LOCAL_MODEL_ENABLED", "true").lower() == "true"
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.accepted = 0
+        self.escalated = 0
+
+    @property
+    def available(self) -> bool:
+        return self.pool is not None
+
+    def start(self):
+        """Crear el pool de procesos si el modelo y scikit-learn están disponibles"""
+        if self.pool is not None or not self.enabled:
+            return
+        if not SKLEARN_AVAILABLE:
+            logger.warning("scikit-learn no está instalado. Clasificador local desactivado")
+            return
+        if not os.path.exists(self.model_path):
+            logger.warning(f"Modelo local no encontrado en {self.model_path}. Clasificador local desactivado")
+            return
+
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_load_bundle,
+            initargs=(self.model_path,)
+        )
+        logger.info(f"Clasificador local iniciado ({self.workers} procesos, umbral {self.min_confidence})")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    async def classify_many(self, texts: List[str]) -> List[Dict]:
+        """Clasificar un lote repartido entre los procesos del pool"""
+        if not texts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        chunk = max(1, -(-len(texts) // self.workers))
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, _predict, texts[i:i + chunk])
+            for i in range(0, len(texts), chunk)
+        ))
+        results = [result for part in parts for result in part]
+        for result in results:
+            result["confianza"] = min(result["confianza_sentimiento"], result["confianza_tema"])
+        return results
+
+    def is_confident(self, result: Dict) -> bool:
+        return result["confianza"] >= self.min_confidence
+
+    def stats(self) -> Dict:
+        return {
+            "available": self.available,
+            "min_confidence": self.min_confidence,
+            "accepted": self.accepted,
+            "escalated": self.escalated
+        }
+
+
+async def train_from_database(database, output_path: Optional[str] = None, limit: int = 0, test_size: float = 0.2) -> Dict:
+    """
+    Entrenar el modelo local con los mensajes ya etiquetados en MongoDB y
+    exportarlo con joblib. Se excluyen las etiquetas del propio modelo local y
+    del análisis básico para no reentrenar sobre sus errores.
+    """
+    if not SKLEARN_AVAILABLE:
+        raise RuntimeError("scikit-learn no está instalado (pip install -r requirements-ml.txt)")
+
+    from sklearn.model_selection import train_test_split
+
+    query = {
+        "sentimiento": {"$in": ["positivo", "negativo", "neutro"]},
+        "tema": {"$ne": None},
+        "analysis_source": {"$nin": ["local", "fallback"]}
+    }
+    projection = {"texto_mensaje": 1, "sentimiento": 1, "tema": 1}
+    cursor = database.collection.find(query, projection).sort("_id", -1).batch_size(5000)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    texts, sentiments, themes = [], [], []
+    async for doc in cursor:
+        texts.append(doc["texto_mensaje"])
+        sentiments.append(doc["sentimiento"])
+        themes.append(doc["tema"])
+
+    if len(texts) < 20 or len(set(sentiments)) < 2 or len(set(themes)) < 2:
+        raise ValueError(f"Datos insuficientes para entrenar: {len(texts)} mensajes etiquetados")
+    logger.info(f"Entrenando modelo local con {len(texts)} mensajes etiquetados")
+
+    metrics = {}
+    if test_size > 0:
+        split = train_test_split(texts, sentiments, themes, test_size=test_size, random_state=42)
+        train_texts, test_texts, train_sentiments, test_sentiments, train_themes, test_themes = split
+        evaluation = await asyncio.to_thread(train_bundle, train_texts, train_sentiments, train_themes)
+        metrics = {
+            "accuracy_sentimiento": float(evaluation["sentimiento"].score(test_texts, test_sentiments)),
+            "accuracy_tema": float(evaluation["tema"].score(test_texts, test_themes))
+        }
+        logger.info(f"Evaluación: sentimiento={metrics['accuracy_sentimiento']:.3f} tema={metrics['accuracy_tema']:.3f}")
+
+    bundle = await asyncio.to_thread(train_bundle, texts, sentiments, themes)
+    bundle["metrics"] = metrics
+
+    output_path = output_path or os.getenv("LOCAL_MODEL_PATH") or DEFAULT_MODEL_PATH
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    await asyncio.to_thread(joblib.dump, bundle, output_path)
+    logger.info(f"Modelo local exportado en {output_path}")
+    return {"path": output_path, "n_samples": len(texts), **metrics}
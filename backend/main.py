@@ -1,22 +1,73 @@
-from fastapi import FastAPI, HTTPException, Form, Request
+from fastapi import FastAPI, HTTPException, Form, Request, Query, UploadFile, File, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import logging
+import asyncio
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Union
 import json
 from dotenv import load_dotenv
 
-from database import Database
-from ai_analyzer import AIAnalyzer
-from models import MessageCreate, MessageResponse, SentimentStats, ThemeStats
+from database import Database, encode_cursor
+from ai_analyzer import AIAnalyzer, MicroBatcher
+from local_model import LocalClassifier
+from worker import AnalysisWorkerPool
+from broadcaster import Broadcaster
+from chat_import import ChatImporter, file_fingerprint
+from dedup import RecentSids
+from response_cache import ResponseCache
+from exporter import EXPORT_PROJECTION, stream_export
+from reanalysis import ReanalysisJob
+from log_config import setup_logging
+from metrics import WEBHOOK_DUPLICATES, in_flight, render as render_metrics, stage
+from models import MessageCreate, MessageResponse, MessagePage, SentimentStats, ThemeStats, TrendPoint, ReanalysisRequest, SenderSummary, SearchResult
+
+logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
 load_dotenv()
+setup_logging()
 
 # Inicializar servicios
 database = Database()
-ai_analyzer = AIAnalyzer()
+ai_analyzer = AIAnalyzer(
+    cache=database.analysis_cache,
+    local_model=LocalClassifier(),
+    rate_limiter=database.rate_limiter
+)
+analysis_batcher = MicroBatcher(ai_analyzer)
+worker_pool = AnalysisWorkerPool(database, analysis_batcher)
+run_workers_in_process = os.getenv("ANALYSIS_WORKERS_IN_PROCESS", "true").lower() == "true"
+
+# Live feed: "write_path" publica desde este proceso; "change_stream" lee de
+# MongoDB (replica set) y cubre también workers en procesos separados.
+# "auto" elige change_stream si gunicorn arranca más de un worker
+broadcaster = Broadcaster()
+web_workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+stream_source = os.getenv("STREAM_SOURCE", "auto")
+if stream_source == "auto":
+    stream_source = "change_stream" if web_workers > 1 else "write_path"
+elif stream_source == "write_path" and web_workers > 1:
+    raise RuntimeError(
+        f"STREAM_SOURCE=write_path con {web_workers} workers: cada worker solo vería sus propias "
+        "escrituras en el live feed. Usar STREAM_SOURCE=change_stream (o auto) o WEB_CONCURRENCY=1"
+    )
+if stream_source == "write_path":
+    database.add_listener(broadcaster.publish)
+
+# Corte rápido de reintentos del webhook antes de tocar MongoDB
+recent_sids = RecentSids()
+
+# Respuestas de lectura del dashboard, invalidadas por la versión de datos
+response_cache = ResponseCache()
+
+# Importaciones y reanálisis en segundo plano lanzados desde la API
+import_tasks = set()
+reanalysis_tasks = set()
 
 # Inicializar conexiones (eventos de startup/shutdown movidos a lifespan)
 from contextlib import asynccontextmanager
@@ -26,19 +77,41 @@ async def lifespan(app: FastAPI):
     # Startup - MongoDB connection
     try:
         await database.connect()
-        print("Conectado a la base de datos MongoDB al iniciar la aplicación")
+        logger.info("Conectado a la base de datos MongoDB al iniciar la aplicación")
     except Exception as e:
-        print(f"CRITICAL: No se pudo conectar a MongoDB: {e}")
-        print("La aplicación no puede iniciarse sin conexión a la base de datos")
+        logger.critical(f"CRITICAL: No se pudo conectar a MongoDB: {e}")
+        logger.critical("La aplicación no puede iniciarse sin conexión a la base de datos")
         raise e
 
+    # Renovación del lease de líder (mantenimiento en una sola réplica)
+    database.leader.start()
+    # Archivado periódico de mensajes antiguos (solo actúa en el líder)
+    database.archive.start(database.leader)
+
+    # Cliente OpenAI compartido (pool de conexiones keep-alive)
+    await ai_analyzer.start()
+
+    if stream_source == "change_stream":
+        broadcaster.start_change_streams(database.collection, database.stats)
+
+    # Workers de análisis en este proceso (o por separado con `python -m worker`)
+    if run_workers_in_process:
+        worker_pool.start()
+
     yield
     
-    # Shutdown
+    # Shutdown (los workers analizan antes de salir las ventanas de conversación abiertas)
+    if run_workers_in_process:
+        await worker_pool.stop()
+
+    await analysis_batcher.close()
+    await ai_analyzer.close()
+    await broadcaster.stop()
+
     try:
         await database.disconnect()
     except Exception as e:
-        print(f"Error al desconectar de la base de datos: {e}")
+        logger.error(f"Error al desconectar de la base de datos: {e}")
 
 # Crear app con lifespan
 app = FastAPI(
@@ -70,9 +143,14 @@ async def whatsapp_webhook(request: Request):
     """
     Webhook para recibir mensajes de WhatsApp desde Twilio
     """
+    with in_flight("webhook"), stage("webhook"):
+        return await _handle_webhook(request)
+
+async def _handle_webhook(request: Request) -> Response:
     try:
         # Obtener datos del formulario (Twilio)
-        form_data = await request.form()
+        with stage("form_parse"):
+            form_data = await request.form()
         
         # Extraer información del mensaje
         message_body = form_data.get("Body", "")
@@ -81,6 +159,12 @@ async def whatsapp_webhook(request: Request):
         
         if not message_body or not sender_number:
             raise HTTPException(status_code=400, detail="Missing required fields")
+
+        # Reintento de Twilio de un mensaje ya recibido: responder sin reprocesar
+        if recent_sids.seen(message_sid):
+            WEBHOOK_DUPLICATES.labels("memory").inc()
+            return Response(content="<?xml version='1.0' encoding='UTF-8'?><Response></Response>", 
+                           media_type="application/xml")
         
         # Crear el objeto del mensaje
         message_data = MessageCreate(
@@ -91,57 +175,404 @@ async def whatsapp_webhook(request: Request):
         )
         
         # Guardar mensaje en la base de datos
-        message_id = await database.save_message(message_data.dict())
+        with stage("save_message"):
+            message_id = await database.save_message(message_data.dict())
         
-        # Analizar el mensaje con IA en segundo plano
-        try:
-            analysis = await ai_analyzer.analyze_message(message_body)
-            await database.update_message_analysis(message_id, analysis)
-        except Exception as e:
-            print(f"Error analyzing message: {e}")
-            # El mensaje se guarda aunque falle el análisis
+        if message_id is None:
+            # Ya estaba guardado (reintento que no pasó por este proceso). Si
+            # sigue pendiente puede que el intento anterior no llegara a
+            # encolarlo: enqueue es idempotente por message_id
+            recent_sids.database_duplicates += 1
+            WEBHOOK_DUPLICATES.labels("database").inc()
+            pending = await database.find_pending_message(message_sid) if message_sid else None
+            if pending is not None:
+                with stage("enqueue"):
+                    if await database.jobs.enqueue(
+                        pending["_id"], pending["texto_mensaje"], pending.get("numero_remitente", ""), pending.get("timestamp")
+                    ):
+                        logger.info(f"Análisis del mensaje {pending['_id']} encolado en el reintento de Twilio")
+                worker_pool.notify()
+        else:
+            # Encolar el análisis; los workers lo procesan fuera de la petición.
+            # Si falla se responde 500 para que Twilio reintente y el reintento
+            # encole el mensaje ya guardado
+            with stage("enqueue"):
+                await database.jobs.enqueue(message_id, message_body, sender_number, message_data.timestamp)
+            worker_pool.notify()
+        # Solo se recuerda el SID cuando el mensaje quedó guardado y encolado
+        recent_sids.remember(message_sid)
         
         # Respuesta requerida por Twilio 
         return Response(content="<?xml version='1.0' encoding='UTF-8'?><Response></Response>", 
                        media_type="application/xml")
         
     except Exception as e:
-        print(f"Error al procesar webhook: {e}")
+        logger.error(f"Error al procesar webhook: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/messages", response_model=List[MessageResponse])
-async def get_messages(limit: int = 50, skip: int = 0):
+async def cached_json_response(request: Request, build, encode: bool = True) -> Response:
     """
-    Obtener mensajes recientes con análisis
+    Servir una lectura desde la caché de respuestas. `build` devuelve
+    (contenido, headers) y solo se llama si cambió la versión de datos.
+    Si el cliente envía un If-None-Match vigente se responde 304 sin cuerpo.
+    Con encode=False el contenido ya son dicts/listas planos y orjson los
+    serializa directamente, sin pasar por jsonable_encoder.
+    """
+    key = request.url.path + "?" + request.url.query
+    version = await database.get_data_version()
+    entry = response_cache.get(key, version)
+    if entry is None:
+        content, headers = await build()
+        body = ORJSONResponse(content=jsonable_encoder(content) if encode else content).body
+        entry = response_cache.put(key, version, body, headers)
+
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.matches(request.headers.get("if-none-match")):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@app.get("/api/messages", response_model=Union[MessagePage, List[MessageResponse]])
+async def get_messages(request: Request, limit: int = 50, skip: int = 0, before: Optional[str] = None):
+    """
+    Obtener mensajes recientes con análisis.
+
+    Sin `before` se pagina con skip y se devuelve la lista (compatibilidad).
+    Con `before` (vacío para la primera página) se usa paginación por cursor y
+    se devuelve {"items", "next_cursor"}; es la opción rápida para scroll
+    infinito y exportaciones.
     """
+    async def build():
+        # Camino rápido: proyección + dicts planos serializados una sola vez
+        # con orjson (la forma es la de MessageResponse, sin validar por fila)
+        rows = await database.get_message_rows(limit=limit, skip=skip, before=before)
+        headers = {}
+        next_cursor = None
+        if len(rows) == limit and rows:
+            next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+            headers["X-Next-Cursor"] = next_cursor
+
+        if before is not None:
+            return {"items": rows, "next_cursor": next_cursor}, headers
+        return rows, headers
+
     try:
-        messages = await database.get_messages(limit=limit, skip=skip)
-        return messages
+        return await cached_json_response(request, build, encode=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sentiments", response_model=SentimentStats)
-async def get_sentiment_stats():
+async def get_sentiment_stats(request: Request):
     """
     Obtener estadísticas de sentimientos
     """
+    async def build():
+        return await database.get_sentiment_stats(), {}
+
     try:
-        stats = await database.get_sentiment_stats()
-        return stats
+        return await cached_json_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/themes", response_model=List[ThemeStats])
-async def get_theme_stats():
+async def get_theme_stats(request: Request):
     """
     Obtener estadísticas de temas
     """
+    async def build():
+        return await database.get_theme_stats(), {}
+
+    try:
+        return await cached_json_response(request, build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/trends", response_model=List[TrendPoint])
+async def get_trends(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    tema: Optional[str] = None,
+    numero_remitente: Optional[str] = None
+):
+    """
+    Obtener la tendencia de sentimientos por hora, día o semana (por defecto
+    los últimos 30 días), opcionalmente filtrada por tema o remitente (este
+    solo por día o semana)
+    """
+    try:
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(days=30)
+        return await database.get_trends(start, end, bucket, tema, numero_remitente)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/search", response_model=SearchResult)
+async def search_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    sentimiento: Optional[str] = None,
+    tema: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0, le=10000)
+):
+    """
+    Buscar en el texto y el resumen de los mensajes (índice de texto en
+    español: "mesero" encuentra "meseros"; frases entre comillas, -palabra
+    excluye). Devuelve la página de resultados y los conteos por
+    sentimiento y tema
+    """
+    async def build():
+        return await database.search_messages(q, sentimiento, tema, start, end, limit, skip), {}
+
+    try:
+        return await cached_json_response(request, build)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/senders", response_model=List[SenderSummary])
+async def get_senders(
+    request: Request,
+    sort: str = Query("total", pattern="^(total|ultimo_contacto|negativos)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    min_negativos: Optional[int] = Query(None, ge=1),
+    dias: int = Query(7, ge=1, le=365)
+):
+    """
+    Obtener los remitentes con más mensajes, más recientes o más negativos.
+    Con `min_negativos` lista los que tienen al menos esa cantidad de
+    mensajes negativos en los últimos `dias` (seguimiento de clientes)
+    """
+    async def build():
+        return await database.get_senders(sort, limit, min_negativos, dias), {}
+
+    try:
+        return await cached_json_response(request, build)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/senders/{numero}", response_model=SenderSummary)
+async def get_sender(numero: str, dias: int = Query(7, ge=1, le=365)):
+    """
+    Obtener el resumen de un remitente: mensajes, sentimientos y último contacto
+    """
+    try:
+        summary = await database.get_sender(numero, dias)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Remitente no encontrado")
+    return summary
+
+@app.get("/api/export")
+async def export_messages(
+    request: Request,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    sentimiento: Optional[str] = None,
+    tema: Optional[str] = None
+):
+    """
+    Exportar mensajes y análisis en CSV o NDJSON. Las filas se leen del
+    cursor y se envían por bloques (comprimidos con gzip si el cliente lo
+    acepta), sin cargar el resultado completo en memoria
+    """
+    try:
+        cursor = database.iter_messages(start, end, sentimiento, tema, projection=EXPORT_PROJECTION)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    filename = f"mensajes_{datetime.utcnow():%Y%m%d_%H%M%S}.{'csv' if export_format == 'csv' else 'ndjson'}"
+    # La respuesta cambia según Accept-Encoding: las cachés no deben servir
+    # la versión gzip a un cliente que no la pidió (ni al revés)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        stream_export(cursor, export_format, compress=compress),
+        media_type="text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson",
+        headers=headers
+    )
+
+def require_admin(token: Optional[str]):
+    """Los endpoints de administración exigen X-Admin-Token = ADMIN_TOKEN"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or token != expected:
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+@app.post("/api/import")
+async def import_chat_export(
+    file: UploadFile = File(...),
+    remitente: Optional[str] = Form(None),
+    analizar: bool = Form(True),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Importar un export de chat de WhatsApp (.txt o .zip). El archivo se guarda
+    en disco y se procesa en segundo plano; consultar el progreso en
+    /api/import/{import_id}. Requiere X-Admin-Token
+    """
+    require_admin(x_admin_token)
+    try:
+        suffix = os.path.splitext(file.filename or "")[1] or ".txt"
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=os.getenv("IMPORT_DIR") or None) as target:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, target, 1024 * 1024)
+            path = target.name
+
+        import_id = file_fingerprint(path)
+        importer = ChatImporter(database, enqueue_analysis=analizar)
+
+        async def run_import():
+            try:
+                await importer.run(path, import_id=import_id, remitente=remitente, source_name=file.filename)
+                worker_pool.notify()
+            except Exception as e:
+                logger.error(f"Error en la importación {import_id}: {e}")
+            finally:
+                os.unlink(path)
+
+        task = asyncio.create_task(run_import())
+        import_tasks.add(task)
+        task.add_done_callback(import_tasks.discard)
+
+        return {"import_id": import_id, "status": "running"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/import/{import_id}")
+async def get_import_status(import_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Estado y progreso de una importación
+    """
+    require_admin(x_admin_token)
+    state = await database.imports.find_one({"_id": import_id})
+    if not state:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    state["import_id"] = state.pop("_id")
+    return state
+
+@app.post("/api/admin/reanalysis")
+async def start_reanalysis(request: ReanalysisRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Reanalizar mensajes existentes (versión de análisis obsoleta, campos
+    faltantes, estados). Con dry_run devuelve el número de mensajes y el
+    coste estimado; si no, lanza el reanálisis en segundo plano, consultable
+    en /api/admin/reanalysis/{job_id}
+    """
+    require_admin(x_admin_token)
     try:
-        stats = await database.get_theme_stats()
-        return stats
+        job = ReanalysisJob(
+            database,
+            ai_analyzer,
+            job_id=request.job_id,
+            filters=request.filters(),
+            chunk_size=request.chunk_size,
+            concurrency=request.concurrency,
+            limit=request.limit
+        )
+        if request.dry_run:
+            return await job.estimate()
+
+        async def run_reanalysis():
+            try:
+                await job.run()
+            except Exception as e:
+                logger.error(f"Error en el reanálisis {job.job_id}: {e}")
+
+        task = asyncio.create_task(run_reanalysis())
+        reanalysis_tasks.add(task)
+        task.add_done_callback(reanalysis_tasks.discard)
+
+        return {"job_id": job.job_id, "status": "running"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/admin/reanalysis/{job_id}")
+async def get_reanalysis_status(job_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Estado, progreso y ETA de un reanálisis
+    """
+    require_admin(x_admin_token)
+    state = await database.reanalysis.find_one({"_id": job_id})
+    if not state:
+        raise HTTPException(status_code=404, detail="Reanálisis no encontrado")
+    state["job_id"] = state.pop("_id")
+    state["last_id"] = str(state["last_id"]) if state.get("last_id") else None
+    return state
+
+@app.get("/api/admin/archives")
+async def list_archives(x_admin_token: Optional[str] = Header(None)):
+    """
+    Archivos fríos de mensajes antiguos: mes, rango de fechas, mensajes y tamaño
+    """
+    require_admin(x_admin_token)
+    try:
+        parts = await database.archive.list_parts()
+        return {"archive": database.archive.stats(), "parts": parts}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/archives/restore")
+async def restore_archives(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Devolver a MongoDB los mensajes archivados con timestamp en [from, to).
+    Para rangos grandes conviene `python manage.py restore-archive`
+    """
+    require_admin(x_admin_token)
+    try:
+        restored = await database.archive.restore(start, end)
+        return {"restored": restored}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/stream")
+async def stream_events(request: Request):
+    """
+    Live feed (Server-Sent Events) de mensajes nuevos/analizados y deltas de
+    estadísticas. Los clientes lentos reciben un evento `resync`.
+    """
+    heartbeat = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    subscriber = broadcaster.subscribe()
+
+    async def event_generator():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+                    yield Broadcaster.format_sse(message)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/test-message")
 async def test_message(message: str = Form(...), sender: str = Form(...)):
     """
@@ -158,8 +589,8 @@ async def test_message(message: str = Form(...), sender: str = Form(...)):
         # Guardar mensaje
         message_id = await database.save_message(message_data.dict())
         
-        # Analizar mensaje
-        analysis = await ai_analyzer.analyze_message(message)
+        # Analizar mensaje (agrupado con otros mensajes en curso)
+        analysis = await analysis_batcher.submit(message)
         await database.update_message_analysis(message_id, analysis)
 
         return {"message": "Mensaje procesado correctamente", "id": str(message_id)}
@@ -167,6 +598,13 @@ async def test_message(message: str = Form(...), sender: str = Form(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Obtener aciertos y fallos de la caché de análisis
+    """
+    return {**database.analysis_cache.stats(), "version": ai_analyzer.version}
+
 @app.get("/webhook/test")
 async def test_webhook():
     """Endpoint para probar que el webhook está funcionando"""
@@ -176,6 +614,12 @@ async def test_webhook():
         "status": "ok"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/config/check")
 async def check_config():
     """Verificar configuración de las APIs"""
@@ -185,7 +629,30 @@ async def check_config():
             "phone_number": bool(os.getenv("TWILIO_PHONE_NUMBER"))
         },
         "openai": {
-            "configured": bool(os.getenv("OPENAI_API_KEY"))
+            "configured": bool(os.getenv("OPENAI_API_KEY")),
+            "call_timeout_seconds": ai_analyzer.call_timeout,
+            "hedge_after_seconds": ai_analyzer.hedge_after,
+            "circuit_breaker": ai_analyzer.breaker.stats()
+        },
+        "local_model": ai_analyzer.local_model.stats(),
+        "webhook_dedup": recent_sids.stats(),
+        "response_cache": response_cache.stats(),
+        "leader": database.leader.stats(),
+        "archive": database.archive.stats(),
+        "openai_rate_limit": database.rate_limiter.stats(),
+        "analysis_queue": {
+            "workers_in_process": run_workers_in_process,
+            "workers": worker_pool.concurrency,
+            "max_attempts": database.jobs.max_attempts,
+            # Con el circuito abierto se guarda el análisis local/básico y el
+            # trabajo se reprograma para mejorarlo cuando vuelva OpenAI
+            "circuit_open_policy": "fallback_then_retry",
+            "deferred_for_upgrade": worker_pool.deferred,
+            "conversation_windows": worker_pool.coalescer.stats()
+        },
+        "stream": {
+            "source": stream_source,
+            **broadcaster.stats()
         },
         "database": {
             "connected": database.client is not None,
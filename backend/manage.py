@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+
+from database import Database
+from chat_import import ChatImporter
+from log_config import setup_logging
+
+
+async def rebuild_stats(args):
+    """Recalcular las estadísticas materializadas desde los mensajes"""
+    database = Database()
+    await database.connect()
+    try:
+        await database.rebuild_stats()
+    finally:
+        await database.disconnect()
+
+
+async def backfill_trends(args):
+    """Reconstruir los rollups de tendencias desde los mensajes existentes"""
+    database = Database()
+    await database.connect()
+    try:
+        await database.trends.backfill(database.collection, chunk_size=args.chunk_size, archived=database.archive.iter_documents())
+    finally:
+        await database.disconnect()
+
+
+async def import_chat(args):
+    """Importar exports de WhatsApp (.txt/.zip) en streaming, reanudables"""
+    database = Database()
+    await database.connect()
+    try:
+        importer = ChatImporter(
+            database,
+            chunk_size=args.chunk_size,
+            enqueue_analysis=not args.no_analysis,
+            dayfirst=not args.monthfirst
+        )
+        for path in args.paths:
+            await importer.run(path, import_id=args.import_id, remitente=args.remitente)
+    finally:
+        await database.disconnect()
+
+
+async def train_local_model(args):
+    """Entrenar y exportar el clasificador local con mensajes ya etiquetados"""
+    from local_model import train_from_database
+
+    database = Database()
+    await database.connect()
+    try:
+        await train_from_database(database, output_path=args.output, limit=args.limit, test_size=args.test_size)
+    finally:
+        await database.disconnect()
+
+
+async def reanalyze(args):
+    """Reanalizar mensajes existentes en bloques, con checkpoint reanudable"""
+    from ai_analyzer import AIAnalyzer
+    from local_model import LocalClassifier
+    from reanalysis import ReanalysisJob
+
+    database = Database()
+    ai_analyzer = AIAnalyzer(
+        cache=database.analysis_cache,
+        local_model=LocalClassifier(),
+        rate_limiter=database.rate_limiter
+    )
+    await database.connect()
+    await ai_analyzer.start()
+    try:
+        job = ReanalysisJob(
+            database,
+            ai_analyzer,
+            job_id=args.job_id,
+            filters={
+                "version_obsoleta": args.stale_version,
+                "campos_faltantes": args.missing,
+                "estados": args.estado,
+                "desde": args.desde,
+                "hasta": args.hasta,
+                "sentimiento": args.sentimiento,
+                "tema": args.tema
+            },
+            chunk_size=args.chunk_size,
+            concurrency=args.concurrency,
+            limit=args.limit
+        )
+        result = await (job.estimate() if args.dry_run else job.run())
+        print(json.dumps(result, default=str, ensure_ascii=False, indent=2))
+    finally:
+        await ai_analyzer.close()
+        await database.disconnect()
+
+
+async def archive_messages(args):
+    """Mover a archivos fríos los mensajes más antiguos que ARCHIVE_AFTER_DAYS"""
+    database = Database()
+    await database.connect()
+    try:
+        if args.after_days is not None:
+            database.archive.after_days = args.after_days
+        if not database.archive.enabled:
+            print("Archivado desactivado: definir ARCHIVE_AFTER_DAYS o --after-days")
+            return
+        archived = await database.archive.archive_old()
+        print(f"{archived} mensajes archivados en {database.archive.directory}")
+    finally:
+        await database.disconnect()
+
+
+async def restore_archive(args):
+    """Devolver a MongoDB los mensajes archivados de un rango de fechas"""
+    database = Database()
+    await database.connect()
+    try:
+        restored = await database.archive.restore(args.desde, args.hasta)
+        print(f"{restored} mensajes restaurados")
+    finally:
+        await database.disconnect()
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento del backend")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-stats", help="Reconstruir estadísticas de sentimientos y temas").set_defaults(handler=rebuild_stats)
+
+    backfill = subparsers.add_parser("backfill-trends", help="Reconstruir los rollups de /api/trends")
+    backfill.add_argument("--chunk-size", type=int, default=None, help="Mensajes por bloque (memoria acotada)")
+    backfill.set_defaults(handler=backfill_trends)
+
+    importer = subparsers.add_parser("import-chat", help="Importar exports de chats de WhatsApp (.txt o .zip)")
+    importer.add_argument("paths", nargs="+", help="Archivos de export")
+    importer.add_argument("--chunk-size", type=int, default=None, help="Mensajes por bloque de inserción")
+    importer.add_argument("--import-id", default=None, help="Id de checkpoint (por defecto, huella del archivo)")
+    importer.add_argument("--remitente", default=None, help="Usar este número como remitente de todos los mensajes")
+    importer.add_argument("--no-analysis", action="store_true", help="No encolar el análisis de los mensajes importados")
+    importer.add_argument("--monthfirst", action="store_true", help="Fechas en formato mes/día")
+    importer.set_defaults(handler=import_chat)
+
+    trainer = subparsers.add_parser("train-local-model", help="Entrenar el clasificador local desde MongoDB")
+    trainer.add_argument("--output", default=None, help="Ruta del modelo exportado (por defecto LOCAL_MODEL_PATH)")
+    trainer.add_argument("--limit", type=int, default=0, help="Máximo de mensajes más recientes a usar (0 = todos)")
+    trainer.add_argument("--test-size", type=float, default=0.2, help="Fracción reservada para evaluación")
+    trainer.set_defaults(handler=train_local_model)
+
+    reanalysis = subparsers.add_parser("reanalyze", help="Reanalizar mensajes existentes (reanudable con --job-id)")
+    reanalysis.add_argument("--job-id", default=None, help="Id de checkpoint; repetirlo reanuda el reanálisis")
+    reanalysis.add_argument("--stale-version", action="store_true", help="Mensajes analizados con otra versión de prompt/modelo")
+    reanalysis.add_argument("--missing", action="store_true", help="Mensajes sin sentimiento, tema o resumen")
+    reanalysis.add_argument("--estado", action="append", default=[], help="Estado de análisis a incluir (repetible)")
+    reanalysis.add_argument("--from", dest="desde", type=datetime.fromisoformat, default=None, help="Desde (ISO 8601)")
+    reanalysis.add_argument("--to", dest="hasta", type=datetime.fromisoformat, default=None, help="Hasta, exclusivo (ISO 8601)")
+    reanalysis.add_argument("--sentimiento", default=None, help="Solo mensajes con este sentimiento")
+    reanalysis.add_argument("--tema", default=None, help="Solo mensajes con este tema")
+    reanalysis.add_argument("--chunk-size", type=int, default=None, help="Mensajes por bloque y checkpoint")
+    reanalysis.add_argument("--concurrency", type=int, default=None, help="Lotes de OpenAI simultáneos")
+    reanalysis.add_argument("--limit", type=int, default=0, help="Máximo de mensajes (0 = todos)")
+    reanalysis.add_argument("--dry-run", action="store_true", help="Solo contar mensajes y estimar tokens y coste")
+    reanalysis.set_defaults(handler=reanalyze)
+
+    archiver = subparsers.add_parser("archive-messages", help="Archivar en disco los mensajes antiguos (comprimidos por mes)")
+    archiver.add_argument("--after-days", type=float, default=None, help="Antigüedad mínima en días (por defecto ARCHIVE_AFTER_DAYS)")
+    archiver.set_defaults(handler=archive_messages)
+
+    restorer = subparsers.add_parser("restore-archive", help="Restaurar mensajes archivados de un rango de fechas")
+    restorer.add_argument("--from", dest="desde", type=datetime.fromisoformat, required=True, help="Desde (ISO 8601)")
+    restorer.add_argument("--to", dest="hasta", type=datetime.fromisoformat, required=True, help="Hasta, exclusivo (ISO 8601)")
+    restorer.set_defaults(handler=restore_archive)
+
+    args = parser.parse_args()
+    setup_logging()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from pymongo import monitoring
+
+# Buckets de latencia: desde operaciones de Mongo (ms) hasta llamadas a OpenAI (s)
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Duración de cada etapa del pipeline de mensajes",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "pipeline_in_flight",
+    "Operaciones en curso por tipo",
+    ["kind"],
+    multiprocess_mode="livesum"
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total",
+    "Tokens consumidos en OpenAI",
+    ["kind"]
+)
+OPENAI_ERRORS = Counter(
+    "openai_errors_total",
+    "Errores de llamadas a OpenAI o de sus respuestas",
+    ["reason"]
+)
+OPENAI_HEDGES = Counter(
+    "openai_hedged_requests_total",
+    "Peticiones duplicadas a OpenAI porque la primera tardaba demasiado"
+)
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)",
+    ["name"],
+    multiprocess_mode="livemax"
+)
+CIRCUIT_REJECTED = Counter(
+    "circuit_breaker_rejected_total",
+    "Llamadas resueltas con el fallback sin intentarlas por el circuito abierto",
+    ["name"]
+)
+ANALYSIS_FALLBACKS = Counter(
+    "analysis_fallbacks_total",
+    "Mensajes resueltos con el análisis básico por palabras clave"
+)
+LOCAL_MODEL_DECISIONS = Counter(
+    "local_model_decisions_total",
+    "Predicciones del clasificador local aceptadas o escaladas a OpenAI",
+    ["decision"]
+)
+ANALYSIS_JOBS = Counter(
+    "analysis_jobs_total",
+    "Trabajos de análisis procesados por resultado",
+    ["result"]
+)
+ANALYSIS_WINDOW_MESSAGES = Histogram(
+    "analysis_window_messages",
+    "Mensajes por ventana de conversación analizada en conjunto",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+ARCHIVE_MESSAGES = Counter(
+    "archive_messages_total",
+    "Mensajes movidos a los archivos fríos o restaurados desde ellos",
+    ["operation"]
+)
+WEBHOOK_DUPLICATES = Counter(
+    "webhook_duplicates_total",
+    "Reintentos del webhook descartados",
+    ["path"]
+)
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_seconds",
+    "Duración de los comandos de MongoDB",
+    ["command"],
+    buckets=_LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "Comandos de MongoDB fallidos",
+    ["command"]
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Medir una etapa del pipeline: `with stage("save_message"): ...`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+def in_flight(kind: str):
+    """Context manager que cuenta operaciones en curso"""
+    return IN_FLIGHT.labels(kind).track_inprogress()
+
+
+def record_openai_usage(usage):
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    OPENAI_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Listener de comandos de pymongo/motor: duración por tipo de comando"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name).inc()
+
+
+def render():
+    """
+    Cuerpo y content type de /metrics. Con varios workers (gunicorn) cada
+    proceso escribe sus métricas en PROMETHEUS_MULTIPROC_DIR y aquí se suman
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class MessageCreate(BaseModel):
     """Modelo para crear un nuevo mensaje"""
@@ -19,6 +19,12 @@ class MessageResponse(BaseModel):
     tema: Optional[str] = None
     resumen: Optional[str] = None
     message_sid: Optional[str] = None
+    estado_analisis: Optional[str] = None
+
+class MessagePage(BaseModel):
+    """Página de mensajes con cursor para la siguiente"""
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
 
 class SentimentStats(BaseModel):
     """Estadísticas de sentimientos"""
@@ -32,8 +38,53 @@ class ThemeStats(BaseModel):
     tema: str
     count: int
 
+class TrendPoint(BaseModel):
+    """Conteo de sentimientos en un bucket de tiempo"""
+    inicio: datetime
+    positivo: int = 0
+    negativo: int = 0
+    neutro: int = 0
+    total: int = 0
+
 class AIAnalysis(BaseModel):
     """Resultado del análisis de IA"""
     sentimiento: str = Field(..., pattern="^(positivo|negativo|neutro)$")
     tema: str = Field(..., pattern="^(Servicio al Cliente|Calidad del Producto|Precio|Limpieza|Otro)$")
     resumen: str
+
+class ReanalysisRequest(BaseModel):
+    """Selección y opciones de un reanálisis masivo"""
+    job_id: Optional[str] = None
+    version_obsoleta: bool = False
+    campos_faltantes: bool = False
+    estados: List[str] = Field(default_factory=list)
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    sentimiento: Optional[str] = None
+    tema: Optional[str] = None
+    chunk_size: Optional[int] = Field(None, gt=0)
+    concurrency: Optional[int] = Field(None, gt=0)
+    limit: int = Field(0, ge=0)
+    dry_run: bool = False
+
+    def filters(self) -> dict:
+        return self.model_dump(include={
+            "version_obsoleta", "campos_faltantes", "estados", "desde", "hasta", "sentimiento", "tema"
+        })
+
+class SenderSummary(BaseModel):
+    """Resumen de un remitente: volumen, mezcla de sentimientos y contacto"""
+    numero_remitente: str
+    total: int = 0
+    positivo: int = 0
+    negativo: int = 0
+    neutro: int = 0
+    primer_contacto: Optional[datetime] = None
+    ultimo_contacto: Optional[datetime] = None
+    negativos_recientes: Optional[int] = None
+
+class SearchResult(BaseModel):
+    """Página de resultados de búsqueda con conteos por sentimiento y tema"""
+    items: List[MessageResponse]
+    total: int
+    facets: Dict[str, Dict[str, int]]
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRateLimiter:
+    """
+    Token bucket compartido entre procesos y réplicas, guardado en MongoDB.
+    Un documento por limitador con dos cubos: peticiones (RPM) y tokens de
+    OpenAI (TPM). Cada toma es una actualización condicionada a la versión
+    leída (compare-and-set), así dos procesos nunca gastan el mismo saldo.
+    Con los dos límites en 0 no se consulta MongoDB.
+    """
+
+    def __init__(self, collection=None, name: str = "openai", requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.collection = collection
+        self.name = name
+        self.requests_per_minute = requests_per_minute if requests_per_minute is not None else float(os.getenv("OPENAI_RATE_LIMIT_RPM", "0"))
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else float(os.getenv("OPENAI_RATE_LIMIT_TPM", "0"))
+        self.max_wait = float(os.getenv("OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS", "60"))
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self.conflicts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.collection is not None and (self.requests_per_minute > 0 or self.tokens_per_minute > 0)
+
+    @staticmethod
+    def _refill(level: float, capacity: float, per_minute: float, elapsed: float) -> float:
+        return min(capacity, level + elapsed * per_minute / 60)
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Esperar hasta poder hacer una petición de ~`tokens` tokens. Lanza
+        TimeoutError si la espera supera OPENAI_RATE_LIMIT_MAX_WAIT_SECONDS.
+        """
+        if not self.enabled:
+            return
+
+        deadline = time.monotonic() + self.max_wait
+        with stage("rate_limit_wait"):
+            while True:
+                wait = await self._try_take(tokens)
+                if wait <= 0:
+                    return
+                if time.monotonic() + wait > deadline:
+                    raise TimeoutError(f"Límite de OpenAI: no hay cupo en {self.max_wait:g}s")
+                self.waits += 1
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+
+    async def try_acquire(self, tokens: int = 0) -> bool:
+        """Tomar cupo solo si lo hay ahora mismo, sin esperar"""
+        if not self.enabled:
+            return True
+        return await self._try_take(tokens) <= 0
+
+    async def _try_take(self, tokens: int) -> float:
+        """Intentar descontar del cubo. Devuelve 0 si se tomó o los segundos a esperar"""
+        # Capacidad = un minuto de cupo; la petición de tokens se recorta a la
+        # capacidad para que una petición grande no quede bloqueada para siempre
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute > 0 else 0
+
+        for _ in range(10):
+            now = datetime.utcnow()
+            doc = await self.collection.find_one({"_id": self.name})
+            if doc is None:
+                doc = {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute, "updated_at": now, "seq": 0}
+                try:
+                    await self.collection.insert_one({"_id": self.name, **doc})
+                except DuplicateKeyError:
+                    continue
+
+            elapsed = max(0.0, (now - doc["updated_at"]).total_seconds())
+            requests = self._refill(doc["requests"], self.requests_per_minute, self.requests_per_minute, elapsed)
+            available_tokens = self._refill(doc["tokens"], self.tokens_per_minute, self.tokens_per_minute, elapsed)
+
+            wait = 0.0
+            if self.requests_per_minute > 0 and requests < 1:
+                wait = max(wait, (1 - requests) * 60 / self.requests_per_minute)
+            if tokens and available_tokens < tokens:
+                wait = max(wait, (tokens - available_tokens) * 60 / self.tokens_per_minute)
+            if wait > 0:
+                return wait
+
+            result = await self.collection.update_one(
+                {"_id": self.name, "seq": doc["seq"]},
+                {"$set": {
+                    "requests": requests - 1 if self.requests_per_minute > 0 else requests,
+                    "tokens": available_tokens - tokens,
+                    "updated_at": now,
+                    "seq": doc["seq"] + 1
+                }}
+            )
+            if result.modified_count:
+                return 0.0
+            self.conflicts += 1
+
+        # Mucha contención: reintentar tras una pausa corta
+        return 0.05
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "waits": self.waits,
+            "waited_seconds": round(self.waited_seconds, 2),
+            "conflicts": self.conflicts
+        }
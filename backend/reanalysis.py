@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# tiktoken es opcional: sin él se estima ~4 caracteres por token
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+REANALYSIS_PROJECTION = {"texto_mensaje": 1, "sentimiento": 1, "tema": 1, "timestamp": 1, "numero_remitente": 1}
+
+# Tokens de respuesta por mensaje (sentimiento, tema y resumen de ~100 caracteres)
+_COMPLETION_TOKENS_PER_MESSAGE = 60
+
+
+def build_query(filters: Dict, current_version: str) -> Dict:
+    """
+    Filtro de MongoDB para un reanálisis. Criterios de selección (se unen
+    con OR; sin ninguno se reanaliza todo lo que cumpla el rango):
+      version_obsoleta  versión de análisis distinta de la actual
+      campos_faltantes  sin sentimiento, tema o resumen
+      estados           estado_analisis en la lista (p. ej. pendiente, fallido)
+    Restricciones (AND): desde, hasta, sentimiento, tema
+    """
+    selectors = []
+    if filters.get("version_obsoleta"):
+        selectors.append({"version_analisis": {"$ne": current_version}})
+    if filters.get("campos_faltantes"):
+        selectors.extend({field: {"$in": [None, ""]}} for field in ("sentimiento", "tema", "resumen"))
+    if filters.get("estados"):
+        selectors.append({"estado_analisis": {"$in": list(filters["estados"])}})
+
+    conditions = []
+    if selectors:
+        conditions.append({"$or": selectors})
+    if filters.get("desde") or filters.get("hasta"):
+        timestamp = {}
+        if filters.get("desde"):
+            timestamp["$gte"] = filters["desde"]
+        if filters.get("hasta"):
+            timestamp["$lt"] = filters["hasta"]
+        conditions.append({"timestamp": timestamp})
+    for field in ("sentimiento", "tema"):
+        if filters.get(field):
+            conditions.append({field: filters[field]})
+
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class TokenCounter:
+    """Contar tokens como el modelo (tiktoken) o aproximar por caracteres"""
+
+    def __init__(self, model: str):
+        self.encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return max(1, len(text) // 4)
+
+
+class ReanalysisJob:
+    """
+    Reanálisis masivo y reanudable. Recorre los mensajes seleccionados en
+    orden de _id, los analiza en lotes de OPENAI_BATCH_SIZE con concurrencia
+    acotada y guarda cada bloque con un bulk_write. El checkpoint (último
+    _id, contadores, ETA) vive en la colección de reanálisis; relanzar con
+    el mismo job_id continúa donde se quedó.
+    """
+
+    def __init__(
+        self,
+        database,
+        ai_analyzer,
+        job_id: Optional[str] = None,
+        filters: Optional[Dict] = None,
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        limit: int = 0
+    ):
+        self.database = database
+        self.ai_analyzer = ai_analyzer
+        self.job_id = job_id or f"reanalysis_{datetime.utcnow():%Y%m%d%H%M%S}"
+        self.filters = filters or {}
+        self.chunk_size = chunk_size or int(os.getenv("REANALYSIS_CHUNK_SIZE", "200"))
+        self.concurrency = concurrency or int(os.getenv("REANALYSIS_CONCURRENCY", "4"))
+        self.batch_size = int(os.getenv("OPENAI_BATCH_SIZE", "10"))
+        self.limit = limit
+
+    def query(self) -> Dict:
+        return build_query(self.filters, self.ai_analyzer.version)
+
+    async def estimate(self) -> Dict:
+        """
+        Dry run: cuántos mensajes se reanalizarían y cuántos tokens/USD
+        costaría como máximo (sin contar aciertos de caché ni el modelo local)
+        """
+        counter = TokenCounter(self.ai_analyzer.model)
+        system_tokens = counter.count(self.ai_analyzer.batch_system_prompt)
+        messages = 0
+        prompt_tokens = 0
+        cursor = self.database.collection.find(self.query(), {"texto_mensaje": 1}).batch_size(5000)
+        if self.limit:
+            cursor = cursor.limit(self.limit)
+        async for doc in cursor:
+            messages += 1
+            item = json.dumps({"indice": self.batch_size, "mensaje": doc.get("texto_mensaje", "")}, ensure_ascii=False)
+            prompt_tokens += counter.count(item)
+
+        calls = -(-messages // self.batch_size)
+        prompt_tokens += calls * system_tokens
+        completion_tokens = messages * _COMPLETION_TOKENS_PER_MESSAGE
+        input_price = float(os.getenv("OPENAI_PRICE_INPUT_PER_MTOK", "0.15"))
+        output_price = float(os.getenv("OPENAI_PRICE_OUTPUT_PER_MTOK", "0.60"))
+        return {
+            "job_id": self.job_id,
+            "messages": messages,
+            "openai_calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "token_count": "tiktoken" if counter.exact else "aproximado",
+            "estimated_cost_usd": round((prompt_tokens * input_price + completion_tokens * output_price) / 1e6, 4),
+            "version": self.ai_analyzer.version
+        }
+
+    async def run(self) -> Dict:
+        """Ejecutar (o reanudar) el reanálisis. Devuelve el checkpoint final"""
+        jobs = self.database.reanalysis
+        state = await jobs.find_one({"_id": self.job_id})
+        if state and state.get("status") == "completed":
+            logger.info(f"Reanálisis {self.job_id} ya completado")
+            return state
+        if state:
+            # Al reanudar se mantienen los filtros originales
+            self.filters = state.get("filters", self.filters)
+
+        query = self.query()
+        total = await self.database.collection.count_documents(query)
+        if self.limit:
+            total = min(total, self.limit)
+        await jobs.update_one(
+            {"_id": self.job_id},
+            {
+                "$set": {"status": "running", "total": total, "version": self.ai_analyzer.version, "updated_at": datetime.utcnow()},
+                "$setOnInsert": {
+                    "filters": self.filters,
+                    "last_id": None,
+                    "processed": 0,
+                    "updated": 0,
+                    "created_at": datetime.utcnow()
+                }
+            },
+            upsert=True
+        )
+        state = await jobs.find_one({"_id": self.job_id})
+        if state["last_id"] is not None:
+            query = {"$and": [query, {"_id": {"$gt": state["last_id"]}}]}
+            logger.info(f"Reanudando reanálisis {self.job_id} tras {state['processed']} mensajes")
+
+        started = time.monotonic()
+        processed_now = 0
+        try:
+            cursor = self.database.collection.find(query, REANALYSIS_PROJECTION).sort("_id", 1).batch_size(self.chunk_size)
+            chunk: List[Dict] = []
+            async for doc in cursor:
+                if self.limit and state["processed"] + processed_now + len(chunk) >= self.limit:
+                    break
+                chunk.append(doc)
+                if len(chunk) >= self.chunk_size:
+                    processed_now += await self._process_chunk(chunk)
+                    chunk = []
+                    await self._checkpoint(started, processed_now, total)
+            if chunk:
+                processed_now += await self._process_chunk(chunk)
+                await self._checkpoint(started, processed_now, total)
+
+            state = await jobs.find_one_and_update(
+                {"_id": self.job_id},
+                {"$set": {"status": "completed", "eta_seconds": 0, "updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
+            )
+            self.database._notify("resync", {"reason": "reanalysis"})
+            logger.info(f"Reanálisis {self.job_id} completado: {state['processed']} mensajes, {state['updated']} actualizados")
+            return state
+
+        except Exception as e:
+            await jobs.update_one(
+                {"_id": self.job_id},
+                {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.utcnow()}}
+            )
+            logger.error(f"Error en el reanálisis {self.job_id}: {e}")
+            raise
+
+    async def _process_chunk(self, chunk: List[Dict]) -> int:
+        ids = [doc["_id"] for doc in chunk]
+
+        # Los mensajes que un worker está analizando ahora se dejan para él
+        busy = {
+            job["message_id"]
+            async for job in self.database.jobs.collection.find(
+                {"message_id": {"$in": ids}, "status": "processing"}, {"message_id": 1}
+            )
+        }
+        docs = [doc for doc in chunk if doc["_id"] not in busy]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def analyze(batch: List[Dict]) -> List[Dict]:
+            async with semaphore:
+                return await self.ai_analyzer.analyze_batch([doc.get("texto_mensaje", "") for doc in batch])
+
+        batches = [docs[i:i + self.batch_size] for i in range(0, len(docs), self.batch_size)]
+        results = await asyncio.gather(*(analyze(batch) for batch in batches))
+
+        # Un análisis básico (fallo de OpenAI o circuito abierto) no sustituye
+        # la etiqueta existente. El bloque se guarda hasta el primer mensaje
+        # sin análisis nuevo y el checkpoint se queda ahí: al reanudar se
+        # repite desde ese mensaje (los siguientes salen de la caché)
+        analyses_by_id = {
+            doc["_id"]: analysis
+            for batch, analyses in zip(batches, results)
+            for doc, analysis in zip(batch, analyses)
+        }
+        failed = [
+            doc_id for doc_id, analysis in analyses_by_id.items()
+            if analysis.get("error") or analysis.get("analysis_source") == "fallback"
+        ]
+        done = len(chunk)
+        if failed:
+            failed_ids = set(failed)
+            done = next(i for i, doc in enumerate(chunk) if doc["_id"] in failed_ids)
+        updates = [(doc, analyses_by_id[doc["_id"]]) for doc in chunk[:done] if doc["_id"] in analyses_by_id]
+        updated = await self.database.apply_analysis_bulk(updates)
+
+        # Solo los mensajes con un análisis nuevo salen de la cola de trabajos
+        if updates:
+            await self.database.jobs.collection.delete_many(
+                {"message_id": {"$in": [doc["_id"] for doc, _ in updates]}, "status": {"$in": ["pending", "failed"]}}
+            )
+
+        skipped_busy = sum(1 for doc in chunk[:done] if doc["_id"] in busy)
+        checkpoint = {"$inc": {"processed": done, "updated": updated, "skipped_busy": skipped_busy, "failed_analysis": len(failed)}}
+        if done:
+            checkpoint["$set"] = {"last_id": chunk[done - 1]["_id"]}
+        await self.database.reanalysis.update_one({"_id": self.job_id}, checkpoint)
+
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} mensajes sin análisis de IA (OpenAI no disponible); "
+                f"relanzar con el mismo job_id para continuar"
+            )
+        return done
+
+    async def _checkpoint(self, started: float, processed_now: int, total: int):
+        """Guardar velocidad y ETA en el checkpoint"""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rate = processed_now / elapsed
+        state = await self.database.reanalysis.find_one({"_id": self.job_id}, {"processed": 1})
+        remaining = max(total - state["processed"], 0)
+        eta = round(remaining / rate, 1) if rate else None
+        await self.database.reanalysis.update_one(
+            {"_id": self.job_id},
+            {"$set": {"messages_per_second": round(rate, 2), "eta_seconds": eta, "updated_at": datetime.utcnow()}}
+        )
+        logger.info(f"Reanálisis {self.job_id}: {state['processed']}/{total} mensajes ({rate:.1f} msg/s, ETA {eta}s)")
@@ -0,0 +1,68 @@
+import os
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class CachedResponse:
+    """Cuerpo JSON ya serializado de una respuesta, con su ETag"""
+
+    __slots__ = ("version", "body", "etag", "headers")
+
+    def __init__(self, version: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.headers = headers or {}
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Comparar contra If-None-Match (lista de ETags, '*' o W/ débiles)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return self.etag in candidates
+
+
+class ResponseCache:
+    """
+    Caché en memoria de respuestas de lectura del dashboard, indexada por
+    ruta + query. Cada entrada guarda la versión de datos con la que se
+    generó; cuando el write path incrementa la versión las entradas quedan
+    obsoletas y se regeneran en la siguiente lectura.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: str, version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, version: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = CachedResponse(version, body, headers)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
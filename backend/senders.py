@@ -0,0 +1,167 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SENTIMENTS = ("positivo", "negativo", "neutro")
+
+# Orden de /api/senders -> campo del resumen (cada uno con su índice compuesto)
+SORT_FIELDS = {
+    "total": "total",
+    "ultimo_contacto": "ultimo_contacto",
+    "negativos": "sentimientos.negativo"
+}
+
+
+class SenderSummaries:
+    """
+    Resumen por remitente (un documento por número): mensajes recibidos,
+    primer y último contacto y mezcla de sentimientos. Se mantiene con $inc
+    desde el write path, así las vistas por cliente no recorren los mensajes
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+
+    async def create_indexes(self):
+        """Índices compuestos para los top-K ordenados (desempate por _id)"""
+        for field in SORT_FIELDS.values():
+            await self.collection.create_index([(field, -1), ("_id", 1)])
+
+    @staticmethod
+    def messages_delta(messages: List[Dict]) -> Dict[str, Dict]:
+        """Agregar mensajes nuevos por remitente: cantidad y rango de fechas"""
+        delta: Dict[str, Dict] = {}
+        for message in messages:
+            sender = message.get("numero_remitente")
+            timestamp = message.get("timestamp")
+            if not sender or not isinstance(timestamp, datetime):
+                continue
+            entry = delta.setdefault(sender, {"total": 0, "primer_contacto": timestamp, "ultimo_contacto": timestamp})
+            entry["total"] += 1
+            entry["primer_contacto"] = min(entry["primer_contacto"], timestamp)
+            entry["ultimo_contacto"] = max(entry["ultimo_contacto"], timestamp)
+        return delta
+
+    async def record_messages(self, messages: List[Dict]):
+        """Contar mensajes nuevos con un upsert por remitente"""
+        operations = [
+            UpdateOne(
+                {"_id": sender},
+                {
+                    "$inc": {"total": entry["total"]},
+                    "$min": {"primer_contacto": entry["primer_contacto"]},
+                    "$max": {"ultimo_contacto": entry["ultimo_contacto"]}
+                },
+                upsert=True
+            )
+            for sender, entry in self.messages_delta(messages).items()
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def analysis_delta(previous: Dict, current: Dict) -> Counter:
+        """Cambios (remitente, sentimiento) al reemplazar el análisis de un mensaje"""
+        delta = Counter()
+        sender = previous.get("numero_remitente")
+        old_sentiment, new_sentiment = previous.get("sentimiento"), current.get("sentimiento")
+        if not sender or old_sentiment == new_sentiment:
+            return delta
+        if old_sentiment in SENTIMENTS:
+            delta[(sender, old_sentiment)] -= 1
+        if new_sentiment in SENTIMENTS:
+            delta[(sender, new_sentiment)] += 1
+        return delta
+
+    async def apply_delta(self, delta: Counter):
+        """Aplicar los cambios de sentimiento con un $inc por remitente"""
+        increments: Dict[str, Dict[str, int]] = {}
+        for (sender, sentiment), count in delta.items():
+            if count:
+                increments.setdefault(sender, {})[f"sentimientos.{sentiment}"] = count
+        if not increments:
+            return
+
+        operations = [UpdateOne({"_id": sender}, {"$inc": inc}, upsert=True) for sender, inc in increments.items()]
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def top(self, sort: str = "total", limit: int = 50) -> List[Dict]:
+        """Top-K de remitentes según `sort` (servido por su índice compuesto)"""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Orden no soportado: {sort}")
+        cursor = self.collection.find({}).sort([(SORT_FIELDS[sort], -1), ("_id", 1)]).limit(limit)
+        return [doc async for doc in cursor]
+
+    async def get(self, senders: List[str]) -> Dict[str, Dict]:
+        """Resúmenes de varios remitentes por número"""
+        return {doc["_id"]: doc async for doc in self.collection.find({"_id": {"$in": senders}})}
+
+    async def rebuild(self, messages_collection, archived: Optional[AsyncIterable[Dict]] = None, chunk_size: int = 5000):
+        """
+        Reconstruir los resúmenes con una agregación en el servidor ($out
+        reemplaza la colección de una vez y conserva sus índices). Los
+        mensajes `archived` (archivo frío) se suman después por bloques
+        """
+        sentiment_counts = {
+            sentiment: {"$sum": {"$cond": [{"$eq": ["$sentimiento", sentiment]}, 1, 0]}}
+            for sentiment in SENTIMENTS
+        }
+        pipeline = [
+            {"$match": {"numero_remitente": {"$type": "string", "$gt": ""}}},
+            {"$group": {
+                "_id": "$numero_remitente",
+                "total": {"$sum": 1},
+                "primer_contacto": {"$min": "$timestamp"},
+                "ultimo_contacto": {"$max": "$timestamp"},
+                **sentiment_counts
+            }},
+            {"$project": {
+                "total": 1,
+                "primer_contacto": 1,
+                "ultimo_contacto": 1,
+                "sentimientos": {sentiment: f"${sentiment}" for sentiment in SENTIMENTS}
+            }},
+            {"$out": self.collection.name}
+        ]
+        async for _ in messages_collection.aggregate(pipeline, allowDiskUse=True):
+            pass
+
+        if archived is not None:
+            chunk: List[Dict] = []
+            async for doc in archived:
+                chunk.append(doc)
+                if len(chunk) >= chunk_size:
+                    await self._record_archived(chunk)
+                    chunk = []
+            await self._record_archived(chunk)
+        count = await self.collection.count_documents({})
+        logger.info(f"Resúmenes por remitente reconstruidos: {count} remitentes")
+        return count
+
+    async def _record_archived(self, messages: List[Dict]):
+        if not messages:
+            return
+        await self.record_messages(messages)
+        await self.apply_delta(Counter(
+            (message["numero_remitente"], message["sentimiento"])
+            for message in messages
+            if message.get("numero_remitente") and message.get("sentimiento") in SENTIMENTS
+        ))
+
+    @staticmethod
+    def to_summary(doc: Dict, negativos_recientes: Optional[int] = None) -> Dict:
+        """Documento de resumen -> campos de SenderSummary"""
+        sentiments = doc.get("sentimientos", {})
+        return {
+            "numero_remitente": doc["_id"],
+            "total": doc.get("total", 0),
+            **{sentiment: sentiments.get(sentiment, 0) for sentiment in SENTIMENTS},
+            "primer_contacto": doc.get("primer_contacto"),
+            "ultimo_contacto": doc.get("ultimo_contacto"),
+            "negativos_recientes": negativos_recientes
+        }
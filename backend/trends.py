@@ -0,0 +1,210 @@
+import os
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day", "week")
+# Por remitente no hay rollups por hora: serían casi un documento por mensaje
+SENDER_GRANULARITIES = ("day", "week")
+SENTIMENTS = ("positivo", "negativo", "neutro")
+
+# (granularidad, inicio, sentimiento, tema, numero_remitente)
+RollupKey = Tuple[str, datetime, str, str, Optional[str]]
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Inicio del bucket (hora, día o semana desde el lunes) de un timestamp"""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Granularidad no soportada: {granularity}")
+
+
+class TrendRollups:
+    """
+    Rollups pre-agregados por bucket × sentimiento × tema, globales
+    (numero_remitente = None, por hora, día y semana) y por remitente (por
+    día y semana), mantenidos incrementalmente
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.backfill_chunk_size = int(os.getenv("TRENDS_BACKFILL_CHUNK_SIZE", "5000"))
+
+    async def create_indexes(self):
+        """Un documento por combinación; el índice también sirve las consultas por rango"""
+        await self.collection.create_index(
+            [("granularidad", 1), ("numero_remitente", 1), ("inicio", 1), ("tema", 1), ("sentimiento", 1)],
+            unique=True
+        )
+        # Conteos recientes de un sentimiento por remitente (/api/senders)
+        await self.collection.create_index([("granularidad", 1), ("sentimiento", 1), ("inicio", 1)])
+
+    @staticmethod
+    def keys_for(doc: Dict) -> List[RollupKey]:
+        """Claves de rollup a las que contribuye un mensaje analizado"""
+        sentiment = doc.get("sentimiento")
+        timestamp = doc.get("timestamp")
+        if not sentiment or not isinstance(timestamp, datetime):
+            return []
+
+        theme = doc.get("tema") or "Sin clasificar"
+        keys = []
+        for granularity in GRANULARITIES:
+            start = bucket_start(timestamp, granularity)
+            keys.append((granularity, start, sentiment, theme, None))
+            if doc.get("numero_remitente") and granularity in SENDER_GRANULARITIES:
+                keys.append((granularity, start, sentiment, theme, doc["numero_remitente"]))
+        return keys
+
+    @classmethod
+    def analysis_delta(cls, previous: Dict, current: Dict) -> Counter:
+        """Cambios en los rollups al reemplazar el análisis de un mensaje"""
+        delta = Counter()
+        for key in cls.keys_for(previous):
+            delta[key] -= 1
+        for key in cls.keys_for({**previous, **current}):
+            delta[key] += 1
+        return delta
+
+    async def apply_delta(self, delta: Counter):
+        """Aplicar los incrementos con un bulk_write desordenado de upserts"""
+        operations = [
+            UpdateOne(
+                {
+                    "granularidad": granularity,
+                    "numero_remitente": sender,
+                    "inicio": start,
+                    "tema": theme,
+                    "sentimiento": sentiment
+                },
+                {"$inc": {"count": count}},
+                upsert=True
+            )
+            for (granularity, start, sentiment, theme, sender), count in delta.items()
+            if count
+        ]
+        if not operations:
+            return
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Dos upserts simultáneos sobre la misma clave: reintentar solo esos
+            retry = [operations[error["index"]] for error in e.details.get("writeErrors", []) if error.get("code") == 11000]
+            if len(retry) != len(e.details.get("writeErrors", [])):
+                raise
+            await self.collection.bulk_write(retry, ordered=False)
+
+    async def query(
+        self,
+        start: datetime,
+        end: datetime,
+        granularity: str = "day",
+        tema: Optional[str] = None,
+        numero_remitente: Optional[str] = None
+    ) -> List[Dict]:
+        """Serie temporal de sentimientos por bucket dentro de [start, end)"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity}")
+        if numero_remitente and granularity not in SENDER_GRANULARITIES:
+            raise ValueError(f"Las tendencias por remitente solo están por {' o '.join(SENDER_GRANULARITIES)}")
+
+        query = {
+            "granularidad": granularity,
+            "numero_remitente": numero_remitente,
+            "inicio": {"$gte": bucket_start(start, granularity), "$lt": end}
+        }
+        if tema:
+            query["tema"] = tema
+
+        buckets: Dict[datetime, Dict] = {}
+        projection = {"_id": 0, "inicio": 1, "sentimiento": 1, "count": 1}
+        async for doc in self.collection.find(query, projection):
+            bucket = buckets.setdefault(doc["inicio"], {"inicio": doc["inicio"], **{s: 0 for s in SENTIMENTS}, "total": 0})
+            if doc["sentimiento"] in SENTIMENTS:
+                bucket[doc["sentimiento"]] += doc["count"]
+                bucket["total"] += doc["count"]
+
+        return [buckets[key] for key in sorted(buckets)]
+
+    async def sentiment_by_sender(
+        self,
+        sentiment: str,
+        since: datetime,
+        min_count: int = 1,
+        limit: int = 50,
+        senders: Optional[List[str]] = None
+    ) -> List[Tuple[str, int]]:
+        """
+        Remitentes con al menos `min_count` mensajes de un sentimiento desde
+        `since`, sumando los rollups diarios (el día de `since` cuenta entero)
+        """
+        match = {
+            "granularidad": "day",
+            "sentimiento": sentiment,
+            "inicio": {"$gte": bucket_start(since, "day")},
+            "numero_remitente": {"$in": senders} if senders is not None else {"$ne": None}
+        }
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$numero_remitente", "count": {"$sum": "$count"}}},
+            {"$match": {"count": {"$gte": min_count}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": limit}
+        ]
+        return [(doc["_id"], doc["count"]) async for doc in self.collection.aggregate(pipeline)]
+
+    async def prune_sender_hourly(self) -> int:
+        """Borrar los rollups por hora y remitente que se mantenían antes"""
+        result = await self.collection.delete_many({"granularidad": "hour", "numero_remitente": {"$ne": None}})
+        if result.deleted_count:
+            logger.info(f"Borrados {result.deleted_count} rollups por hora y remitente")
+        return result.deleted_count
+
+    async def backfill(self, messages_collection, chunk_size: Optional[int] = None, archived=None) -> int:
+        """
+        Reconstruir los rollups desde la colección de mensajes (y los mensajes
+        `archived` del archivo frío, si se pasan) en bloques de tamaño
+        acotado: cada bloque se agrega en memoria y se vuelca con $inc
+        """
+        chunk_size = chunk_size or self.backfill_chunk_size
+        await self.collection.delete_many({})
+
+        projection = {"timestamp": 1, "sentimiento": 1, "tema": 1, "numero_remitente": 1}
+        cursor = messages_collection.find(
+            {"sentimiento": {"$in": list(SENTIMENTS)}}, projection
+        ).sort("_id", 1).batch_size(chunk_size)
+
+        async def documents():
+            async for doc in cursor:
+                yield doc
+            if archived is not None:
+                async for doc in archived:
+                    if doc.get("sentimiento") in SENTIMENTS:
+                        yield doc
+
+        processed = 0
+        delta = Counter()
+        async for doc in documents():
+            for key in self.keys_for(doc):
+                delta[key] += 1
+            processed += 1
+            if processed % chunk_size == 0:
+                await self.apply_delta(delta)
+                delta = Counter()
+                logger.info(f"Rollups de tendencias: {processed} mensajes procesados")
+
+        await self.apply_delta(delta)
+        logger.info(f"Rollups de tendencias reconstruidos desde {processed} mensajes")
+        return processed
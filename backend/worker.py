@@ -0,0 +1,210 @@
+import os
+import logging
+import asyncio
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+from coalescer import ConversationCoalescer
+from metrics import ANALYSIS_JOBS, ANALYSIS_WINDOW_MESSAGES, in_flight, stage
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisWorkerPool:
+    """Pool de workers async que consume la cola de análisis con concurrencia acotada"""
+
+    def __init__(self, database, batcher, concurrency: Optional[int] = None):
+        self.database = database
+        self.batcher = batcher
+        self.concurrency = concurrency or int(os.getenv("ANALYSIS_WORKERS", "4"))
+        self.poll_interval = float(os.getenv("ANALYSIS_POLL_SECONDS", "1"))
+        # Cada worker toma hasta un lote completo del MicroBatcher y lo envía
+        # de una vez: con un trabajo por worker los lotes no pasarían de
+        # ANALYSIS_WORKERS mensajes y siempre esperarían el flush por tiempo
+        self.claim_size = getattr(batcher, "max_batch_size", 1)
+        self._tasks: List[asyncio.Task] = []
+
+        # Modo opcional: agrupar los mensajes seguidos de un remitente y
+        # analizarlos como un solo turno. La ventana (y su silencio) debe
+        # cerrarse antes de que expire el bloqueo de los trabajos que retiene
+        self.coalescer = ConversationCoalescer(self._process_conversation)
+        lock_limit = database.jobs.lock_seconds / 2
+        self.coalescer.max_window_seconds = min(self.coalescer.max_window_seconds, lock_limit)
+        self.coalescer.quiet_seconds = min(self.coalescer.quiet_seconds, lock_limit)
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.deferred = 0
+
+    def start(self):
+        """Arrancar los workers en el loop actual"""
+        self._stopping = False
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._run(i)))
+        logger.info(f"Pool de análisis iniciado con {self.concurrency} workers")
+
+    async def stop(self):
+        """Detener los workers esperando a que terminen el trabajo en curso"""
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.coalescer.flush_all()
+        logger.info("Pool de análisis detenido")
+
+    def notify(self):
+        """Despertar a los workers cuando se encola un trabajo en este proceso"""
+        self._wakeup.set()
+
+    async def _run(self, worker_id: int):
+        while not self._stopping:
+            jobs = await self._claim_jobs(worker_id)
+            if not jobs:
+                await self._wait_for_work()
+                continue
+
+            await asyncio.gather(*(self._process(job) for job in jobs))
+
+    async def _claim_jobs(self, worker_id: int) -> List[Dict]:
+        """Tomar hasta claim_size trabajos sin esperar a que lleguen más"""
+        jobs: List[Dict] = []
+        while len(jobs) < self.claim_size:
+            try:
+                job = await self.database.jobs.claim()
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: error al obtener trabajo: {e}")
+                break
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    async def _wait_for_work(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _process(self, job):
+        if self.coalescer.enabled:
+            await self.coalescer.add(job)
+            return
+        with in_flight("analysis_job"):
+            await self._process_job(job)
+
+    def _attempts_left(self, jobs: List[Dict]) -> bool:
+        return max(job.get("attempts", 1) for job in jobs) < self.database.jobs.max_attempts
+
+    def _check_analysis(self, analysis: Dict, jobs: List[Dict]):
+        """
+        Un análisis básico por fallo de OpenAI no se guarda mientras queden
+        intentos: se lanza el error para que la cola reintente con backoff. En
+        el último intento se guarda el básico antes que dejar el mensaje sin
+        análisis. Con el circuito abierto el básico se guarda ya (_finish)
+        """
+        error = analysis.get("error")
+        if error and not analysis.get("circuit_open") and self._attempts_left(jobs):
+            raise RuntimeError(f"OpenAI no disponible: {error}")
+
+    async def _finish(self, jobs: List[Dict], analysis: Dict):
+        """
+        Cerrar los trabajos con el análisis ya guardado. Si es el básico por
+        circuito abierto, se reprograman (mientras queden intentos) para
+        cuando el circuito vuelva a admitir llamadas y mejorarlo con OpenAI
+        """
+        if analysis.get("circuit_open") and self._attempts_left(jobs):
+            for job in jobs:
+                await self.database.jobs.fail(job, analysis["error"], delay=analysis.get("retry_after"))
+            self.deferred += len(jobs)
+            ANALYSIS_JOBS.labels("deferred").inc(len(jobs))
+            return
+        await self.database.jobs.complete_many(jobs)
+        ANALYSIS_JOBS.labels("completed").inc(len(jobs))
+
+    async def _process_job(self, job):
+        try:
+            with stage("analysis"):
+                analysis = await self.batcher.submit(job["texto_mensaje"])
+            self._check_analysis(analysis, [job])
+            with stage("update_analysis"):
+                await self.database.update_message_analysis(job["message_id"], analysis)
+            await self._finish([job], analysis)
+        except Exception as e:
+            logger.warning(f"Error analizando mensaje {job['message_id']} (intento {job.get('attempts')}): {e}")
+            await self._record_failure(job, e)
+
+    async def _process_conversation(self, jobs: List[Dict]):
+        """Analizar una ventana de mensajes de un remitente como un solo texto"""
+        ANALYSIS_WINDOW_MESSAGES.observe(len(jobs))
+        if len(jobs) == 1:
+            with in_flight("analysis_job"):
+                await self._process_job(jobs[0])
+            return
+
+        jobs = sorted(jobs, key=lambda job: job.get("timestamp") or job["created_at"])
+        with in_flight("analysis_job"):
+            try:
+                with stage("analysis"):
+                    analysis = await self.batcher.submit("\n".join(job["texto_mensaje"] for job in jobs))
+                self._check_analysis(analysis, jobs)
+                with stage("update_analysis"):
+                    await self.database.update_messages_analysis([job["message_id"] for job in jobs], analysis)
+                await self._finish(jobs, analysis)
+            except Exception as e:
+                logger.warning(f"Error analizando la conversación de {jobs[0].get('numero_remitente')} ({len(jobs)} mensajes): {e}")
+                for job in jobs:
+                    await self._record_failure(job, e)
+
+    async def _record_failure(self, job: Dict, error: Exception):
+        try:
+            will_retry = await self.database.jobs.fail(job, error)
+            ANALYSIS_JOBS.labels("retry" if will_retry else "failed").inc()
+            if not will_retry:
+                await self.database.mark_analysis_failed(job["message_id"])
+        except Exception as e:
+            logger.error(f"Error al registrar el fallo del trabajo {job['_id']}: {e}")
+
+
+async def main():
+    """Ejecutar los workers como proceso independiente: python -m worker"""
+    from database import Database
+    from ai_analyzer import AIAnalyzer, MicroBatcher
+    from local_model import LocalClassifier
+    from log_config import setup_logging
+    from prometheus_client import start_http_server
+
+    load_dotenv()
+    setup_logging()
+
+    # Los workers separados exponen sus métricas en su propio puerto
+    metrics_port = os.getenv("WORKER_METRICS_PORT")
+    if metrics_port:
+        start_http_server(int(metrics_port))
+    database = Database()
+    ai_analyzer = AIAnalyzer(
+        cache=database.analysis_cache,
+        local_model=LocalClassifier(),
+        rate_limiter=database.rate_limiter
+    )
+    await database.connect()
+    database.leader.start()
+    database.archive.start(database.leader)
+    await ai_analyzer.start()
+
+    batcher = MicroBatcher(ai_analyzer)
+    pool = AnalysisWorkerPool(database, batcher)
+    pool.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+        await batcher.close()
+        await ai_analyzer.close()
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
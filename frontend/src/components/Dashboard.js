@@ -7,8 +7,45 @@ import {
   fetchSentimentStats,
   fetchThemeStats,
   fetchMessages,
+  subscribeToStream,
 } from "../services/api";
 
+const SENTIMENT_KEYS = ["positivo", "negativo", "neutro"];
+const MAX_MESSAGES = 20;
+// Sin live feed: refresco cada 30 s. Con live feed conectado se refresca
+// igual cada pocos minutos, por si el servidor no publica todos los eventos
+// (p. ej. varios workers sin change streams); las respuestas llevan ETag
+const POLL_INTERVAL = Number(process.env.REACT_APP_REFRESH_INTERVAL) || 30000;
+const FALLBACK_REFRESH_INTERVAL =
+  Number(process.env.REACT_APP_FALLBACK_REFRESH_INTERVAL) || 180000;
+
+// Aplica cambios de contadores (relativos o absolutos) a las estadísticas
+const updateSentiments = (prev, changes, absolute) => {
+  if (!prev) return prev;
+  const next = { ...prev };
+  Object.entries(changes).forEach(([key, value]) => {
+    if (SENTIMENT_KEYS.includes(key)) {
+      next[key] = absolute ? value : (next[key] || 0) + value;
+    }
+  });
+  next.total = SENTIMENT_KEYS.reduce((sum, key) => sum + (next[key] || 0), 0);
+  return next;
+};
+
+const updateThemes = (prev, changes, absolute) => {
+  const counts = {};
+  prev.forEach(({ tema, count }) => {
+    counts[tema] = count;
+  });
+  Object.entries(changes).forEach(([tema, value]) => {
+    counts[tema] = absolute ? value : (counts[tema] || 0) + value;
+  });
+  return Object.entries(counts)
+    .filter(([, count]) => count > 0)
+    .map(([tema, count]) => ({ tema, count }))
+    .sort((a, b) => b.count - a.count);
+};
+
 const Dashboard = ({ refreshTrigger }) => {
   const [sentimentData, setSentimentData] = useState(null);
   const [themeData, setThemeData] = useState([]);
@@ -16,15 +53,15 @@ const Dashboard = ({ refreshTrigger }) => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  const loadData = async () => {
+  const loadData = async (showSpinner = true) => {
     try {
-      setLoading(true);
+      if (showSpinner) setLoading(true);
       setError(null);
 
       const [sentiments, themes, recentMessages] = await Promise.all([
         fetchSentimentStats(),
         fetchThemeStats(),
-        fetchMessages(20), // Últimos 20 mensajes
+        fetchMessages(MAX_MESSAGES), // Últimos 20 mensajes
       ]);
 
       setSentimentData(sentiments);
@@ -42,10 +79,61 @@ const Dashboard = ({ refreshTrigger }) => {
     loadData();
   }, [refreshTrigger]);
 
-  // Auto-refresh cada 30 segundos
+  // Live feed del servidor con un refresco lento de respaldo; si el live
+  // feed no está disponible, auto-refresh cada POLL_INTERVAL
   useEffect(() => {
-    const interval = setInterval(loadData, 30000);
-    return () => clearInterval(interval);
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(() => loadData(false), POLL_INTERVAL);
+    };
+    const fallback = setInterval(() => loadData(false), FALLBACK_REFRESH_INTERVAL);
+
+    const close = subscribeToStream({
+      // Solo un mensaje nuevo entra arriba del feed
+      onMessageCreated: (message) =>
+        setMessages((prev) => {
+          const exists = prev.some((m) => m.id === message.id);
+          const next = exists
+            ? prev.map((m) => (m.id === message.id ? message : m))
+            : [message, ...prev];
+          return next.slice(0, MAX_MESSAGES);
+        }),
+      // Un análisis (también reanálisis de mensajes antiguos) solo actualiza
+      // la fila si ya se está mostrando
+      onMessageAnalyzed: (message) =>
+        setMessages((prev) =>
+          prev.some((m) => m.id === message.id)
+            ? prev.map((m) => (m.id === message.id ? message : m))
+            : prev
+        ),
+      onStatsDelta: ({ sentimientos = {}, temas = {} }) => {
+        setSentimentData((prev) => updateSentiments(prev, sentimientos, false));
+        setThemeData((prev) => updateThemes(prev, temas, false));
+      },
+      onStats: (fields) => {
+        const sentimientos = {};
+        const temas = {};
+        Object.entries(fields).forEach(([path, value]) => {
+          const [group, key] = [path.split(".")[0], path.slice(path.indexOf(".") + 1)];
+          if (group === "sentimientos") sentimientos[key] = value;
+          if (group === "temas") temas[key] = value;
+        });
+        setSentimentData((prev) => updateSentiments(prev, sentimientos, true));
+        setThemeData((prev) => updateThemes(prev, temas, true));
+      },
+      onResync: () => loadData(false),
+      onError: (_error, closed) => {
+        if (closed) startPolling();
+      },
+    });
+
+    if (!close) startPolling();
+
+    return () => {
+      if (close) close();
+      if (interval) clearInterval(interval);
+      clearInterval(fallback);
+    };
   }, []);
 
   if (loading) {
@@ -64,7 +152,7 @@ const Dashboard = ({ refreshTrigger }) => {
           <strong>Error:</strong> {error}
         </div>
         <button
-          onClick={loadData}
+          onClick={() => loadData()}
           className="mt-2 bg-red-600 hover:bg-red-700 text-white px-4 py-2 rounded"
         >
           Reintentar
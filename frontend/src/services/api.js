@@ -108,6 +108,42 @@ export const sendTestMessage = async (message, sender) => {
   }
 };
 
+/**
+ * Suscribirse al live feed del servidor (Server-Sent Events).
+ * handlers: { onMessageCreated, onMessageAnalyzed, onStatsDelta, onStats, onResync, onError }
+ * Devuelve una función para cerrar la conexión, o null si el navegador
+ * no soporta EventSource.
+ */
+export const subscribeToStream = (handlers = {}) => {
+  if (typeof window === "undefined" || !window.EventSource) {
+    return null;
+  }
+
+  const source = new EventSource(`${API_BASE_URL}/api/stream`);
+  const parse = (event) => JSON.parse(event.data);
+  let hadError = false;
+
+  source.onopen = () => {
+    // Tras una reconexión pudimos perder eventos: resincronizar
+    if (hadError) {
+      hadError = false;
+      handlers.onResync?.();
+    }
+  };
+  source.onerror = (error) => {
+    hadError = true;
+    handlers.onError?.(error, source.readyState === EventSource.CLOSED);
+  };
+
+  source.addEventListener("message_created", (e) => handlers.onMessageCreated?.(parse(e)));
+  source.addEventListener("message_analyzed", (e) => handlers.onMessageAnalyzed?.(parse(e)));
+  source.addEventListener("stats_delta", (e) => handlers.onStatsDelta?.(parse(e)));
+  source.addEventListener("stats", (e) => handlers.onStats?.(parse(e)));
+  source.addEventListener("resync", () => handlers.onResync?.());
+
+  return () => source.close();
+};
+
 /**
  * Verificar estado del servidor
  */